@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""Замеры производительности горячих участков доски и компьютера.
+
+Примеры запуска:
+    ./benchmarks.py --output bench.json
+    ./benchmarks.py --baseline bench.json --threshold 0.1
+
+Каждый замер возвращает число операций в секунду (больше - лучше).
+Замеры перебора считают операцией узел и дополнительно сообщают
+оценённые листья в секунду. При сравнении с базовым файлом замеры,
+ставшие медленнее более чем на threshold, считаются регрессией, и
+программа завершается с кодом 1.
+"""
+
+from renju import const, engine
+from renju.board import Board
+from renju.search import AlphaBetaSearch
+from renju.stats import SearchStats
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+ERROR_REGRESSION = 1
+
+# Позиции для замеров перебора: последовательности ходов из партий
+# компьютера против компьютера.
+POSITIONS = [
+    [(6, 9), (11, 11), (11, 5), (7, 5), (7, 9), (9, 9)],
+    [(11, 11), (5, 5), (5, 7), (11, 6), (7, 7), (4, 6), (7, 5), (6, 6),
+     (7, 6), (7, 4), (6, 4), (7, 8)],
+    [(6, 9), (9, 6), (7, 9), (8, 10), (6, 10), (9, 9), (7, 11), (8, 8),
+     (7, 10), (7, 8), (8, 11), (5, 8), (7, 12), (7, 13), (9, 12), (10, 13),
+     (6, 8), (6, 11), (5, 9), (8, 12)],
+    [(6, 7), (5, 10), (8, 8), (6, 5), (8, 7), (5, 6), (5, 8), (7, 6), (4, 7),
+     (7, 7), (7, 8), (6, 8), (8, 6), (8, 5), (7, 5), (8, 10), (9, 7),
+     (10, 8), (9, 6), (10, 5), (4, 8), (6, 4), (5, 7), (6, 6), (3, 7),
+     (2, 7), (3, 6), (6, 3), (6, 2), (6, 9)],
+]
+
+# Замер: функция без аргументов, возвращающая число выполненных операций
+# и, возможно, дополнительные счётчики (например, листья перебора).
+Benchmark = Callable[[], Union[int, Tuple[int, Dict[str, int]]]]
+
+
+def make_board(moves: List[Tuple[int, int]]) -> Board:
+    """Возвращает доску после заданных ходов."""
+    board = Board()
+    for pos in moves:
+        board.do_move(pos)
+    return board
+
+
+def random_moves(rnd: random.Random, count: int) -> List[Tuple[int, int]]:
+    """Возвращает count различных случайных клеток поля."""
+    cells = [(row, column) for row in range(const.BOARD_SIZE[0])
+             for column in range(const.BOARD_SIZE[1])]
+    return rnd.sample(cells, count)
+
+
+def bench_do_undo(seed: int) -> Benchmark:
+    """Циклы do_move/undo_move на случайных клетках."""
+    moves = random_moves(random.Random(seed), 40)
+
+    def run() -> int:
+        board = Board()
+        for i in range(25):
+            for pos in moves:
+                board.do_move(pos)
+            for pos in moves:
+                board.undo_move()
+        return 25 * len(moves)
+    return run
+
+
+def bench_find_max_line(seed: int) -> Benchmark:
+    """find_max_line для всех занятых клеток позиций."""
+    boards = [make_board(moves) for moves in POSITIONS]
+
+    def run() -> int:
+        count = 0
+        for i in range(20):
+            for board in boards:
+                for pos in board.moves:
+                    board.find_max_line(pos)
+                    count += 1
+        return count
+    return run
+
+
+def bench_rate_function(evaluate: Callable[[Board], int],
+                        repeats: int) -> Callable[[int], Benchmark]:
+    """Оценка позиций функцией evaluate."""
+    def make(seed: int) -> Benchmark:
+        boards = [make_board(moves) for moves in POSITIONS]
+
+        def run() -> int:
+            for i in range(repeats):
+                for board in boards:
+                    evaluate(board)
+            return repeats * len(boards)
+        return run
+    return make
+
+
+def bench_minimax(seed: int) -> Benchmark:
+    """Узлы и листья в секунду minimax."""
+    boards = [make_board(moves) for moves in POSITIONS]
+
+    def run() -> Tuple[int, Dict[str, int]]:
+        stats = SearchStats()
+        for board in boards:
+            engine.minimax(board, stats=stats)
+        return stats.nodes, {"leaves": stats.leaves}
+    return run
+
+
+def bench_alpha_beta(seed: int) -> Benchmark:
+    """Узлы и листья в секунду перебора с отсечениями на глубину 3."""
+    boards = [make_board(moves) for moves in POSITIONS]
+
+    def run() -> Tuple[int, Dict[str, int]]:
+        nodes = 0
+        leaves = 0
+        for board in boards:
+            searcher = AlphaBetaSearch(board, engine.fast_rate_function,
+                                       max_depth=3)
+            searcher.run()
+            nodes += searcher.nodes
+            leaves += searcher.leaves
+        return nodes, {"leaves": leaves}
+    return run
+
+
+BENCHMARKS: Dict[str, Callable[[int], Benchmark]] = {
+    "board.do_undo": bench_do_undo,
+    "board.find_max_line": bench_find_max_line,
+    "engine.rate_function": bench_rate_function(engine.rate_function, 2),
+    "engine.fast_rate_function":
+        bench_rate_function(engine.fast_rate_function, 2000),
+    "engine.minimax": bench_minimax,
+    "search.alpha_beta": bench_alpha_beta,
+}
+
+
+def measure(benchmark: Benchmark, warmup: int, repeat: int) -> Dict:
+    """Выполняет замер: warmup прогонов без учёта, затем repeat прогонов.
+    В качестве результата берётся лучший прогон. Дополнительные счётчики
+    лучшего прогона записываются как NAME_per_sec.
+    """
+    for i in range(warmup):
+        benchmark()
+    rates = list()
+    best: Dict[str, float] = dict()
+    for i in range(repeat):
+        start = time.perf_counter()
+        operations = benchmark()
+        elapsed = time.perf_counter() - start
+        counters: Dict[str, int] = dict()
+        if isinstance(operations, tuple):
+            operations, counters = operations
+        rates.append(operations / elapsed)
+        if rates[-1] == max(rates):
+            best = {name + "_per_sec": value / elapsed
+                    for name, value in counters.items()}
+    result = {
+        "ops_per_sec": max(rates),
+        "median_ops_per_sec": statistics.median(rates),
+        "runs": rates,
+    }
+    result.update(best)
+    return result
+
+
+def run_benchmarks(names: List[str], seed: int, warmup: int,
+                   repeat: int) -> Dict:
+    """Выполняет замеры с заданными именами."""
+    results = dict()
+    for name in names:
+        random.seed(seed)
+        results[name] = measure(BENCHMARKS[name](seed), warmup, repeat)
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": seed,
+        "warmup": warmup,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(report: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Возвращает описания регрессий относительно базового отчёта."""
+    regressions = list()
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+        old = baseline["results"][name]["ops_per_sec"]
+        new = result["ops_per_sec"]
+        if new < old * (1 - threshold):
+            regressions.append("%s: %.1f -> %.1f оп/с (%.1f%%)" % (
+                name, old, new, 100 * (new - old) / old))
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Парсинг аргументов запуска."""
+    parser = argparse.ArgumentParser(
+        description="Замеры производительности доски и компьютера.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="начальное значение генератора")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="число прогонов для разогрева")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="число учитываемых прогонов")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS),
+                        default=sorted(BENCHMARKS),
+                        help="выполнить только указанные замеры")
+    parser.add_argument("--output", help="файл для отчёта в формате JSON")
+    parser.add_argument("--baseline", help="базовый отчёт для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="допустимое замедление относительно базового "
+                             "отчёта (доля)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Точка входа. Возвращает код завершения."""
+    args = parse_args(argv)
+    report = run_benchmarks(args.only, args.seed, args.warmup, args.repeat)
+    for name, result in sorted(report["results"].items()):
+        print("%-28s %14.1f оп/с" % (name, result["ops_per_sec"]))
+        if "leaves_per_sec" in result:
+            print("%-28s %14.1f листьев/с" % ("", result["leaves_per_sec"]))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for regression in regressions:
+            print("Регрессия:", regression, file=sys.stderr)
+        if regressions:
+            return ERROR_REGRESSION
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
-import sys
-import argparse
+import time
+START_TIME = time.perf_counter()
+
+import sys  # noqa: E402
+import argparse  # noqa: E402
+from pathlib import Path  # noqa: E402
 
 ERROR_PYTHON_VERSION = 1
 ERROR_MODULES_MISSING = 2
@@ -12,45 +16,116 @@ if sys.version_info < (3, 6):
     sys.exit(ERROR_PYTHON_VERSION)
 
 try:
-    from renju import game, window, loader
+    from renju import board, const, engine, game, loader, saver
 except Exception as e:
     print('Игровые модули не найдены: "{}"'.format(e), file=sys.stderr)
     sys.exit(ERROR_MODULES_MISSING)
 
-try:
-    import pygame
-except ImportError:
-    print('Модуль pygame не найден', file=sys.stderr)
-    sys.exit(ERROR_PYGAME_MISSING)
 
-if pygame.vernum < (1, 9, 6):
-    print('Используйте pygame >= 1.9.6', file=sys.stderr)
-    sys.exit(ERROR_PYGAME_VERSION)
+class StartupTimer:
+    """Замеряет время этапов запуска программы."""
 
+    def __init__(self, start: float) -> None:
+        self.last = start
+        self.phases = []
 
-def parse_args() -> None:
-    """Парсинг аргуметов запуска."""
+    def mark(self, name: str) -> None:
+        """Завершает этап name."""
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def print(self) -> None:
+        """Печатает время этапов в поток ошибок."""
+        for name, duration in self.phases:
+            print('{:<24} {:8.1f} мс'.format(name, 1000 * duration),
+                  file=sys.stderr)
+        print('{:<24} {:8.1f} мс'.format(
+            'всего', 1000 * sum(duration for name, duration in self.phases)),
+            file=sys.stderr)
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    """Парсер аргументов, читающий help.txt только для вывода справки."""
+
+    def format_help(self) -> str:
+        try:
+            f = open('help.txt', encoding='utf-8')
+            self.description = f.read()
+            f.close()
+        except FileNotFoundError:
+            pass
+        return super().format_help()
+
+
+def import_window():
+    """Импортирует pygame и модуль игрового окна. Завершает программу,
+    если pygame не установлен или устарел.
+    """
     try:
-        f = open('help.txt', encoding='utf-8')
-        help_text = f.read()
-        f.close()
-    except FileNotFoundError:
-        help_text = ''
-    parser = argparse.ArgumentParser(
-        description=help_text,
-    )
-    parser.parse_args()
+        import pygame
+    except ImportError:
+        print('Модуль pygame не найден', file=sys.stderr)
+        sys.exit(ERROR_PYGAME_MISSING)
+    if pygame.vernum < (1, 9, 6):
+        print('Используйте pygame >= 1.9.6', file=sys.stderr)
+        sys.exit(ERROR_PYGAME_VERSION)
+    from renju import window
+    return window
+
+
+def parse_args() -> argparse.Namespace:
+    """Парсинг аргуметов запуска."""
+    parser = ArgumentParser()
+    parser.add_argument('--search-log', action='store_true',
+                        help='печатать ход перебора компьютера')
+    parser.add_argument('--renju', action='store_true',
+                        help='запретить чёрным двойную тройку, двойную '
+                             'четвёрку и длинный ряд')
+    parser.add_argument('--weights', default=str(const.WEIGHTS_PATH),
+                        help='файл весов оценочной функции, подобранных '
+                             'python -m renju.tuning')
+    parser.add_argument('--startup-time', action='store_true',
+                        help='напечатать время этапов запуска')
+    args = parser.parse_args()
+    engine.load_weights(Path(args.weights))
+    if args.search_log:
+        const.SEARCH_LOG = True
+    if args.renju:
+        const.RENJU_RULES = True
+    return args
 
 
 if __name__ == '__main__':
-    parse_args()
+    timer = StartupTimer(START_TIME)
+    timer.mark('импорт модулей')
+    args = parse_args()
+    timer.mark('аргументы и веса')
+    # Таблицы движка строятся (или читаются из кэша таблиц) при
+    # создании первой доски и дальше общие для всех досок.
+    board.Board()
+    timer.mark('таблицы движка')
+    window = import_window()
+    timer.mark('импорт pygame и окна')
     window.init()
+    timer.mark('создание окна')
+    # Журнал ходов пишется во время партии и хранит её правила, файл
+    # сохранения - при выходе; он нужен, если журнала ещё нет.
     try:
-        field = loader.Loader.load_game()
+        field = loader.Loader.load_journal()
     except BaseException:
-        field = game.Game()
+        try:
+            field = loader.Loader.load_game()
+        except BaseException:
+            field = game.Game()
+    field.set_journal(saver.Journal())
+    timer.mark('загрузка партии')
+    window.draw_background(field.board)
     window.draw_board(field)
     window.try_draw_menu(field)
+    timer.mark('отрисовка')
+    if args.startup_time:
+        timer.print()
     running = True
     while running:
         running = window.process_events(field)
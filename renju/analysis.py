@@ -0,0 +1,297 @@
+"""Модуль для разбора сохранённых партий без окна.
+
+Каждая позиция каждой партии (перед каждым сделанным ходом) разбирается
+отдельно: ищется форсированный выигрыш угрозами и выполняется перебор с
+отсечениями. Для позиции сообщаются оценка и лучший ход, оценка
+сделанного хода, потеря от него и упущенный форсированный выигрыш.
+
+Позиции разбираются в пуле процессов, результаты дописываются в файл
+JSONL по строке на позицию по мере готовности, поэтому порядок строк не
+совпадает с порядком позиций. Позиция определяется файлом, номером
+партии в нём и номером хода. При повторном запуске с тем же файлом
+результатов уже разобранные позиции пропускаются, поэтому большой архив
+можно разбирать частями (--limit) и продолжать после прерывания.
+
+Запуск: python -m renju.analysis save.txt games/*.txt \\
+    --output analysis.jsonl --workers 8 --depth 4
+"""
+
+from .board import Board, BoardState, Player
+from .gamestore import read_games
+from .position import Position
+from .search import AlphaBetaSearch
+from . import const, engine, threats, tt
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, \
+    as_completed, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, \
+    Tuple
+import argparse
+import json
+import sys
+import time
+
+# Позиция в результатах: файл, номер партии в нём и номер хода (None для
+# строки об ошибке в партии).
+PositionKey = Tuple[str, int, Optional[int]]
+
+
+def _search(board: Board, depth: int,
+            time_limit: Optional[float]) -> Tuple[int, Tuple[int, int], int]:
+    """Перебор с отсечениями. Возвращает оценку, ход и законченную
+    глубину.
+    """
+    deadline = None
+    if time_limit is not None:
+        deadline = time.monotonic() + time_limit
+    searcher = AlphaBetaSearch(board, engine.fast_rate_function, deadline,
+                               depth,
+                               tt.TranspositionTable(const.ARENA_TT_MEMORY))
+    score, move = searcher.run()
+    return score, move, searcher.completed_depth
+
+
+def _keeps_forced_win(board: Board, time_limit: Optional[float]) -> bool:
+    """Проверяет, сохраняет ли форсированный выигрыш игрок, только что
+    сделавший ход на доске: соперник не выигрывает сразу, а после любого
+    его допустимого ответа выигрыш находится поиском угроз. Если у
+    игрока есть четвёрка, ответы - только защиты от неё.
+    """
+    opponent = board.whose_move
+    mover = Player(1 - opponent)
+    if board.get_winning_cells(opponent):
+        return False
+    won = BoardState.BLACK_WINS if mover == Player.BLACK \
+        else BoardState.WHITE_WINS
+    replies = board.get_winning_cells(mover) or board.get_candidates()
+    for reply in sorted(replies):
+        if board.is_forbidden(reply):
+            continue
+        board.do_move(reply)
+        try:
+            if board.state == BoardState.GAMING:
+                if threats.find_forced_win(board, time_limit) is None:
+                    return False
+            elif board.state != won:
+                return False
+        finally:
+            board.undo_move()
+    return True
+
+
+def analyse_position(position: Position, played: Tuple[int, int],
+                     depth: int = const.ANALYSIS_DEPTH,
+                     time_limit: Optional[float] = None) -> Dict:
+    """Разбирает позицию position, в которой был сделан ход played.
+    Оценки даны для того, кто ходит в позиции. Сделанный ход, если он не
+    совпал с лучшим, оценивается перебором на глубину depth - 1 после
+    него, а в позиции с форсированным выигрышем сначала проверяется, не
+    ведёт ли к выигрышу и он. time_limit ограничивает каждый перебор.
+    """
+    board = Board.from_position(position)
+    threat_limit = None
+    if time_limit is not None:
+        threat_limit = time_limit * const.THREAT_TIME_SHARE
+    line = None
+    if const.USE_THREAT_SEARCH:
+        line = threats.find_forced_win(board, threat_limit)
+    if line:
+        score, best, completed = const.MINIMAX_INF, line[0], 0
+    else:
+        score, best, completed = _search(board, depth, time_limit)
+    if played == best:
+        played_score = score
+    else:
+        board.do_move(played)
+        if board.state == BoardState.GAMING:
+            if line and _keeps_forced_win(board, threat_limit):
+                played_score = const.MINIMAX_INF
+            else:
+                played_score = -_search(board, max(depth - 1, 1),
+                                        time_limit)[0]
+        elif board.state == BoardState.DRAW:
+            played_score = 0
+        else:
+            # Выиграть своим ходом может только сделавший его.
+            played_score = const.MINIMAX_INF
+    winning = const.MINIMAX_INF // 2
+    return {
+        "move": played,
+        "best": best,
+        "score": score,
+        "played_score": played_score,
+        "loss": max(score - played_score, 0),
+        "forced_win": score >= winning,
+        "missed_win": score >= winning and played_score < winning,
+        "depth": completed,
+    }
+
+
+def read_done(path: Path) -> Set[PositionKey]:
+    """Возвращает позиции, уже записанные в файл результатов path.
+    Недописанная последняя строка (разбор был прерван во время записи)
+    отрезается от файла.
+    """
+    done: Set[PositionKey] = set()
+    if not path.exists():
+        return done
+    with path.open("rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+    for line in data[:end].decode("utf-8").splitlines():
+        if line.strip():
+            record = json.loads(line)
+            done.add((record["file"], record["game"], record.get("ply")))
+    return done
+
+
+def iter_positions(paths: List[Path]) \
+        -> Iterator[Tuple[PositionKey, Optional[Position],
+                          Optional[Tuple[int, int]]]]:
+    """Перечисляет позиции партий из файлов paths вместе со сделанными в
+    них ходами. Для повреждённой партии или партии с недопустимыми ходами
+    возвращается одна запись без позиции.
+    """
+    for path in paths:
+        for game, (moves, result) in enumerate(read_games(path)):
+            try:
+                if moves is None or len(set(moves)) != len(moves):
+                    raise ValueError()
+                full = Position(moves=moves)
+            except (IndexError, ValueError):
+                yield (str(path), game, None), None, None
+                continue
+            for ply, move in enumerate(moves):
+                yield (str(path), game, ply), full.prefix(ply), move
+
+
+class AnalysisSummary:
+    """Накапливает итоги разбора."""
+
+    def __init__(self) -> None:
+        self.positions = 0
+        self.skipped = 0
+        self.errors = 0
+        self.missed_wins = 0
+
+    def add(self, record: Dict) -> None:
+        """Учитывает результат разбора позиции."""
+        if "error" in record:
+            self.errors += 1
+            return
+        self.positions += 1
+        self.missed_wins += record["missed_win"]
+
+    def format(self, elapsed: float) -> str:
+        """Возвращает текстовый отчёт."""
+        return "Разобрано позиций: %d за %.1f с, пропущено разобранных " \
+            "ранее: %d, партий с ошибками: %d, упущенных выигрышей: %d" % (
+                self.positions, elapsed, self.skipped, self.errors,
+                self.missed_wins)
+
+
+def analyse_games(paths: List[Path], output: Path,
+                  workers: int = const.PARALLEL_WORKERS,
+                  depth: int = const.ANALYSIS_DEPTH,
+                  time_limit: Optional[float] = None,
+                  limit: Optional[int] = None,
+                  log: Optional[Callable[[Dict], None]] = None) \
+        -> AnalysisSummary:
+    """Разбирает позиции партий из файлов paths в workers процессах и
+    дописывает результаты в файл output по мере готовности. Позиции, уже
+    записанные в output, пропускаются. Если задан limit, разбирается не
+    больше limit новых позиций.
+    """
+    summary = AnalysisSummary()
+    done = read_done(output)
+    with output.open("a", encoding="utf-8") as f, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+
+        def write(record: Dict) -> None:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            summary.add(record)
+            if log is not None:
+                log(record)
+
+        def collect(futures: Iterable) -> None:
+            for future in futures:
+                file, game, ply = pending.pop(future)
+                record = {"file": file, "game": game, "ply": ply}
+                record.update(future.result())
+                write(record)
+
+        pending = dict()
+        submitted = 0
+        for key, position, move in iter_positions(paths):
+            if key in done:
+                summary.skipped += 1
+                continue
+            if limit is not None and submitted >= limit:
+                break
+            if position is None:
+                write({"file": key[0], "game": key[1],
+                       "error": "недопустимые ходы"})
+                continue
+            # Очередь пула ограничена, чтобы не держать в памяти позиции
+            # всего архива.
+            if len(pending) >= workers * const.ANALYSIS_QUEUE:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[pool.submit(analyse_position, position, move, depth,
+                                time_limit)] = key
+            submitted += 1
+        collect(as_completed(list(pending)))
+    return summary
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Парсинг аргументов запуска."""
+    parser = argparse.ArgumentParser(
+        description="Разбор сохранённых партий.")
+    parser.add_argument("files", nargs="+",
+                        help="файлы сохранения, журналы ходов (.bin) или "
+                             "результаты партий без окна (.jsonl)")
+    parser.add_argument("--output", default="analysis.jsonl",
+                        help="файл для результатов разбора; уже "
+                             "разобранные в нём позиции пропускаются")
+    parser.add_argument("--workers", type=int,
+                        default=const.PARALLEL_WORKERS,
+                        help="число процессов")
+    parser.add_argument("--depth", type=int, default=const.ANALYSIS_DEPTH,
+                        help="глубина перебора")
+    parser.add_argument("--time", type=float,
+                        help="ограничение времени на перебор в секундах")
+    parser.add_argument("--limit", type=int,
+                        help="разобрать не больше стольких новых позиций")
+    parser.add_argument("--quiet", action="store_true",
+                        help="не печатать результат каждой позиции")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Точка входа."""
+    args = parse_args(argv)
+    start = time.monotonic()
+
+    def log(record: Dict) -> None:
+        if args.quiet:
+            return
+        if "error" in record:
+            print("%s, партия %d: %s" % (record["file"], record["game"],
+                                        record["error"]))
+        else:
+            print("%s, партия %d, ход %d: %s, лучший %s, потеря %d%s" % (
+                record["file"], record["game"], record["ply"],
+                record["move"], record["best"], record["loss"],
+                ", упущен выигрыш" if record["missed_win"] else ""))
+
+    summary = analyse_games([Path(name) for name in args.files],
+                            Path(args.output), args.workers, args.depth,
+                            args.time, args.limit, log)
+    print(summary.format(time.monotonic() - start))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,276 @@
+"""Модуль для проведения партий компьютера против компьютера без окна.
+
+Запуск: python -m renju.arena --games 1000 --workers 8 \\
+    --black depth=3,time=0.1 --white depth=2,eval=reference
+
+Партии распределяются между процессами, результат каждой партии
+записывается строкой JSON в файл сразу по её окончании.
+"""
+
+from .board import Board, BoardState, Player
+from .game import Game
+from .mcts import MonteCarloSearch
+from .search import AlphaBetaSearch
+from .stats import SearchStats
+from . import const, engine, threats, tt, vector_eval
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import argparse
+import json
+import random
+import sys
+import time
+
+# Доступные оценочные функции
+EVALUATIONS: Dict[str, Callable[[Board], int]] = {
+    "incremental": engine.fast_rate_function,
+    "reference": engine.rate_function,
+    "numpy": vector_eval.vector_rate_function,
+}
+
+# Доступные алгоритмы
+MODES = ("alphabeta", "minimax", "mcts")
+
+_RESULTS = {
+    BoardState.BLACK_WINS: "black",
+    BoardState.WHITE_WINS: "white",
+    BoardState.DRAW: "draw",
+}
+
+
+class EngineSettings(NamedTuple):
+    """Настройки компьютера одной из сторон. Глубина по умолчанию для
+    mode=minimax - const.MAX_MINIMAX_DEPTH (см. parse_settings): minimax
+    не ограничен временем.
+    """
+    mode: str = "alphabeta"
+    depth: int = const.MAX_SEARCH_DEPTH
+    time: float = 0.1
+    evaluation: str = "incremental"
+    threats: bool = True
+    # Число итераций поиска Монте-Карло на ход (0 - только по времени)
+    iterations: int = const.MCTS_ITERATIONS
+
+    def __str__(self) -> str:
+        text = "mode=%s,depth=%d,time=%g,eval=%s,threats=%d" % (
+            self.mode, self.depth, self.time, self.evaluation, self.threats)
+        if self.iterations:
+            text += ",iterations=%d" % self.iterations
+        return text
+
+
+def parse_settings(text: str) -> EngineSettings:
+    """Разбирает настройки вида "depth=3,time=0.2,eval=reference"."""
+    settings = EngineSettings()
+    fields = {"eval": "evaluation"}
+    values = dict()
+    for item in filter(None, text.split(",")):
+        name, _, value = item.partition("=")
+        name = fields.get(name.strip(), name.strip())
+        if name not in EngineSettings._fields:
+            raise ValueError("Неизвестный параметр: " + name)
+        values[name] = type(getattr(settings, name))(
+            int(value) if name == "threats" else value)
+    if values.get("mode") == "minimax" and "depth" not in values:
+        values["depth"] = const.MAX_MINIMAX_DEPTH
+    settings = settings._replace(**values)
+    if settings.mode not in MODES:
+        raise ValueError("Неизвестный алгоритм: " + settings.mode)
+    if settings.evaluation not in EVALUATIONS:
+        raise ValueError("Неизвестная оценка: " + settings.evaluation)
+    return settings
+
+
+def choose_move(board: Board, settings: EngineSettings,
+                stats: Optional[SearchStats] = None,
+                tree: Optional[MonteCarloSearch] = None) -> Tuple[int, int]:
+    """Выбирает ход компьютера с заданными настройками. Статистика
+    перебора записывается в stats. Поиск Монте-Карло продолжает дерево
+    tree, если оно передано.
+    """
+    if settings.threats:
+        line = threats.find_forced_win(
+            board, settings.time * const.THREAT_TIME_SHARE)
+        if line:
+            return line[0]
+    if settings.mode == "minimax":
+        memorized_depth = const.MAX_MINIMAX_DEPTH
+        const.MAX_MINIMAX_DEPTH = settings.depth
+        try:
+            return engine.minimax(board, stats=stats)[1]
+        finally:
+            const.MAX_MINIMAX_DEPTH = memorized_depth
+    deadline = time.monotonic() + settings.time
+    if settings.mode == "mcts":
+        if tree is None:
+            tree = MonteCarloSearch(EVALUATIONS[settings.evaluation])
+        return tree.run(board, deadline, settings.iterations, stats)[1]
+    return AlphaBetaSearch(board, EVALUATIONS[settings.evaluation], deadline,
+                           settings.depth,
+                           tt.TranspositionTable(const.ARENA_TT_MEMORY),
+                           stats=stats).run()[1]
+
+
+def play_opening(board: Board, rnd: random.Random, moves: int) -> None:
+    """Делает moves случайных ходов в квадрате вокруг центра поля."""
+    center = (board.size[0] // 2, board.size[1] // 2)
+    radius = const.ARENA_OPENING_RADIUS
+    while len(board.moves) < moves and board.state == BoardState.GAMING:
+        pos = (center[0] + rnd.randint(-radius, radius),
+               center[1] + rnd.randint(-radius, radius))
+        if board.in_field(pos) and not board[pos] and \
+                not board.is_forbidden(pos):
+            board.do_move(pos)
+
+
+def play_game(game_id: int, black: EngineSettings, white: EngineSettings,
+              seed: int, opening_moves: int) -> Dict:
+    """Играет одну партию и возвращает её описание."""
+    game = Game()
+    board = game.board
+    play_opening(board, random.Random(seed), opening_moves)
+    opening_length = len(board.moves)
+    times: List[float] = list()
+    nodes: List[int] = list()
+    # У каждой стороны своё дерево поиска Монте-Карло на всю партию.
+    trees = [MonteCarloSearch(EVALUATIONS[settings.evaluation], seed)
+             for settings in (black, white)]
+    while board.state == BoardState.GAMING:
+        player = board.whose_move
+        settings = black if player == Player.BLACK else white
+        stats = SearchStats()
+        start = time.monotonic()
+        pos = choose_move(board, settings, stats, trees[player])
+        times.append(round(time.monotonic() - start, 4))
+        nodes.append(stats.nodes)
+        game.do_move(pos)
+    return {
+        "game": game_id,
+        "seed": seed,
+        "black": str(black),
+        "white": str(white),
+        "winner": _RESULTS[board.state],
+        "length": len(board.moves),
+        "opening": opening_length,
+        "moves": board.moves,
+        "times": times,
+        "nodes": nodes,
+    }
+
+
+class ArenaSummary:
+    """Накапливает итоги партий."""
+
+    def __init__(self) -> None:
+        self.games = 0
+        self.wins: Dict[str, int] = {"black": 0, "white": 0, "draw": 0}
+        self.engine_wins: Dict[str, int] = dict()
+        self.engine_games: Dict[str, int] = dict()
+        self.moves = 0
+
+    def add(self, result: Dict) -> None:
+        """Учитывает результат партии."""
+        self.games += 1
+        self.moves += result["length"]
+        self.wins[result["winner"]] += 1
+        for color in ("black", "white"):
+            name = result[color]
+            self.engine_games[name] = self.engine_games.get(name, 0) + 1
+            if result["winner"] == color:
+                self.engine_wins[name] = self.engine_wins.get(name, 0) + 1
+
+    def format(self, elapsed: float) -> str:
+        """Возвращает текстовый отчёт."""
+        lines = ["Партий: %d, время: %.1f с, партий в секунду: %.2f, "
+                 "средняя длина: %.1f" % (
+                     self.games, elapsed, self.games / max(elapsed, 1e-9),
+                     self.moves / max(self.games, 1))]
+        for color in ("black", "white", "draw"):
+            lines.append("%s: %d (%.1f%%)" % (
+                color, self.wins[color],
+                100 * self.wins[color] / max(self.games, 1)))
+        for name, games in sorted(self.engine_games.items()):
+            wins = self.engine_wins.get(name, 0)
+            lines.append("%s: %d побед из %d (%.1f%%)" % (
+                name, wins, games, 100 * wins / games))
+        return "\n".join(lines)
+
+
+def run_arena(games: int, first: EngineSettings, second: EngineSettings,
+              output: str, workers: int = const.PARALLEL_WORKERS,
+              seed: int = 0, opening_moves: int = const.ARENA_OPENING_MOVES,
+              alternate: bool = False,
+              log: Optional[Callable[[Dict], None]] = None) -> ArenaSummary:
+    """Играет games партий first (чёрными) против second (белыми) в
+    workers процессах. Если alternate, цвета меняются каждую партию.
+    Результаты партий дописываются в файл output по мере завершения.
+    """
+    summary = ArenaSummary()
+    with open(output, "a", encoding="utf-8") as f, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = list()
+        for game_id in range(games):
+            black, white = first, second
+            if alternate and game_id % 2:
+                black, white = second, first
+            futures.append(pool.submit(play_game, game_id, black, white,
+                                       seed + game_id, opening_moves))
+        for future in as_completed(futures):
+            result = future.result()
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            summary.add(result)
+            if log is not None:
+                log(result)
+    return summary
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Парсинг аргументов запуска."""
+    parser = argparse.ArgumentParser(
+        description="Партии компьютера против компьютера без окна.")
+    parser.add_argument("--games", type=int, default=100,
+                        help="число партий")
+    parser.add_argument("--workers", type=int,
+                        default=const.PARALLEL_WORKERS,
+                        help="число процессов")
+    parser.add_argument("--black", type=parse_settings,
+                        default=EngineSettings(),
+                        help="настройки чёрных, например "
+                             "mode=alphabeta,depth=3,time=0.1,"
+                             "eval=incremental,threats=1 или "
+                             "mode=mcts,time=0.5,iterations=2000")
+    parser.add_argument("--white", type=parse_settings,
+                        default=EngineSettings(), help="настройки белых")
+    parser.add_argument("--alternate", action="store_true",
+                        help="менять цвета сторон каждую партию")
+    parser.add_argument("--opening-moves", type=int,
+                        default=const.ARENA_OPENING_MOVES,
+                        help="число случайных ходов в начале партии")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="начальное значение генератора дебютов")
+    parser.add_argument("--output", default="arena.jsonl",
+                        help="файл для результатов партий")
+    parser.add_argument("--quiet", action="store_true",
+                        help="не печатать результат каждой партии")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Точка входа."""
+    args = parse_args(argv)
+    start = time.monotonic()
+
+    def log(result: Dict) -> None:
+        if not args.quiet:
+            print("партия %d: %s, ходов %d" % (
+                result["game"], result["winner"], result["length"]))
+
+    summary = run_arena(args.games, args.black, args.white, args.output,
+                        args.workers, args.seed, args.opening_moves,
+                        args.alternate, log)
+    print(summary.format(time.monotonic() - start))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,220 @@
+"""Модуль, позволяющий компьютеру думать в фоновом потоке."""
+
+from .board import Board, BoardState
+from .game import Game
+from .search import AlphaBetaSearch
+from .stats import SearchStats, make_log_hook
+from .threats import ThreatSearch
+from . import const, engine
+from typing import Optional, Tuple
+import threading
+import time
+
+
+class EngineJob:
+    """Выбор хода для копии доски в отдельном потоке.
+
+    Если time_limit равен None, поиск идёт, пока его не остановят или не
+    будет достигнута максимальная глубина (так компьютер думает во время
+    хода соперника). Ограничение по времени можно назначить позже
+    методом set_time_limit. Задачу можно отменить в любой момент.
+    Статистика перебора собирается в stats, а если включён
+    const.SEARCH_LOG, итоги глубин печатаются в поток ошибок.
+    Перебор продолжает состояние компьютера state (таблицу
+    транспозиций, историю, главную линию) и сохраняет в него свои
+    результаты; без state задача начинает с пустого состояния.
+
+    Таблица транспозиций пишется без блокировки, поэтому с одним
+    состоянием в каждый момент работает не больше одной задачи: cancel
+    возвращается, только когда поток задачи завершился, и после него
+    состояние можно отдать новой задаче или очистить.
+    """
+
+    def __init__(self, board: Board, time_limit: Optional[float],
+                 state: Optional[engine.Engine] = None) -> None:
+        self.board = board.copy()
+        self.state = state if state is not None else engine.Engine()
+        self.table = self.state.table
+        self.predicted_reply = (-1, -1)
+        self.stats = SearchStats(make_log_hook() if const.SEARCH_LOG
+                                 else None)
+        self._deadline = None
+        if time_limit is not None:
+            self._deadline = time.monotonic() + time_limit
+        self._result: Optional[Tuple[int, Tuple[int, int]]] = None
+        self._cancelled = False
+        self._searcher: Optional[AlphaBetaSearch] = None
+        self._threat_searcher: Optional[ThreatSearch] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        """Тело потока."""
+        try:
+            self._result = self._search()
+            if self._result is not None and self._result[1] != (-1, -1) \
+                    and self.predicted_reply == (-1, -1):
+                self._predict_reply(self._result[1])
+        finally:
+            self._done.set()
+
+    def _search(self) -> Optional[Tuple[int, Tuple[int, int]]]:
+        """Выбирает ход. Прерываемый поиск есть только для перебора с
+        отсечениями, остальные алгоритмы выполняются целиком.
+        """
+        if const.SEARCH_MODE != "alphabeta":
+            with self._lock:
+                if self._cancelled:
+                    return None
+            time_limit = const.GAME_TIME_LIMIT / const.MOVES_TO_GO
+            if self._deadline is not None:
+                time_limit = max(self._deadline - time.monotonic(),
+                                 const.MIN_MOVE_TIME)
+            return self.state.choose_move(self.board, time_limit, self.stats,
+                                          self.cancelled)
+        move = engine.probe_book(self.board)
+        if move is not None:
+            return 0, move
+        if const.USE_THREAT_SEARCH:
+            with self._lock:
+                if self._cancelled:
+                    return None
+                self._threat_searcher = ThreatSearch(self.board)
+            line = self._threat_searcher.run()
+            if line:
+                if len(line) > 1:
+                    self.predicted_reply = line[1]
+                self.state.remember_line(self.board, line,
+                                         const.MINIMAX_INF, 0)
+                return const.MINIMAX_INF, line[0]
+        with self._lock:
+            if self._cancelled:
+                return None
+            self._searcher = self.state.create_search(
+                self.board, self._deadline, self.stats)
+        result = self._searcher.run()
+        if not self._cancelled:
+            self.state.finish_search(self._searcher)
+        return result
+
+    def _predict_reply(self, move: Tuple[int, int]) -> None:
+        """Запоминает ожидаемый ответ соперника на ход move."""
+        board = self.board
+        board.do_move(move)
+        if board.state == BoardState.GAMING:
+            entry = self.table.probe(board.hash_key)
+            if entry is not None and entry.move != (-1, -1) and \
+                    not board[entry.move]:
+                self.predicted_reply = entry.move
+        board.undo_move()
+
+    def set_time_limit(self, time_limit: float) -> None:
+        """Ограничивает время поиска, отсчитывая от текущего момента."""
+        with self._lock:
+            self._deadline = time.monotonic() + time_limit
+            if self._searcher is not None:
+                self._searcher.deadline = self._deadline
+
+    def cancel(self) -> None:
+        """Отменяет задачу и ждёт завершения её потока. Результат
+        отменённой задачи не используется. Перебор с отсечениями и поиск
+        Монте-Карло прерываются сразу, остальные алгоритмы доходят до
+        конца.
+        """
+        with self._lock:
+            self._cancelled = True
+            if self._threat_searcher is not None:
+                self._threat_searcher.stop()
+            if self._searcher is not None:
+                self._searcher.stop()
+        self._done.wait()
+
+    def cancelled(self) -> bool:
+        """Проверяет, была ли задача отменена."""
+        return self._cancelled
+
+    def done(self) -> bool:
+        """Проверяет, завершился ли поиск."""
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Ждёт завершения поиска не дольше timeout секунд."""
+        return self._done.wait(timeout)
+
+    def result(self) -> Optional[Tuple[int, Tuple[int, int]]]:
+        """Возвращает оценку и ход, если поиск завершился и не был
+        отменён, иначе None.
+        """
+        if self._cancelled or not self.done():
+            return None
+        return self._result
+
+
+class EngineController:
+    """Управляет фоновыми задачами компьютера в партии.
+
+    После хода человека запускается поиск ответа; пока человек думает,
+    компьютер обдумывает позицию после ожидаемого ответа человека. Если
+    человек сделал ожидаемый ход, продолжается уже начатый поиск.
+    """
+
+    def __init__(self) -> None:
+        self.job: Optional[EngineJob] = None
+        self.ponder_job: Optional[EngineJob] = None
+        self.ponder_move = (-1, -1)
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+
+    def is_thinking(self) -> bool:
+        """Проверяет, ищет ли компьютер ход в текущей позиции."""
+        return self.job is not None
+
+    def start_move(self, game: Game) -> None:
+        """Запускает выбор хода компьютера в текущей позиции партии."""
+        state = engine.get_engine(game)
+        budget = engine.get_time_budget(game)
+        ponder_job = self.ponder_job
+        self.ponder_job = None
+        if ponder_job is not None and game.board.moves and \
+                game.board.moves[-1] == self.ponder_move:
+            self.ponder_hits += 1
+            ponder_job.set_time_limit(budget)
+            self.job = ponder_job
+            return
+        if ponder_job is not None:
+            self.ponder_misses += 1
+            ponder_job.cancel()
+        self.job = EngineJob(game.board, budget, state)
+
+    def poll(self, game: Game) -> bool:
+        """Если компьютер выбрал ход, делает его в партии и начинает
+        думать над ожидаемым ответом. Возвращает True, если ход сделан.
+        """
+        job = self.job
+        if job is None or not job.done():
+            return False
+        self.job = None
+        result = job.result()
+        if result is None or result[1] == (-1, -1):
+            return False
+        game.do_move(result[1])
+        if const.PONDER and game.board.state == BoardState.GAMING and \
+                job.predicted_reply != (-1, -1) and \
+                not game.board[job.predicted_reply]:
+            self.ponder_move = job.predicted_reply
+            board = game.board.copy()
+            board.do_move(self.ponder_move)
+            if board.state == BoardState.GAMING:
+                self.ponder_job = EngineJob(board, None,
+                                            engine.get_engine(game))
+        return True
+
+    def cancel(self) -> None:
+        """Отменяет все фоновые задачи и ждёт их завершения."""
+        for job in (self.job, self.ponder_job):
+            if job is not None:
+                job.cancel()
+        self.job = None
+        self.ponder_job = None
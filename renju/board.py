@@ -1,8 +1,10 @@
 """Модуль, отвечающий за игровое поле."""
 
-from . import const
-from typing import Tuple
+from . import const, geometry, rules
+from .position import Position
+from typing import List, Optional, Set, Tuple
 import enum
+import functools
 
 
 class CellState(enum.IntEnum):
@@ -38,95 +40,441 @@ class Player(enum.IntEnum):
     WHITE = 1
 
 
+_CELL_STATES = (CellState.EMPTY, CellState.BLACK, CellState.WHITE)
+_OPPONENT = (Player.WHITE, Player.BLACK)
+_WIN_STATES = (BoardState.BLACK_WINS, BoardState.WHITE_WINS)
+
+
+@functools.lru_cache(maxsize=None)
+def _chain_shifts(stride: int, length: int) -> Tuple[Tuple[int, ...], ...]:
+    """Для каждого из четырёх направлений возвращает последовательность
+    сдвигов, за которую битборд начал линий длины 1 превращается в битборд
+    начал линий длины length. После каждого сдвига покрытая длина
+    увеличивается не более чем вдвое.
+    """
+    steps = []
+    covered = 1
+    while covered < length:
+        step = min(covered, length - covered)
+        steps.append(step)
+        covered += step
+    return tuple(tuple(step * shift for step in steps)
+                 for shift in (stride - 1, stride, stride + 1, 1))
+
+
 class Board:
-    """Описывает игровое поле."""
+    """Описывает игровое поле.
+
+    Позиция хранится в виде битбордов: по одному большому целому числу на
+    каждый цвет. Клетке (row, column) соответствует бит с номером
+    row * (ширина + 1) + column. Лишний столбец в каждой строке всегда пуст
+    и не даёт линиям "перетекать" с одной строки на другую при сдвигах.
+    Для быстрого чтения отдельных клеток битборды дублируются плоским
+    массивом _cells с той же нумерацией.
+
+    Кроме того, для каждого окна из win_length клеток подряд хранится
+    число чёрных и белых фишек в нём, а для каждого игрока - сумма весов
+    const.RATE_WEIGHTS по окнам, где нет фишек соперника. Эти величины
+    обновляются при каждом изменении клетки за время, пропорциональное
+    числу окон через эту клетку. Окна, в которых у игрока не меньше
+    win_length - 3 фишек и нет фишек соперника, дополнительно хранятся
+    во множествах по числу фишек: из них быстро находятся угрозы.
+
+    Также поддерживаются ключ Зобриста позиции hash_key и множество
+    кандидатов - пустых клеток, рядом с которыми (не дальше
+    const.CANDIDATE_DISTANCE по каждой координате) есть хотя бы одна фишка.
+
+    Размеры поля size и длина выигрышного ряда win_length задаются при
+    создании доски (по умолчанию const.BOARD_SIZE и const.WIN_ROW_LENGTH).
+    Все таблицы, зависящие от них, берутся из geometry.get_geometry и
+    общие для всех досок с одинаковыми размерами.
+
+    Если renju (по умолчанию const.RENJU_RULES), чёрным запрещены ходы
+    по правилам рэндзю (см. модуль rules). Для этого доска дополнительно
+    хранит коды линий всех клеток и обновляет их при каждом изменении
+    клетки. Запрещённые клетки не попадают в кандидаты чёрных и в
+    результаты get_window_gaps для чёрных.
+
+    Снимок доски - неизменяемая позиция (см. модуль position) - делается
+    методом snapshot; доска восстанавливается из него методами
+    from_position и restore. Копия доски со всеми таблицами делается
+    методом copy.
+    """
 
-    def __init__(self) -> None:
-        self.cells = [[CellState.EMPTY] * const.BOARD_SIZE[1] for i in
-                      range(const.BOARD_SIZE[0])]
+    def __init__(self, size: Optional[Tuple[int, int]] = None,
+                 win_length: Optional[int] = None,
+                 renju: Optional[bool] = None) -> None:
+        if size is None:
+            size = const.BOARD_SIZE
+        if win_length is None:
+            win_length = const.WIN_ROW_LENGTH
+        if renju is None:
+            renju = const.RENJU_RULES
+        self.size = (size[0], size[1])
+        self.win_length = win_length
+        self.renju = renju
+        self._height, self._width = self.size
+        self._stride = self._width + 1
+        # Сдвиги битборда, соответствующие направлениям
+        # (1, -1), (1, 0), (1, 1), (0, 1).
+        self._shifts = (self._stride - 1, self._stride, self._stride + 1, 1)
+        self._stones = [0, 0]
+        self._cells = bytearray(self._height * self._stride)
+        self._geometry = geometry.get_geometry(
+            self._height, self._width, win_length)
+        windows_count = len(self._geometry.windows)
+        self._window_counts = [[0] * windows_count, [0] * windows_count]
+        self._scores = [0, 0]
+        self._tracked_count = max(win_length - 3, 1)
+        self._pure_windows = [
+            [set() for i in range(win_length)] for player in range(2)]
+        self._neighbours = self._geometry.get_neighbours(
+            const.CANDIDATE_DISTANCE)
+        self._near_stones = [0] * len(self._cells)
+        self._candidates: Set[int] = set()
+        self.hash_key = 0
+        # Окно из win_length фишек означает конец игры и в оценке не
+        # участвует, поэтому его вес можно взять любым.
+        self._weights = list(const.RATE_WEIGHTS)
+        self._weights += [self._weights[-1]] * \
+            (win_length + 1 - len(self._weights))
+        self._line_codes: Optional[List[int]] = None
+        if renju:
+            codes, self._line_slots = self._geometry.get_lines()
+            self._line_codes = list(codes)
+            self._patterns = rules.get_pattern_table(win_length)
         self.whose_move = Player.BLACK
         self.state = BoardState.GAMING
         self.moves = list()
 
+    def _index(self, pos: Tuple[int, int]) -> int:
+        """Возвращает номер бита, соответствующего клетке."""
+        row, column = pos
+        if not (0 <= row < self._height and 0 <= column < self._width):
+            raise IndexError("Клетка {} вне игрового поля.".format(pos))
+        return row * self._stride + column
+
     def __getitem__(self, pos: Tuple[int, int]) -> CellState:
         """Возвращает состояние клетки."""
-        return self.cells[pos[0]][pos[1]]
+        row, column = pos
+        if 0 <= row < self._height and 0 <= column < self._width:
+            return _CELL_STATES[self._cells[row * self._stride + column]]
+        raise IndexError("Клетка {} вне игрового поля.".format(pos))
 
     def __setitem__(self, pos: Tuple[int, int], state: CellState) -> None:
         """Устанавливает в клетку необходимое состояние."""
-        self.cells[pos[0]][pos[1]] = state
+        index = self._index(pos)
+        if self._cells[index]:
+            self._remove_stone(self._cells[index] - 1, index)
+        if state:
+            self._add_stone(state - 1, index)
+
+    @property
+    def cells(self) -> List[List[CellState]]:
+        """Возвращает копию поля в виде списка строк."""
+        return [[self[row, column] for column in range(self._width)]
+                for row in range(self._height)]
+
+    def get_raw_cells(self) -> bytes:
+        """Возвращает состояния клеток построчно, по байту на клетку.
+        В конце каждой строки стоит байт пустого служебного столбца.
+        """
+        return bytes(self._cells)
 
     def do_move(self, pos: Tuple[int, int]) -> None:
         """Делает ход. Пересчитывает все атрибуты класса."""
-        assert not self[pos], "Ходить можно только в пусую клетку."
+        index = self._index(pos)
+        assert not self._cells[index], "Ходить можно только в пусую клетку."
+        player = self.whose_move
         self.moves.append(pos)
-        if self.whose_move == Player.BLACK:
-            self[pos] = CellState.BLACK
-            self.whose_move = Player.WHITE
+        self._add_stone(player, index)
+        self.whose_move = _OPPONENT[player]
+        self.hash_key ^= self._geometry.zobrist_side
+        if self.has_line(player, self.win_length):
+            self.state = _WIN_STATES[player]
+        elif len(self.moves) == len(self._geometry.cell_indices):
+            self.state = BoardState.DRAW
         else:
-            self[pos] = CellState.WHITE
-            self.whose_move = Player.BLACK
-        self.update_state()
+            self.state = BoardState.GAMING
 
     def undo_move(self) -> None:
         """Отменяет ход. Пересчитывает все атрибуты класса."""
-        self[self.moves[-1]] = CellState.EMPTY
-        if self.whose_move == Player.BLACK:
-            self.whose_move = Player.WHITE
-        else:
-            self.whose_move = Player.BLACK
+        index = self._index(self.moves[-1])
+        self.whose_move = _OPPONENT[self.whose_move]
+        self.hash_key ^= self._geometry.zobrist_side
+        self._remove_stone(self.whose_move, index)
         self.state = BoardState.GAMING
         self.moves.pop()
 
-    @staticmethod
-    def in_field(pos: Tuple[int, int]) -> bool:
+    def load_moves(self, moves: List[Tuple[int, int]]) -> None:
+        """Делает ходы moves подряд. В отличие от do_move, состояние игры
+        вычисляется один раз, после последнего хода, поэтому moves не
+        должны продолжаться после конца игры.
+        """
+        for pos in moves:
+            index = self._index(pos)
+            if self._cells[index]:
+                raise ValueError("Клетка {} уже занята.".format(pos))
+            self.moves.append(pos)
+            self._add_stone(self.whose_move, index)
+            self.whose_move = _OPPONENT[self.whose_move]
+            self.hash_key ^= self._geometry.zobrist_side
+        self.update_state()
+
+    @classmethod
+    def from_position(cls, position: Position) -> "Board":
+        """Создаёт доску в позиции position."""
+        board = cls(position.size, position.win_length, position.renju)
+        board.load_moves(position.moves)
+        return board
+
+    def snapshot(self) -> Position:
+        """Возвращает позицию на доске."""
+        return Position(self.size, self.win_length, self.renju, self.moves)
+
+    def restore(self, position: Position) -> None:
+        """Приводит доску к позиции position, отменяя ходы до общего
+        начала партий и делая недостающие. Размеры поля и правила должны
+        совпадать.
+        """
+        if position.size != self.size or \
+                position.win_length != self.win_length or \
+                position.renju != self.renju:
+            raise ValueError("Позиция для другого поля или других правил.")
+        moves = position.moves
+        common = 0
+        for own, other in zip(self.moves, moves):
+            if own != other:
+                break
+            common += 1
+        while len(self.moves) > common:
+            self.undo_move()
+        self.load_moves(moves[common:])
+
+    def copy(self) -> "Board":
+        """Возвращает независимую копию доски. Таблицы, общие для всех
+        досок с такими размерами, не копируются.
+        """
+        board = Board.__new__(Board)
+        board.__dict__.update(self.__dict__)
+        board._stones = list(self._stones)
+        board._cells = bytearray(self._cells)
+        board._window_counts = [list(counts)
+                                for counts in self._window_counts]
+        board._scores = list(self._scores)
+        board._pure_windows = [[set(windows) for windows in player]
+                               for player in self._pure_windows]
+        board._near_stones = list(self._near_stones)
+        board._candidates = set(self._candidates)
+        if self._line_codes is not None:
+            board._line_codes = list(self._line_codes)
+        board.moves = list(self.moves)
+        return board
+
+    def _add_stone(self, player: Player, index: int) -> None:
+        """Ставит фишку игрока в пустую клетку с номером index."""
+        self._stones[player] |= 1 << index
+        self._cells[index] = player + 1
+        self.hash_key ^= self._geometry.zobrist[player][index]
+        own = self._window_counts[player]
+        opponent = self._window_counts[1 - player]
+        own_pure = self._pure_windows[player]
+        opponent_pure = self._pure_windows[1 - player]
+        tracked = self._tracked_count
+        weights = self._weights
+        for window in self._geometry.cell_windows[index]:
+            count = own[window]
+            own[window] = count + 1
+            opponent_count = opponent[window]
+            if not opponent_count:
+                self._scores[player] += weights[count + 1] - weights[count]
+                if count >= tracked:
+                    own_pure[count].discard(window)
+                if tracked <= count + 1 < len(own_pure):
+                    own_pure[count + 1].add(window)
+            elif not count:
+                self._scores[1 - player] -= weights[opponent_count]
+                if tracked <= opponent_count < len(opponent_pure):
+                    opponent_pure[opponent_count].discard(window)
+        near_stones = self._near_stones
+        cells = self._cells
+        for neighbour in self._neighbours[index]:
+            near_stones[neighbour] += 1
+            if not cells[neighbour]:
+                self._candidates.add(neighbour)
+        self._candidates.discard(index)
+        if self._line_codes is not None:
+            codes = self._line_codes
+            color = player + 1
+            slots = self._line_slots[index]
+            for i in range(0, len(slots), 2):
+                codes[slots[i]] += slots[i + 1] * color
+
+    def _remove_stone(self, player: Player, index: int) -> None:
+        """Убирает фишку игрока из клетки с номером index."""
+        self._stones[player] &= ~(1 << index)
+        self._cells[index] = CellState.EMPTY
+        self.hash_key ^= self._geometry.zobrist[player][index]
+        own = self._window_counts[player]
+        opponent = self._window_counts[1 - player]
+        own_pure = self._pure_windows[player]
+        opponent_pure = self._pure_windows[1 - player]
+        tracked = self._tracked_count
+        weights = self._weights
+        for window in self._geometry.cell_windows[index]:
+            count = own[window] - 1
+            own[window] = count
+            opponent_count = opponent[window]
+            if not opponent_count:
+                self._scores[player] -= weights[count + 1] - weights[count]
+                if tracked <= count + 1 < len(own_pure):
+                    own_pure[count + 1].discard(window)
+                if count >= tracked:
+                    own_pure[count].add(window)
+            elif not count:
+                self._scores[1 - player] += weights[opponent_count]
+                if tracked <= opponent_count < len(opponent_pure):
+                    opponent_pure[opponent_count].add(window)
+        near_stones = self._near_stones
+        for neighbour in self._neighbours[index]:
+            near_stones[neighbour] -= 1
+            if not near_stones[neighbour]:
+                self._candidates.discard(neighbour)
+        if near_stones[index]:
+            self._candidates.add(index)
+        if self._line_codes is not None:
+            codes = self._line_codes
+            color = player + 1
+            slots = self._line_slots[index]
+            for i in range(0, len(slots), 2):
+                codes[slots[i]] -= slots[i + 1] * color
+
+    def get_score(self, player: Player) -> int:
+        """Возвращает сумму весов const.RATE_WEIGHTS по всем окнам, в
+        которых есть только фишки игрока player.
+        """
+        return self._scores[player]
+
+    def _is_forbidden(self, index: int) -> bool:
+        """Проверяет, запрещена ли чёрным пустая клетка с номером index.
+        Доска должна быть создана с правилами рэндзю.
+        """
+        codes = self._line_codes
+        patterns = self._patterns
+        size = len(self._cells)
+        return rules.is_forbidden_value(
+            patterns[codes[index]] + patterns[codes[size + index]] +
+            patterns[codes[2 * size + index]] +
+            patterns[codes[3 * size + index]])
+
+    def is_forbidden(self, pos: Tuple[int, int]) -> bool:
+        """Проверяет, запрещён ли ход в пустую клетку pos тому, кто
+        сейчас ходит.
+        """
+        return self._line_codes is not None and \
+            self.whose_move == Player.BLACK and \
+            self._is_forbidden(self._index(pos))
+
+    def get_candidates(self) -> List[Tuple[int, int]]:
+        """Возвращает пустые клетки, рядом с которыми есть фишки (кроме
+        запрещённых для того, кто сейчас ходит).
+        """
+        positions = self._geometry.positions
+        if self._line_codes is not None and \
+                self.whose_move == Player.BLACK:
+            return [positions[index] for index in self._candidates
+                    if not self._is_forbidden(index)]
+        return [positions[index] for index in self._candidates]
+
+    def get_window_gaps(self, player: Player, count: int) \
+            -> Set[Tuple[int, int]]:
+        """Возвращает пустые клетки окон, в которых ровно count фишек
+        игрока player и нет фишек соперника. Поддерживается только
+        win_length - 3 <= count < win_length. Клетки, запрещённые
+        чёрным, для чёрных не возвращаются.
+        """
+        positions = self._geometry.positions
+        windows = self._geometry.windows
+        cells = self._cells
+        if self._line_codes is not None and player == Player.BLACK:
+            return {positions[index]
+                    for window in self._pure_windows[player][count]
+                    for index in windows[window]
+                    if not cells[index] and not self._is_forbidden(index)}
+        return {positions[index]
+                for window in self._pure_windows[player][count]
+                for index in windows[window] if not cells[index]}
+
+    def get_winning_cells(self, player: Player) -> Set[Tuple[int, int]]:
+        """Возвращает клетки, ход в которые сразу даёт игроку player
+        линию из win_length фишек.
+        """
+        return self.get_window_gaps(player, self.win_length - 1)
+
+    @property
+    def geometry(self) -> geometry.Geometry:
+        """Таблицы поля этой доски."""
+        return self._geometry
+
+    def in_field(self, pos: Tuple[int, int]) -> bool:
         """Проверяет, что клетка находится в пределах игрового поля."""
-        return 0 <= pos[0] < const.BOARD_SIZE[0] and \
-            0 <= pos[1] < const.BOARD_SIZE[1]
+        return 0 <= pos[0] < self._height and 0 <= pos[1] < self._width
+
+    def _bits_of(self, state: CellState) -> int:
+        """Возвращает битборд клеток с заданным состоянием."""
+        if state:
+            return self._stones[state - 1]
+        return self._geometry.field_mask & \
+            ~(self._stones[0] | self._stones[1])
 
     def find_max_line(self, start: Tuple[int, int]) \
             -> Tuple[int, Tuple[Tuple[int, int], Tuple[int, int]]]:
         """Возвращает длину, а также координаты начала и конца самой длинной
         линии, состоящей из фишек одного цвета, проходящей через клетку start.
         """
+        start_index = self._index(start)
+        bits = self._bits_of(self[start])
         max_length = 1
         line = (start, start)
-        vectors = [(1, -1), (1, 0), (1, 1), (0, 1)]
-        for vector in vectors:
-            length = 1
-            pos_1 = (start[0] + vector[0], start[1] + vector[1])
-            # Двигаем pos_1, пока в pos_1 стоит фишка того же цвета,
-            # что и фишка в start.
-            while Board.in_field(pos_1) and self[pos_1] == self[start]:
-                length += 1
-                pos_1 = (pos_1[0] + vector[0], pos_1[1] + vector[1])
-            # Сдвигаем pos_1 обратно, чтобы pos_1 указывал на фишку одного
-            # цвета, что и start.
-            pos_1 = (pos_1[0] - vector[0], pos_1[1] - vector[1])
-            # Двигаем pos_2 аналогично движению pos_1, но в противоположную
-            # сторону от start.
-            pos_2 = (start[0] - vector[0], start[1] - vector[1])
-            while Board.in_field(pos_2) and self[pos_2] == self[start]:
-                length += 1
-                pos_2 = (pos_2[0] - vector[0], pos_2[1] - vector[1])
-            pos_2 = (pos_2[0] + vector[0], pos_2[1] + vector[1])
+        for shift in self._shifts:
+            # Двигаем index_1 вперёд, пока в следующей клетке стоит фишка
+            # того же цвета. Выход за нижний край или в пустой столбец
+            # даёт нулевой бит, выход за верхний - отрицательный номер.
+            index_1 = start_index
+            while bits >> (index_1 + shift) & 1:
+                index_1 += shift
+            index_2 = start_index
+            while index_2 >= shift and bits >> (index_2 - shift) & 1:
+                index_2 -= shift
+            length = (index_1 - index_2) // shift + 1
             if max_length < length:
                 max_length = length
-                line = (pos_1, pos_2)
+                line = (divmod(index_1, self._stride),
+                        divmod(index_2, self._stride))
         return max_length, line
 
+    def has_line(self, player: Player, length: int) -> bool:
+        """Проверяет, есть ли у игрока линия не короче length фишек.
+        Проверка выполняется сдвигами и побитовыми И для всех направлений.
+        """
+        bits = self._stones[player]
+        for shifts in _chain_shifts(self._stride, length):
+            line = bits
+            for shift in shifts:
+                line &= line >> shift
+            if line:
+                return True
+        return False
+
     def update_state(self) -> None:
         """Обновляет состояние доски."""
         if not self.moves:
             self.state = BoardState.GAMING
             return
-        max_length = self.find_max_line(self.moves[-1])[0]
-        if max_length >= const.WIN_ROW_LENGTH:
-            if self[self.moves[-1]] == CellState.BLACK:
-                self.state = BoardState.BLACK_WINS
-            else:
-                self.state = BoardState.WHITE_WINS
-        elif len(self.moves) == const.BOARD_SIZE[0] * const.BOARD_SIZE[1]:
+        last_player = self._cells[self._index(self.moves[-1])] - 1
+        if self.has_line(last_player, self.win_length):
+            self.state = _WIN_STATES[last_player]
+        elif len(self.moves) == len(self._geometry.cell_indices):
             self.state = BoardState.DRAW
         else:
             self.state = BoardState.GAMING
@@ -0,0 +1,260 @@
+"""Модуль, реализующий дебютную книгу.
+
+Позиция в книге задаётся ключом, одинаковым для всех симметричных ей
+позиций (поворотов и отражений доски): из ключей Зобриста всех
+симметричных вариантов выбирается наименьший, а ход хранится в той же
+системе координат. Книга хранится в двоичном файле с записями,
+отсортированными по ключу. Файл отображается в память и при поиске не
+разбирается целиком.
+
+Построение книги по результатам партий без окна:
+    python -m renju.book arena.jsonl --output book.bin --depth 8
+"""
+
+from .board import Board
+from .geometry import get_geometry
+from . import const
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import argparse
+import json
+import mmap
+import struct
+import sys
+
+_MAGIC = b"RNJB"
+_VERSION = 1
+# Заголовок: сигнатура, версия, высота и ширина поля, длина выигрышного
+# ряда, число записей.
+_HEADER = struct.Struct("<4sHBBBxI")
+# Запись: ключ позиции, ход, число партий, средний результат хода
+# в тысячных (1000 - победа сделавшего ход).
+_RECORD = struct.Struct("<QBBHH")
+
+# Преобразования клетки (row, column) поля size x size. Первые четыре
+# (тождественное, поворот на 180 градусов и отражения) применимы и к
+# прямоугольному полю.
+_SYMMETRIES = [
+    lambda r, c, h, w: (r, c),
+    lambda r, c, h, w: (h - 1 - r, w - 1 - c),
+    lambda r, c, h, w: (r, w - 1 - c),
+    lambda r, c, h, w: (h - 1 - r, c),
+    lambda r, c, h, w: (c, h - 1 - r),
+    lambda r, c, h, w: (w - 1 - c, r),
+    lambda r, c, h, w: (c, r),
+    lambda r, c, h, w: (w - 1 - c, h - 1 - r),
+]
+# Номер обратного преобразования для каждого из _SYMMETRIES.
+_INVERSE = [0, 1, 2, 3, 5, 4, 6, 7]
+
+
+def _get_symmetries(height: int, width: int) -> range:
+    """Возвращает номера преобразований, переводящих поле в себя."""
+    return range(8 if height == width else 4)
+
+
+def transform(pos: Tuple[int, int], symmetry: int,
+              size: Tuple[int, int]) -> Tuple[int, int]:
+    """Применяет к клетке преобразование с номером symmetry."""
+    return _SYMMETRIES[symmetry](pos[0], pos[1], size[0], size[1])
+
+
+def get_canonical_key(moves: List[Tuple[int, int]],
+                      size: Tuple[int, int] = const.BOARD_SIZE,
+                      win_length: int = const.WIN_ROW_LENGTH) \
+        -> Tuple[int, int]:
+    """Возвращает ключ позиции, общий для всех симметричных ей позиций,
+    и номер преобразования, переводящего позицию в каноническую.
+    """
+    geometry = get_geometry(size[0], size[1], win_length)
+    zobrist = geometry.zobrist
+    stride = geometry.stride
+    best = (-1, 0)
+    for symmetry in _get_symmetries(*size):
+        key = 0
+        for i, (row, column) in enumerate(moves):
+            row, column = _SYMMETRIES[symmetry](row, column, *size)
+            key ^= zobrist[i & 1][row * stride + column]
+        if best[0] < 0 or key < best[0]:
+            best = (key, symmetry)
+    return best
+
+
+class OpeningBook:
+    """Дебютная книга, открытая из файла. Считает число найденных и не
+    найденных в ней позиций.
+    """
+
+    def __init__(self, path: Path) -> None:
+        with open(str(path), "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._data) < _HEADER.size:
+            raise ValueError("Файл дебютной книги повреждён")
+        magic, version, height, width, win_length, count = \
+            _HEADER.unpack_from(self._data)
+        if magic != _MAGIC or version != _VERSION or \
+                len(self._data) != _HEADER.size + count * _RECORD.size:
+            raise ValueError("Файл дебютной книги повреждён")
+        self.size = (height, width)
+        self.win_length = win_length
+        self._count = count
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        """Закрывает файл книги."""
+        self._data.close()
+
+    def _find(self, key: int) -> Optional[Tuple[int, int, int, int, int]]:
+        """Двоичным поиском находит запись с ключом key."""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            record = _RECORD.unpack_from(
+                self._data, _HEADER.size + middle * _RECORD.size)
+            if record[0] < key:
+                low = middle + 1
+            elif record[0] > key:
+                high = middle
+            else:
+                return record
+        return None
+
+    def probe(self, board: Board) -> Optional[Tuple[int, int]]:
+        """Возвращает ход из книги для позиции на доске или None."""
+        if board.size != self.size or board.win_length != self.win_length:
+            return None
+        key, symmetry = get_canonical_key(board.moves, self.size,
+                                          self.win_length)
+        record = self._find(key)
+        move = None
+        if record is not None:
+            move = transform(record[1:3], _INVERSE[symmetry], self.size)
+            # Совпадение ключей разных позиций маловероятно, но ход из
+            # книги в любом случае должен быть допустимым.
+            if not board.in_field(move) or board[move] or \
+                    board.is_forbidden(move):
+                move = None
+        if move is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return move
+
+
+_book: Optional[OpeningBook] = None
+_book_path: Optional[Path] = None
+
+
+def get_book() -> Optional[OpeningBook]:
+    """Возвращает книгу из файла const.BOOK_PATH (открывая его при первом
+    обращении) или None, если файла нет или он повреждён.
+    """
+    global _book, _book_path
+    if _book_path != const.BOOK_PATH:
+        if _book is not None:
+            _book.close()
+        _book = None
+        _book_path = const.BOOK_PATH
+        try:
+            _book = OpeningBook(const.BOOK_PATH)
+        except (OSError, ValueError):
+            pass
+    return _book
+
+
+def collect_moves(results: Iterable[Dict], depth: int) \
+        -> Dict[int, Dict[Tuple[int, int], List[float]]]:
+    """Для каждой позиции первых depth ходов партий results собирает
+    число партий и сумму результатов каждого хода (в системе координат
+    канонической позиции).
+    """
+    positions: Dict[int, Dict[Tuple[int, int], List[float]]] = dict()
+    size = tuple(const.BOARD_SIZE)
+    for result in results:
+        moves = [tuple(pos) for pos in result["moves"]]
+        for ply in range(min(depth, len(moves))):
+            key, symmetry = get_canonical_key(moves[:ply], size)
+            move = transform(moves[ply], symmetry, size)
+            color = "black" if ply % 2 == 0 else "white"
+            if result["winner"] == color:
+                score = 1.0
+            elif result["winner"] == "draw":
+                score = 0.5
+            else:
+                score = 0.0
+            stats = positions.setdefault(key, dict()).setdefault(
+                move, [0, 0.0])
+            stats[0] += 1
+            stats[1] += score
+    return positions
+
+
+def build_book(results: Iterable[Dict], path: Path,
+               depth: int = const.BOOK_DEPTH,
+               min_games: int = const.BOOK_MIN_GAMES) -> int:
+    """Строит книгу по результатам партий и записывает её в файл path.
+    Для каждой позиции выбирается ход с лучшим средним результатом среди
+    сыгранных хотя бы min_games раз. Возвращает число записей.
+    """
+    records = list()
+    for key, moves in collect_moves(results, depth).items():
+        best = None
+        for move, (games, score) in moves.items():
+            if games < min_games:
+                continue
+            rate = (score / games, games)
+            if best is None or rate > best[0]:
+                best = (rate, move)
+        if best is not None:
+            (rate, games), move = best
+            records.append((key, move[0], move[1], min(games, 0xFFFF),
+                            round(rate * 1000)))
+    records.sort()
+    with open(str(path), "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, const.BOARD_SIZE[0],
+                             const.BOARD_SIZE[1], const.WIN_ROW_LENGTH,
+                             len(records)))
+        for record in records:
+            f.write(_RECORD.pack(*record))
+    return len(records)
+
+
+def read_results(paths: List[str]) -> Iterable[Dict]:
+    """Построчно читает результаты партий из файлов JSONL."""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Парсинг аргументов запуска."""
+    parser = argparse.ArgumentParser(
+        description="Построение дебютной книги по результатам партий.")
+    parser.add_argument("results", nargs="+",
+                        help="файлы JSONL с результатами партий")
+    parser.add_argument("--output", default=str(const.BOOK_PATH),
+                        help="файл книги")
+    parser.add_argument("--depth", type=int, default=const.BOOK_DEPTH,
+                        help="число первых ходов партии, попадающих в книгу")
+    parser.add_argument("--min-games", type=int,
+                        default=const.BOOK_MIN_GAMES,
+                        help="минимальное число партий с ходом")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Точка входа."""
+    args = parse_args(argv)
+    count = build_book(read_results(args.results), Path(args.output),
+                       args.depth, args.min_games)
+    print("Позиций в книге: %d" % count)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
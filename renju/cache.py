@@ -0,0 +1,83 @@
+"""Модуль, сохраняющий предвычисленные таблицы в файлах на диске.
+
+Таблица - массив целых чисел одного типа array. При первом обращении
+она строится и записывается в каталог const.CACHE_DIR, а при следующих
+запусках файл отображается в память и не разбирается: страницы файла
+общие для всех процессов, которые его открыли.
+
+Имя файла включает имя таблицы, её параметры и версию алгоритма
+построения, заголовок файла - версию формата, тип и число элементов.
+Файл с неподходящим заголовком строится заново. Таблица сначала
+записывается во временный файл, который затем переименовывается,
+поэтому одновременно запущенные процессы не видят недописанных файлов.
+Если каталог недоступен, таблица просто строится в памяти.
+"""
+
+from . import const
+from array import array
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Sequence
+import mmap
+import os
+import struct
+import tempfile
+
+_MAGIC = b"RNJC"
+_VERSION = 1
+# Заголовок: сигнатура, версия формата, тип элементов array и их число.
+# Элементы записываются в порядке байт этой машины.
+_HEADER = struct.Struct("<4sHcxQ")
+
+
+def _map_table(path: Path, typecode: str) -> Optional[memoryview]:
+    """Отображает файл таблицы в память. Возвращает None, если файла нет
+    или его заголовок не подходит.
+    """
+    try:
+        with open(str(path), "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(data) >= _HEADER.size:
+        magic, version, code, count = _HEADER.unpack_from(data)
+        if magic == _MAGIC and version == _VERSION and \
+                code == typecode.encode() and len(data) == \
+                _HEADER.size + count * array(typecode).itemsize:
+            return memoryview(data)[_HEADER.size:].cast(typecode)
+    data.close()
+    return None
+
+
+def _write_table(path: Path, table: array) -> None:
+    """Записывает таблицу в файл path через временный файл."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, table.typecode.encode(),
+                                 len(table)))
+            f.write(table.tobytes())
+        os.replace(name, str(path))
+    except BaseException:
+        os.unlink(name)
+        raise
+
+
+def load_table(name: str, typecode: str,
+               build: Callable[[], Iterable[int]]) -> Sequence[int]:
+    """Возвращает таблицу name с элементами типа typecode из кэша или,
+    если её там нет, строит функцией build и сохраняет в кэш. name
+    должно меняться вместе с параметрами и алгоритмом построения.
+    """
+    if not const.USE_TABLE_CACHE:
+        return array(typecode, build())
+    path = const.CACHE_DIR / (name + ".bin")
+    table = _map_table(path, typecode)
+    if table is not None:
+        return table
+    table = array(typecode, build())
+    try:
+        _write_table(path, table)
+    except OSError:
+        pass
+    return table
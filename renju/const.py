@@ -1,6 +1,7 @@
 """Модуль, описывающий константы, используемые в проекте."""
 
 from pathlib import Path
+import os
 
 
 class Color:
@@ -28,9 +29,118 @@ MENU_CENTER = (WINDOW_WEIGHT // 2, WINDOW_HEIGHT - MENU_HEIGHT // 2)
 GAME_TIME_LIMIT = 60
 # Длина выигрышного ряда
 WIN_ROW_LENGTH = 5
+# Запрещены ли чёрным двойная тройка, двойная четвёрка и длинный ряд
+# (правила рэндзю); иначе игра идёт по правилам гомоку
+RENJU_RULES = False
 # Максимальная глубина рекурсии в алгоритме минимакс
 MAX_MINIMAX_DEPTH = 1
+# Веса окон из WIN_ROW_LENGTH клеток в оценочной функции в зависимости от
+# числа фишек одного цвета в окне
+RATE_WEIGHTS = [0, 0, 100, 200, 4000000]
+# Максимальное расстояние (по каждой координате) от ближайшей фишки до
+# клетки, которую перебор рассматривает как возможный ход
+CANDIDATE_DISTANCE = 2
+# Алгоритм выбора хода компьютером: "minimax", "alphabeta", "parallel"
+# или "mcts"
+SEARCH_MODE = "alphabeta"
+# Режим параллельного перебора: "split" (деление ходов корня между
+# процессами) или "smp" (независимые процессы с разным порядком ходов)
+PARALLEL_MODE = "split"
+# Число процессов параллельного перебора
+PARALLEL_WORKERS = os.cpu_count() or 1
+# Максимальная глубина итеративного углубления в переборе с отсечениями
+MAX_SEARCH_DEPTH = 8
+# Маска числа узлов, при котором перебор проверяет оставшееся время:
+# проверка делается раз в SEARCH_CHECK_PERIOD + 1 узлов
+SEARCH_CHECK_PERIOD = 255
+# Полуширина окна стремления вокруг оценки предыдущей итерации
+ASPIRATION_WINDOW = 1000
+# Число ходов-убийц, запоминаемых для каждой глубины перебора
+KILLER_MOVES = 2
+# Печатать ли итоги каждой глубины перебора в поток ошибок
+SEARCH_LOG = False
+# Искать ли форсированный выигрыш угрозами перед основным перебором
+USE_THREAT_SEARCH = True
+# Доля времени на ход, отводимая поиску форсированного выигрыша
+THREAT_TIME_SHARE = 0.2
+# Максимальное число узлов в поиске форсированного выигрыша
+THREAT_MAX_NODES = 20000
+# Максимальное число угроз атакующего в поиске непрерывными четвёрками
+VCF_MAX_DEPTH = 12
+# Максимальное число угроз атакующего в поиске непрерывными угрозами
+VCT_MAX_DEPTH = 4
+# Объём памяти под таблицу транспозиций в байтах
+TT_MEMORY = 16 * 2 ** 20
+# Число итераций поиска Монте-Карло на ход (0 - только по времени)
+MCTS_ITERATIONS = 0
+# Максимальное число узлов дерева поиска Монте-Карло
+MCTS_MAX_NODES = 2 ** 19
+# Коэффициент исследования в формуле UCT
+MCTS_EXPLORATION = 1.0
+# Максимальное число случайных ходов в одном доигрывании
+MCTS_ROLLOUT_DEPTH = 16
+# Оценка позиции, соответствующая вероятности победы около 73%, для
+# недоигранных позиций
+MCTS_EVAL_SCALE = 200
+# На сколько ходов вперёд распределяется оставшееся время компьютера
+MOVES_TO_GO = 30
+# Думает ли компьютер над ожидаемым ответом, пока ходит человек
+PONDER = True
+# Доля GAME_TIME_LIMIT, которую компьютер не тратит на обдумывание
+TIME_RESERVE_SHARE = 0.05
+# Минимальное время на обдумывание хода в секундах
+MIN_MOVE_TIME = 0.05
+# Число случайных ходов в начале партий компьютера против компьютера
+ARENA_OPENING_MOVES = 4
+# Случайные ходы дебюта делаются не дальше этого расстояния от центра
+ARENA_OPENING_RADIUS = 3
+# Объём памяти под таблицу транспозиций в партиях без окна
+ARENA_TT_MEMORY = 2 ** 20
+# Глубина перебора при разборе сохранённых партий
+ANALYSIS_DEPTH = 4
+# Сколько позиций на процесс разбор партий держит в очереди пула
+ANALYSIS_QUEUE = 4
+# Число позиций, признаки которых вычисляются одной пачкой при
+# настройке весов оценочной функции
+TUNING_BATCH = 4096
+# Число строк файла признаков, обрабатываемых за раз при подборе весов
+TUNING_CHUNK = 2 ** 16
+# Максимальное число шагов метода Ньютона при подборе весов
+TUNING_ITERATIONS = 50
+# Штраф за квадрат весов при подборе (в единицах MCTS_EVAL_SCALE)
+TUNING_REGULARIZATION = 1e-4
+# Адрес и порт сервера партий
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 7777
+# Число процессов, в которых сервер выбирает ходы компьютера
+SERVER_WORKERS = PARALLEL_WORKERS
+# Число запросов к компьютеру, которые могут ждать свободного процесса;
+# остальные отклоняются
+SERVER_MAX_QUEUE = 64
+# Число партий, состояние компьютера в которых хранит каждый процесс
+# сервера; таблица транспозиций каждой партии занимает ARENA_TT_MEMORY
+SERVER_ENGINES = 8
 # Условная бесконечность в алгоритме минимакс
 MINIMAX_INF = 10 ** 10
+# Хранить ли предвычисленные таблицы движка в файлах на диске
+USE_TABLE_CACHE = True
+# Каталог для файлов предвычисленных таблиц
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME",
+                                str(Path.home() / ".cache"))) / "renju"
 # Путь до файла сохранения игры
 SAVE_PATH = Path("./save.txt")
+# Путь до журнала ходов текущей игры
+JOURNAL_PATH = Path("./journal.bin")
+# Путь до файла весов оценочной функции, подобранных renju.tuning
+WEIGHTS_PATH = Path("./weights.json")
+# Путь до файла дебютной книги
+BOOK_PATH = Path("./book.bin")
+# Пользоваться ли дебютной книгой
+USE_BOOK = True
+# Книга используется, пока на доске меньше этого числа фишек
+BOOK_DEPTH = 8
+# Ход попадает в книгу, если он сделан хотя бы в стольких партиях
+BOOK_MIN_GAMES = 2
+# Число записей индекса позиций, сортируемых в памяти при импорте
+# партий в базу
+GAMESTORE_SORT_CHUNK = 2 ** 18
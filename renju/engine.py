@@ -2,22 +2,49 @@
 
 from .board import Board, BoardState, CellState, Player
 from .game import Game
-from . import const
-from typing import Tuple
+from .stats import IterationStats, SearchStats
+from . import book, const, mcts, parallel, search, threats, tt
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import threading
+import time
 
 
-def minimax(board: Board,
-            depth: int = 0) -> Tuple[int, Tuple[int, int]]:
+def minimax(board: Board, depth: int = 0,
+            stats: Optional[SearchStats] = None) \
+        -> Tuple[int, Tuple[int, int]]:
     """Возвращает оценку ситуации на доске и клетку,
-    в которую нужно сделать ход.
+    в которую нужно сделать ход. Если передан stats, в него
+    записываются счётчики перебора.
     """
+    if stats is None:
+        return _minimax(board, depth, None)
+    start = time.monotonic()
+    rate, move = _minimax(board, depth, stats)
+    stats.time += time.monotonic() - start
+    stats.add_iteration(IterationStats(
+        const.MAX_MINIMAX_DEPTH - depth, rate, move, stats.nodes,
+        stats.time, [move]))
+    return rate, move
+
+
+def _minimax(board: Board, depth: int,
+             stats: Optional[SearchStats]) -> Tuple[int, Tuple[int, int]]:
+    """Перебор minimax. Счётчики stats увеличиваются, только если
+    статистика собирается.
+    """
+    if stats is not None:
+        stats.nodes += 1
     if depth == const.MAX_MINIMAX_DEPTH:
-        return rate_function(board), (-1, -1)
+        if stats is not None:
+            stats.leaves += 1
+        return fast_rate_function(board), (-1, -1)
     rate = -const.MINIMAX_INF - 1
     move = (-1, -1)
-    for row in range(const.BOARD_SIZE[0]):
-        for column in range(const.BOARD_SIZE[1]):
-            if board[row, column]:
+    for row in range(board.size[0]):
+        for column in range(board.size[1]):
+            if board[row, column] or board.is_forbidden((row, column)):
                 continue
             board.do_move((row, column))
             if board.state in (BoardState.WHITE_WINS, BoardState.BLACK_WINS):
@@ -26,7 +53,7 @@ def minimax(board: Board,
             elif board.state == BoardState.DRAW:
                 cur_rate = 0
             else:
-                cur_rate = -minimax(board, depth + 1)[0]
+                cur_rate = -_minimax(board, depth + 1, stats)[0]
             board.undo_move()
             if rate < cur_rate or move == (-1, -1):
                 rate = cur_rate
@@ -41,42 +68,269 @@ def rate_function(board: Board) -> int:
     if board.state in (BoardState.WHITE_WINS, BoardState.BLACK_WINS):
         return const.MINIMAX_INF
     score = 0
-    k = [0, 0, 100, 200, 4000000]
-    vectors = [(1, -1), (1, 0), (1, 1), (0, 1)]
-    for row in range(const.BOARD_SIZE[0]):
-        for column in range(const.BOARD_SIZE[1]):
-            for vector in vectors:
-                if not Board.in_field(
-                        (row + vector[0] * (const.WIN_ROW_LENGTH - 1),
-                         column + vector[1] * (const.WIN_ROW_LENGTH - 1))):
-                    continue
-                r = row
-                c = column
-                count_black = 0
-                count_white = 0
-                for i in range(const.WIN_ROW_LENGTH):
-                    if board[r, c] == CellState.BLACK:
-                        count_black += 1
-                    elif board[r, c] == CellState.WHITE:
-                        count_white += 1
-                    r += vector[0]
-                    c += vector[1]
-                if count_black != 0 and count_white != 0:
-                    continue
-                if board.whose_move == Player.BLACK:
-                    if count_black != 0:
-                        score += k[count_black]
-                    elif count_white != 0:
-                        score -= k[count_white]
-                else:
-                    if count_white != 0:
-                        score += k[count_white]
-                    elif count_black != 0:
-                        score -= k[count_black]
+    k = list(const.RATE_WEIGHTS)
+    k += [k[-1]] * (board.win_length - len(k))
+    cells = board.get_raw_cells()
+    # Окна поля и их клетки берутся из таблиц доски, поэтому проверять
+    # выход за границы поля не нужно.
+    for window in board.geometry.windows:
+        count_black = 0
+        count_white = 0
+        for index in window:
+            if cells[index] == CellState.BLACK:
+                count_black += 1
+            elif cells[index] == CellState.WHITE:
+                count_white += 1
+        if count_black != 0 and count_white != 0:
+            continue
+        if board.whose_move == Player.BLACK:
+            if count_black != 0:
+                score += k[count_black]
+            elif count_white != 0:
+                score -= k[count_white]
+        else:
+            if count_white != 0:
+                score += k[count_white]
+            elif count_black != 0:
+                score -= k[count_black]
     return score
 
 
+def fast_rate_function(board: Board) -> int:
+    """Возвращает ту же оценку, что и rate_function, за O(1), используя
+    суммы весов, которые доска поддерживает при каждом ходе.
+    """
+    if board.state in (BoardState.WHITE_WINS, BoardState.BLACK_WINS):
+        return const.MINIMAX_INF
+    player = board.whose_move
+    return board.get_score(player) - board.get_score(1 - player)
+
+
+def load_weights(path: Optional[Path] = None) -> bool:
+    """Заменяет const.RATE_WEIGHTS весами из файла path (по умолчанию
+    const.WEIGHTS_PATH), записанного renju.tuning. Возвращает False и
+    оставляет веса прежними, если файла нет, он повреждён или записан
+    для другой длины выигрышного ряда. Доски, созданные раньше, считают
+    оценку со старыми весами.
+    """
+    if path is None:
+        path = const.WEIGHTS_PATH
+    try:
+        with open(str(path), encoding="utf-8") as f:
+            data = json.load(f)
+        weights = [int(weight) for weight in data["weights"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    if data.get("win_length") != const.WIN_ROW_LENGTH or \
+            len(weights) != const.WIN_ROW_LENGTH:
+        return False
+    const.RATE_WEIGHTS = weights
+    return True
+
+
+def get_time_budget(game: Game) -> float:
+    """Возвращает время в секундах, которое компьютер может потратить на
+    текущий ход, не рискуя проиграть по времени.
+    """
+    remaining = game.get_times()[game.board.whose_move.value]
+    reserve = const.GAME_TIME_LIMIT * const.TIME_RESERVE_SHARE
+    return max((remaining - reserve) / const.MOVES_TO_GO,
+               const.MIN_MOVE_TIME)
+
+
+def probe_book(board: Board) -> Optional[Tuple[int, int]]:
+    """Возвращает ход из дебютной книги или None, если книга выключена,
+    отсутствует или не знает позиции.
+    """
+    if not const.USE_BOOK or len(board.moves) >= const.BOOK_DEPTH:
+        return None
+    opening_book = book.get_book()
+    if opening_book is None:
+        return None
+    return opening_book.probe(board)
+
+
+class Engine:
+    """Состояние компьютера, которое живёт столько же, сколько партия.
+
+    Между ходами сохраняются таблица транспозиций, эвристика истории,
+    ходы-убийцы, дерево поиска Монте-Карло и главная линия последнего
+    перебора вместе с позицией, из которой он начинался. Если соперник
+    ответил ожидаемым ходом, следующий перебор начинается с хода главной
+    линии, на глубине, на которую она уже просчитана, с окном стремления
+    вокруг её оценки и со сдвинутыми ходами-убийцами. Иначе ходы-убийцы
+    сбрасываются, а таблица транспозиций и история остаются: записи
+    таблицы привязаны к позициям, а не к ходам партии.
+
+    memory - размер таблицы транспозиций в байтах. Объект можно
+    использовать из нескольких потоков: состояние читается и
+    записывается под блокировкой, а перебор получает копии ходов-убийц и
+    истории.
+    """
+
+    def __init__(self, memory: int = const.TT_MEMORY) -> None:
+        self.table = tt.TranspositionTable(memory)
+        self.mcts = mcts.MonteCarloSearch(fast_rate_function)
+        self.predicted_hits = 0
+        self.predicted_misses = 0
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self) -> None:
+        """Забывает всё, кроме таблицы транспозиций."""
+        self.history: List[Dict[Tuple[int, int], int]] = [dict(), dict()]
+        self.killers: List[List[Tuple[int, int]]] = list()
+        self.pv: List[Tuple[int, int]] = list()
+        self.pv_root: List[Tuple[int, int]] = list()
+        self.score = 0
+        self.depth = 0
+
+    def reset(self) -> None:
+        """Очищает всё состояние для новой партии. Фоновые задачи с этим
+        состоянием нужно сначала отменить (background.EngineJob.cancel):
+        таблица транспозиций заполняется без блокировки.
+        """
+        with self._lock:
+            self.table.clear()
+            self.mcts = mcts.MonteCarloSearch(fast_rate_function)
+            self.predicted_hits = 0
+            self.predicted_misses = 0
+            self._clear()
+
+    def undo(self, board: Board) -> None:
+        """Согласует состояние с доской после отмены хода: если главная
+        линия начиналась из отменённой позиции, она и ходы-убийцы
+        забываются.
+        """
+        with self._lock:
+            if len(board.moves) < len(self.pv_root):
+                self.pv = list()
+                self.pv_root = list()
+                self.killers = list()
+                self.depth = 0
+
+    def _get_played(self, board: Board) -> int:
+        """Возвращает, сколько ходов главной линии сделано на доске с
+        начала последнего перебора, или -1, если доска с ней разошлась.
+        """
+        root_length = len(self.pv_root)
+        played = len(board.moves) - root_length
+        if played < 0 or played >= len(self.pv) or \
+                board.moves[:root_length] != self.pv_root or \
+                board.moves[root_length:] != self.pv[:played]:
+            return -1
+        return played
+
+    def remember_line(self, board: Board, line: List[Tuple[int, int]],
+                      score: int, depth: int) -> None:
+        """Запоминает главную линию line из позиции на доске, её оценку
+        и глубину, на которую она просчитана.
+        """
+        with self._lock:
+            self.pv_root = list(board.moves)
+            self.pv = list(line)
+            self.score = score
+            self.depth = depth
+
+    def create_search(self, board: Board, deadline: Optional[float] = None,
+                      stats: Optional[SearchStats] = None) \
+            -> search.AlphaBetaSearch:
+        """Создаёт перебор позиции на доске, продолжающий сохранённое
+        состояние.
+        """
+        with self._lock:
+            played = self._get_played(board)
+            killers: List[List[Tuple[int, int]]] = list()
+            best_move = (-1, -1)
+            score = 0
+            start_depth = 1
+            if played >= 0:
+                if played:
+                    self.predicted_hits += 1
+                killers = [list(moves) for moves in self.killers[played:]]
+                best_move = self.pv[played]
+                score = self.score if played % 2 == 0 else -self.score
+                start_depth = max(self.depth - played, 1)
+            elif self.pv:
+                self.predicted_misses += 1
+            history = [dict(moves) for moves in self.history]
+        searcher = search.AlphaBetaSearch(
+            board, fast_rate_function, deadline, table=self.table,
+            stats=stats, start_depth=start_depth, killers=killers,
+            history=history)
+        searcher.best_move = best_move
+        searcher.best_score = score
+        return searcher
+
+    def finish_search(self, searcher: search.AlphaBetaSearch) -> None:
+        """Сохраняет результаты законченного перебора из create_search."""
+        line = list()
+        if searcher.completed_depth:
+            line = searcher.get_principal_variation(
+                searcher.best_move, searcher.completed_depth)
+        self.remember_line(searcher.board, line, searcher.best_score,
+                           searcher.completed_depth)
+        with self._lock:
+            self.killers = searcher.killers
+            self.history = searcher.history
+
+    def choose_move(self, board: Board, time_limit: float,
+                    stats: Optional[SearchStats] = None,
+                    cancelled: Optional[Callable[[], bool]] = None) \
+            -> Tuple[int, Tuple[int, int]]:
+        """Возвращает оценку ситуации на доске и клетку, в которую нужно
+        сделать ход, выбранные алгоритмом const.SEARCH_MODE за time_limit
+        секунд. Если найден форсированный выигрыш угрозами, возвращается
+        его первый ход без основного перебора. Статистика основного
+        перебора записывается в stats. Поиск Монте-Карло прекращается,
+        когда cancelled возвращает True.
+        """
+        move = probe_book(board)
+        if move is not None:
+            return 0, move
+        start = time.monotonic()
+        if const.USE_THREAT_SEARCH:
+            line = threats.find_forced_win(
+                board, time_limit * const.THREAT_TIME_SHARE)
+            if line:
+                self.remember_line(board, line, const.MINIMAX_INF, 0)
+                return const.MINIMAX_INF, line[0]
+        time_limit = max(time_limit - (time.monotonic() - start),
+                         const.MIN_MOVE_TIME)
+        if const.SEARCH_MODE == "minimax":
+            return minimax(board, stats=stats)
+        if const.SEARCH_MODE == "parallel":
+            return parallel.parallel_search(board, fast_rate_function,
+                                            time_limit, stats=stats)
+        if const.SEARCH_MODE == "mcts":
+            return self.mcts.run(board, time.monotonic() + time_limit,
+                                 stats=stats, cancelled=cancelled)
+        searcher = self.create_search(board, time.monotonic() + time_limit,
+                                      stats)
+        result = searcher.run()
+        self.finish_search(searcher)
+        return result
+
+
+def get_engine(game: Game) -> Engine:
+    """Возвращает состояние компьютера в партии, создавая его при первом
+    обращении.
+    """
+    if game.engine is None:
+        game.engine = Engine()
+    return game.engine
+
+
+def choose_move(board: Board, time_limit: float,
+                stats: Optional[SearchStats] = None) \
+        -> Tuple[int, Tuple[int, int]]:
+    """Выбирает ход, как Engine.choose_move, но без состояния,
+    сохранённого от предыдущих ходов.
+    """
+    return Engine().choose_move(board, time_limit, stats)
+
+
 def do_computers_move(game: Game) -> None:
-    """Делает ход компьютера."""
-    pos = minimax(game.board)[1]
-    game.do_move(pos)
+    """Делает ход компьютера, продолжая состояние компьютера в партии."""
+    game.do_move(get_engine(game).choose_move(
+        game.board, get_time_budget(game))[1])
@@ -1,17 +1,38 @@
 from .board import Board, Player, BoardState
 from . import const
 import time
-from typing import Tuple
+from typing import Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .engine import Engine
+    from .saver import Journal
 
 
 class Game:
-    """Описывает игровой процесс."""
+    """Описывает игровой процесс на поле size с длиной выигрышного
+    ряда win_length и, если renju, с запрещёнными ходами чёрных
+    (по умолчанию - из const). Если подключён журнал, каждый ход и
+    каждая отмена хода записываются в него. В engine хранится состояние
+    компьютера (см. engine.get_engine): оно согласуется с доской при
+    отмене хода и очищается при перезапуске.
+    """
 
-    def __init__(self):
-        self.board = Board()
+    def __init__(self, size: Optional[Tuple[int, int]] = None,
+                 win_length: Optional[int] = None,
+                 renju: Optional[bool] = None):
+        self.board = Board(size, win_length, renju)
         self.moves_durations = list()
         self.players_times = [const.GAME_TIME_LIMIT for i in range(2)]
         self.last_event_time = time.time()
+        self.journal: Optional["Journal"] = None
+        self.engine: Optional["Engine"] = None
+
+    def set_journal(self, journal: Optional["Journal"]) -> None:
+        """Подключает журнал и записывает в него ходы партии."""
+        self.journal = journal
+        if journal is None:
+            return
+        journal.rewrite(self.board, self.moves_durations)
 
     def do_move(self, pos: Tuple[int, int]) -> None:
         """Делает ход. Пересчитывает все атрибуты класса."""
@@ -21,12 +42,14 @@ class Game:
         self.moves_durations.append(move_duration)
         self.players_times[self.board.whose_move.value] -= move_duration
         self.board.do_move(pos)
+        if self.journal is not None:
+            self.journal.append_move(pos, move_duration)
 
     def try_do_move(self, pos: Tuple[int, int]) -> bool:
-        """Если клетка занята, возвращает False,
-        иначе делает ход и возвращает True.
+        """Если клетка занята или ход в неё запрещён правилами,
+        возвращает False, иначе делает ход и возвращает True.
         """
-        if self.board[pos]:
+        if self.board[pos] or self.board.is_forbidden(pos):
             return False
         self.do_move(pos)
         return True
@@ -42,6 +65,10 @@ class Game:
             += self.moves_durations[-1]
         self.moves_durations.pop()
         self.last_event_time = time.time()
+        if self.journal is not None:
+            self.journal.append_undo()
+        if self.engine is not None:
+            self.engine.undo(self.board)
 
     def get_times(self) -> Tuple[float, float]:
         """Возвращает время игроков до конца партии."""
@@ -59,4 +86,11 @@ class Game:
 
     def restart(self) -> None:
         """Перезапускает игру."""
-        self.__init__()
+        journal = self.journal
+        engine = self.engine
+        self.__init__(self.board.size, self.board.win_length,
+                      self.board.renju)
+        self.set_journal(journal)
+        if engine is not None:
+            engine.reset()
+            self.engine = engine
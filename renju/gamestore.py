@@ -0,0 +1,417 @@
+"""Модуль, реализующий базу сыгранных партий с поиском по позициям.
+
+База - каталог с файлами:
+store.json - описание базы (размер поля, число партий и позиций);
+games.bin - партии подряд: результат, число ходов и ходы по два байта;
+games.idx - смещения партий в games.bin (по 8 байт на партию);
+positions.idx - отсортированные по ключу записи (ключ Зобриста позиции,
+номер партии, число сделанных в партии ходов), по записи на каждую
+позицию каждой партии.
+
+Ключ позиции совпадает с Board.hash_key. Импорт читает файлы партий
+построчно, а индекс позиций строится внешней сортировкой: записи
+накапливаются блоками по const.GAMESTORE_SORT_CHUNK, каждый блок
+сортируется и сохраняется во временный файл, затем блоки сливаются.
+Поиск позиции - двоичный поиск в отображённом в память индексе.
+
+Запуск:
+    python -m renju.gamestore import games/ save.txt arena.jsonl
+    python -m renju.gamestore query games/ 7,7 8,8
+"""
+
+from .board import Board, BoardState
+from .geometry import get_geometry
+from .loader import Loader
+from . import const
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, \
+    Tuple
+import argparse
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+_VERSION = 1
+_GAME_HEADER = struct.Struct("<BH")
+_OFFSET = struct.Struct("<Q")
+_POSITION = struct.Struct("<QIH")
+# Число записей, читаемых из блока за раз при слиянии.
+_MERGE_BUFFER = 4096
+
+
+class GameRecord(NamedTuple):
+    """Партия из базы."""
+    moves: List[Tuple[int, int]]
+    result: BoardState
+
+
+class Continuation(NamedTuple):
+    """Статистика хода из позиции: сколько партий продолжились им и
+    чем они закончились для сделавшего ход. Незаконченные партии
+    учитываются только в games.
+    """
+    move: Tuple[int, int]
+    games: int
+    wins: int
+    draws: int
+    losses: int
+
+    def get_win_rate(self) -> float:
+        """Возвращает долю очков (ничья - пол-очка), набранных в
+        законченных партиях, или 0.5, если таких партий нет.
+        """
+        finished = self.wins + self.draws + self.losses
+        if not finished:
+            return 0.5
+        return (self.wins + self.draws / 2) / finished
+
+
+# Результаты партий без окна.
+_WINNERS = {"black": BoardState.BLACK_WINS, "white": BoardState.WHITE_WINS,
+            "draw": BoardState.DRAW, None: BoardState.GAMING}
+
+# Ходы партии (None, если запись партии повреждена) и её результат
+# (None, если он неизвестен).
+GameData = Tuple[Optional[List[Tuple[int, int]]], Optional[BoardState]]
+
+
+def _parse_result(line: str) -> GameData:
+    """Разбирает строку результатов партий без окна."""
+    try:
+        result = json.loads(line)
+        return [(int(row), int(column)) for row, column in
+                result["moves"]], _WINNERS[result.get("winner")]
+    except (ValueError, KeyError, TypeError):
+        return None, None
+
+
+def read_games(path: Path) -> Iterator[GameData]:
+    """Читает партии из файла: построчные результаты партий без окна
+    (.jsonl), журнал ходов (.bin) или файл сохранения. Для повреждённой
+    записи партии возвращаются ходы None, остальные партии файла
+    читаются дальше.
+    """
+    if path.suffix == ".jsonl":
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield _parse_result(line)
+    elif path.suffix == ".bin":
+        try:
+            moves = Loader.read_journal(path)
+        except ValueError:
+            yield None, None
+            return
+        yield [pos for pos, duration in moves], None
+    else:
+        with path.open() as f:
+            try:
+                moves = [(int(x), int(y)) for x, y, duration in
+                         (line.split() for line in f if line.strip())]
+            except ValueError:
+                yield None, None
+                return
+        yield moves, None
+
+
+def _check_game(moves: Optional[List[Tuple[int, int]]],
+                result: Optional[BoardState]) -> BoardState:
+    """Проверяет ходы партии и возвращает её результат. Если результат
+    неизвестен, партия разыгрывается на доске. Бросает ValueError, если
+    ходы недопустимы или запись партии повреждена.
+    """
+    if moves is None:
+        raise ValueError("Запись партии повреждена")
+    if result is None:
+        board = Board()
+        try:
+            board.load_moves(moves)
+        except IndexError as e:
+            raise ValueError(str(e))
+        return board.state
+    height, width = const.BOARD_SIZE
+    if len(set(moves)) != len(moves) or not all(
+            0 <= row < height and 0 <= column < width
+            for row, column in moves):
+        raise ValueError("Недопустимые ходы в партии")
+    return result
+
+
+def _get_keys(moves: List[Tuple[int, int]]) -> List[int]:
+    """Возвращает ключи всех позиций партии, начиная с пустой доски."""
+    geometry = get_geometry(const.BOARD_SIZE[0], const.BOARD_SIZE[1],
+                            const.WIN_ROW_LENGTH)
+    zobrist = geometry.zobrist
+    side = geometry.zobrist_side
+    stride = geometry.stride
+    key = 0
+    keys = [key]
+    for ply, (row, column) in enumerate(moves):
+        key ^= zobrist[ply & 1][row * stride + column] ^ side
+        keys.append(key)
+    return keys
+
+
+def _write_run(entries: List[int], directory: str) -> str:
+    """Сортирует записи индекса и сохраняет их во временный файл."""
+    entries.sort()
+    data = bytearray(len(entries) * _POSITION.size)
+    for i, entry in enumerate(entries):
+        _POSITION.pack_into(data, i * _POSITION.size, entry >> 48,
+                            (entry >> 16) & 0xFFFFFFFF, entry & 0xFFFF)
+    fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _read_run(path: str) -> Iterator[Tuple[int, int, int]]:
+    """Читает записи индекса из файла блоками."""
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(_MERGE_BUFFER * _POSITION.size)
+            if not data:
+                return
+            yield from _POSITION.iter_unpack(data)
+
+
+def _read_meta(path: Path) -> Dict:
+    """Читает описание базы или создаёт описание пустой базы."""
+    try:
+        with (path / "store.json").open(encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return {"version": _VERSION, "size": list(const.BOARD_SIZE),
+                "win_length": const.WIN_ROW_LENGTH, "games": 0,
+                "positions": 0, "data_size": 0}
+    if meta["version"] != _VERSION:
+        raise ValueError("Неподдерживаемая версия базы партий")
+    if meta["size"] != list(const.BOARD_SIZE) or \
+            meta["win_length"] != const.WIN_ROW_LENGTH:
+        raise ValueError("База партий создана для другого поля")
+    return meta
+
+
+def _write_meta(path: Path, meta: Dict) -> None:
+    """Записывает описание базы через временный файл."""
+    fd, name = tempfile.mkstemp(suffix=".tmp", dir=str(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(name, str(path / "store.json"))
+    except BaseException:
+        os.unlink(name)
+        raise
+
+
+def import_games(path: Path, sources: Iterable[Path],
+                 chunk: int = const.GAMESTORE_SORT_CHUNK) -> int:
+    """Добавляет партии из файлов sources в базу в каталоге path (база
+    создаётся, если её нет). Партии с недопустимыми ходами и повреждённые
+    записи партий пропускаются. Возвращает число добавленных партий.
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    meta = _read_meta(path)
+    game_id = meta["games"]
+    positions = meta["positions"]
+    runs: List[str] = list()
+    entries: List[int] = list()
+    try:
+        with (path / "games.bin").open("ab") as games, \
+                (path / "games.idx").open("ab") as offsets:
+            # Отбрасываются данные прерванного импорта, не попавшие в
+            # описание базы.
+            games.truncate(meta["data_size"])
+            offsets.truncate(game_id * _OFFSET.size)
+            games.seek(0, os.SEEK_END)
+            for source in sources:
+                for moves, result in read_games(source):
+                    try:
+                        result = _check_game(moves, result)
+                    except ValueError:
+                        continue
+                    offsets.write(_OFFSET.pack(games.tell()))
+                    games.write(_GAME_HEADER.pack(result, len(moves)))
+                    games.write(bytes(value for pos in moves
+                                      for value in pos))
+                    for ply, key in enumerate(_get_keys(moves)):
+                        entries.append(key << 48 | game_id << 16 | ply)
+                    game_id += 1
+                    if len(entries) >= chunk:
+                        runs.append(_write_run(entries, str(path)))
+                        positions += len(entries)
+                        entries = list()
+        if entries:
+            runs.append(_write_run(entries, str(path)))
+            positions += len(entries)
+        index = path / "positions.idx"
+        sources_runs = [_read_run(run) for run in runs]
+        if index.exists():
+            # Записи партий прерванного импорта, не попавших в описание
+            # базы, отбрасываются: их номера получили новые партии.
+            sources_runs.append(entry for entry in _read_run(str(index))
+                                if entry[1] < meta["games"])
+        merged = path / "positions.tmp"
+        with merged.open("wb") as f:
+            buffer = bytearray()
+            for entry in heapq.merge(*sources_runs):
+                buffer += _POSITION.pack(*entry)
+                if len(buffer) >= _MERGE_BUFFER * _POSITION.size:
+                    f.write(buffer)
+                    buffer = bytearray()
+            f.write(buffer)
+        os.replace(str(merged), str(index))
+        meta["data_size"] = (path / "games.bin").stat().st_size
+    finally:
+        for run in runs:
+            os.remove(run)
+    added = game_id - meta["games"]
+    meta["games"] = game_id
+    meta["positions"] = positions
+    _write_meta(path, meta)
+    return added
+
+
+def _map_file(path: Path) -> Optional[mmap.mmap]:
+    """Отображает файл в память. Пустые файлы не отображаются."""
+    with path.open("rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class GameStore:
+    """База партий, открытая для поиска."""
+
+    def __init__(self, path: Path) -> None:
+        if not (path / "store.json").exists():
+            raise FileNotFoundError("База партий {} не найдена".format(path))
+        self.meta = _read_meta(path)
+        self._games = _map_file(path / "games.bin")
+        self._offsets = _map_file(path / "games.idx")
+        self._positions = _map_file(path / "positions.idx")
+
+    def __len__(self) -> int:
+        return self.meta["games"]
+
+    def close(self) -> None:
+        """Закрывает файлы базы."""
+        for data in (self._games, self._offsets, self._positions):
+            if data is not None:
+                data.close()
+
+    def get_game(self, game_id: int) -> GameRecord:
+        """Возвращает партию с номером game_id."""
+        if not 0 <= game_id < len(self):
+            raise IndexError("Партии {} нет в базе".format(game_id))
+        offset = _OFFSET.unpack_from(self._offsets,
+                                     game_id * _OFFSET.size)[0]
+        result, length = _GAME_HEADER.unpack_from(self._games, offset)
+        start = offset + _GAME_HEADER.size
+        data = self._games[start:start + 2 * length]
+        return GameRecord(list(zip(data[::2], data[1::2])),
+                          BoardState(result))
+
+    def find_position(self, key: int, limit: Optional[int] = None) \
+            -> List[Tuple[int, int]]:
+        """Возвращает партии, в которых встретилась позиция с ключом key,
+        в виде пар (номер партии, число сделанных до позиции ходов).
+        """
+        data = self._positions
+        if data is None:
+            return list()
+        low, high = 0, len(data) // _POSITION.size
+        count = high
+        while low < high:
+            middle = (low + high) // 2
+            if _POSITION.unpack_from(data, middle * _POSITION.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = list()
+        while low < count and (limit is None or len(found) < limit):
+            entry_key, game_id, ply = _POSITION.unpack_from(
+                data, low * _POSITION.size)
+            if entry_key != key:
+                break
+            # Записи прерванного импорта относятся к партиям, которых
+            # нет в описании базы.
+            if game_id < len(self):
+                found.append((game_id, ply))
+            low += 1
+        return found
+
+    def get_continuations(self, key: int,
+                          limit: Optional[int] = None) -> List[Continuation]:
+        """Возвращает статистику ходов из позиции с ключом key, начиная с
+        самых частых.
+        """
+        stats: Dict[Tuple[int, int], List[int]] = dict()
+        games = self._games
+        for game_id, ply in self.find_position(key, limit):
+            # Партия целиком не читается: нужны только результат и ход.
+            offset = _OFFSET.unpack_from(self._offsets,
+                                         game_id * _OFFSET.size)[0]
+            result, length = _GAME_HEADER.unpack_from(games, offset)
+            if ply >= length:
+                continue
+            start = offset + _GAME_HEADER.size + 2 * ply
+            counts = stats.setdefault((games[start], games[start + 1]),
+                                      [0, 0, 0, 0])
+            counts[0] += 1
+            if result == BoardState.DRAW:
+                counts[2] += 1
+            elif result == (BoardState.BLACK_WINS if ply % 2 == 0
+                            else BoardState.WHITE_WINS):
+                counts[1] += 1
+            elif result != BoardState.GAMING:
+                counts[3] += 1
+        continuations = [Continuation(move, *counts)
+                         for move, counts in stats.items()]
+        continuations.sort(key=lambda item: (-item.games, item.move))
+        return continuations
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Парсинг аргументов запуска."""
+    parser = argparse.ArgumentParser(
+        description="База сыгранных партий.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    importer = commands.add_parser("import", help="добавить партии в базу")
+    importer.add_argument("store", help="каталог базы")
+    importer.add_argument("files", nargs="+", help="файлы партий")
+    query = commands.add_parser("query", help="найти позицию")
+    query.add_argument("store", help="каталог базы")
+    query.add_argument("moves", nargs="*",
+                       help="ходы, ведущие к позиции, в виде строка,столбец")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Точка входа."""
+    args = parse_args(argv)
+    if args.command == "import":
+        added = import_games(Path(args.store),
+                             (Path(name) for name in args.files))
+        print("Добавлено партий: %d" % added)
+        return
+    board = Board()
+    board.load_moves([tuple(int(value) for value in move.split(","))
+                      for move in args.moves])
+    store = GameStore(Path(args.store))
+    games = store.find_position(board.hash_key)
+    print("Партий с позицией: %d" % len(games))
+    for item in store.get_continuations(board.hash_key):
+        print("%d,%d: партий %d, очков %.1f%%" % (
+            item.move[0], item.move[1], item.games,
+            100 * item.get_win_rate()))
+    store.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
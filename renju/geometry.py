@@ -0,0 +1,192 @@
+"""Модуль, содержащий предвычисленные таблицы для игрового поля.
+
+Таблицы окон, соседей, кодов линий и ключи Зобриста хранятся в кэше
+таблиц на диске (см. модуль cache) и при следующих запусках отображаются
+в память, а не строятся заново. Таблица из строк разной длины хранится
+одним массивом: число строк, смещения начал строк и конца последней,
+затем значения. Строки - срезы этого массива.
+"""
+
+from . import cache
+import functools
+import random
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Направления линий на поле: (1, -1), (1, 0), (1, 1), (0, 1)
+DIRECTIONS = ((1, -1), (1, 0), (1, 1), (0, 1))
+# Версия алгоритмов построения таблиц; меняется вместе с ними, чтобы
+# таблицы в кэше построились заново.
+_TABLE_VERSION = 1
+
+
+def _flatten(rows: Sequence[Sequence[int]]) -> List[int]:
+    """Записывает строки разной длины в один список."""
+    start = len(rows) + 2
+    table = [len(rows), start]
+    values: List[int] = list()
+    for row in rows:
+        values.extend(row)
+        table.append(start + len(values))
+    return table + values
+
+
+def _load_rows(name: str, build: Callable[[], Sequence[Sequence[int]]]) \
+        -> List[Sequence[int]]:
+    """Возвращает строки таблицы name из кэша таблиц, строя их функцией
+    build, если таблицы там нет.
+    """
+    table = cache.load_table(name, "I", lambda: _flatten(build()))
+    return [table[table[i + 1]:table[i + 2]] for i in range(table[0])]
+
+
+class Geometry:
+    """Описывает таблицы, зависящие только от размеров поля и длины
+    выигрышного ряда. Клетки нумеруются так же, как биты в Board:
+    row * (width + 1) + column.
+    """
+
+    def __init__(self, height: int, width: int, win_length: int) -> None:
+        self.height = height
+        self.width = width
+        self.win_length = win_length
+        self.stride = width + 1
+        self._name = "%dx%dx%d-v%d" % (height, width, win_length,
+                                       _TABLE_VERSION)
+        # Координаты клетки по её номеру; для пустого столбца - None.
+        self.positions: List[Optional[Tuple[int, int]]] = [
+            divmod(index, self.stride)
+            if index % self.stride < width else None
+            for index in range(height * self.stride)]
+        # Номера всех клеток поля по строкам.
+        self.cell_indices: Tuple[int, ...] = tuple(
+            index for index, pos in enumerate(self.positions)
+            if pos is not None)
+        # Поле целиком в виде битборда.
+        self.field_mask = sum(1 << index for index in self.cell_indices)
+        # windows - клетки каждого окна из win_length клеток подряд,
+        # целиком лежащего на поле; cell_windows - номера окон,
+        # проходящих через каждую клетку.
+        self.windows = _load_rows("windows-" + self._name,
+                                  self._build_windows)
+        self.cell_windows = _load_rows("cell-windows-" + self._name,
+                                       self._build_cell_windows)
+        # Ключи Зобриста: по случайному 64-битному числу на каждую пару
+        # (цвет, клетка) и одно число для хода белых.
+        cells_count = len(self.positions)
+        zobrist = cache.load_table("zobrist-" + self._name, "Q",
+                                   self._build_zobrist)
+        self.zobrist = [zobrist[:cells_count],
+                        zobrist[cells_count:2 * cells_count]]
+        self.zobrist_side = zobrist[2 * cells_count]
+        self._neighbours: Dict[int, List[Sequence[int]]] = dict()
+        self._lines: Optional[
+            Tuple[Sequence[int], List[Sequence[int]]]] = None
+
+    def _build_windows(self) -> List[Tuple[int, ...]]:
+        """Строит таблицу windows."""
+        windows = list()
+        for row in range(self.height):
+            for column in range(self.width):
+                for vector in DIRECTIONS:
+                    end_row = row + vector[0] * (self.win_length - 1)
+                    end_column = column + vector[1] * (self.win_length - 1)
+                    if not (0 <= end_row < self.height and
+                            0 <= end_column < self.width):
+                        continue
+                    windows.append(tuple(
+                        (row + vector[0] * i) * self.stride +
+                        column + vector[1] * i
+                        for i in range(self.win_length)))
+        return windows
+
+    def _build_cell_windows(self) -> List[List[int]]:
+        """Строит таблицу cell_windows по таблице windows."""
+        cell_windows: List[List[int]] = [list() for i in self.positions]
+        for number, window in enumerate(self.windows):
+            for index in window:
+                cell_windows[index].append(number)
+        return cell_windows
+
+    def _build_zobrist(self) -> List[int]:
+        """Строит ключи Зобриста: ключи чёрных, затем белых по номерам
+        клеток и ключ хода белых. Генератор инициализируется размерами
+        поля, поэтому ключи одинаковы во всех процессах.
+        """
+        rnd = random.Random("zobrist %d %d %d" % (self.height, self.width,
+                                                  self.win_length))
+        return [rnd.getrandbits(64)
+                for i in range(2 * len(self.positions) + 1)]
+
+    def get_neighbours(self, distance: int) -> List[Sequence[int]]:
+        """Для каждой клетки возвращает номера клеток, отстоящих от неё не
+        более чем на distance по каждой из координат (без самой клетки).
+        """
+        if distance not in self._neighbours:
+            self._neighbours[distance] = _load_rows(
+                "neighbours-%d-%s" % (distance, self._name),
+                lambda: self._build_neighbours(distance))
+        return self._neighbours[distance]
+
+    def _build_neighbours(self, distance: int) -> List[List[int]]:
+        """Строит таблицу get_neighbours."""
+        neighbours = list()
+        for index, pos in enumerate(self.positions):
+            cells = list()
+            if pos is not None:
+                for row in range(max(pos[0] - distance, 0),
+                                 min(pos[0] + distance + 1, self.height)):
+                    for column in range(max(pos[1] - distance, 0),
+                                        min(pos[1] + distance + 1,
+                                            self.width)):
+                        if (row, column) != pos:
+                            cells.append(row * self.stride + column)
+            neighbours.append(cells)
+        return neighbours
+
+    def get_lines(self) -> Tuple[Sequence[int], List[Sequence[int]]]:
+        """Возвращает таблицы кодов линий (см. модуль rules). Коды
+        хранятся в одном списке: код клетки index в направлении
+        DIRECTIONS[d] имеет номер d * len(positions) + index.
+
+        Первая таблица - коды линий пустого поля, в которых клетки за
+        краем поля считаются занятыми белыми. Вторая - для каждой клетки
+        пары номер кода, вес подряд: при установке в клетку фишки цвета
+        CellState к каждому такому коду прибавляется вес, умноженный на
+        цвет.
+        """
+        if self._lines is None:
+            rows = _load_rows("lines-" + self._name, self._build_lines)
+            self._lines = (rows[0], rows[1:])
+        return self._lines
+
+    def _build_lines(self) -> List[List[int]]:
+        """Строит таблицы get_lines: первая строка - коды, остальные -
+        пары номер кода, вес для каждой клетки.
+        """
+        cells_count = len(self.positions)
+        radius = self.win_length
+        offsets = list(range(-radius, 0)) + list(range(1, radius + 1))
+        codes = [0] * (len(DIRECTIONS) * cells_count)
+        slots: List[List[int]] = [list() for i in range(cells_count)]
+        for index in self.cell_indices:
+            row, column = self.positions[index]
+            for d, vector in enumerate(DIRECTIONS):
+                slot = d * cells_count + index
+                for k, offset in enumerate(offsets):
+                    other = (row + vector[0] * offset,
+                             column + vector[1] * offset)
+                    if 0 <= other[0] < self.height and \
+                            0 <= other[1] < self.width:
+                        slots[other[0] * self.stride + other[1]] += \
+                            (slot, 3 ** k)
+                    else:
+                        codes[slot] += 2 * 3 ** k
+        return [codes] + slots
+
+
+@functools.lru_cache(maxsize=None)
+def get_geometry(height: int, width: int, win_length: int) -> Geometry:
+    """Возвращает таблицы для поля заданных размеров. Таблицы строятся один
+    раз и разделяются между всеми досками с одинаковыми размерами.
+    """
+    return Geometry(height, width, win_length)
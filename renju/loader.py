@@ -1,7 +1,16 @@
 from .game import Game
+from .saver import JOURNAL_HEADER, JOURNAL_MAGIC, JOURNAL_RECORD, \
+    MOVE_RECORD, OLD_JOURNAL_MAGIC, RENJU_FLAG, UNDO_RECORD
 from . import const
+from pathlib import Path
+from typing import List, Optional, Tuple
 import time
 
+# Ход и его длительность в секундах.
+MoveRecord = Tuple[Tuple[int, int], float]
+# Параметры партии: размеры поля, длина выигрышного ряда и правила рэндзю.
+GameRules = Tuple[Tuple[int, int], int, bool]
+
 
 class Loader:
     """Отвечает за загрузку игры."""
@@ -9,16 +18,76 @@ class Loader:
     @staticmethod
     def load_game() -> Game:
         """Загружает игру."""
-        game = Game()
-        board = game.board
+        moves = list()
         with const.SAVE_PATH.open("r") as f:
             for line in f.readlines():
                 x, y, duration = line.split()
-                x = int(x)
-                y = int(y)
-                duration = float(duration)
-                game.players_times[board.whose_move.value] -= duration
-                game.moves_durations.append(duration)
-                game.board.do_move((x, y))
+                moves.append(((int(x), int(y)), float(duration)))
+        return Loader.make_game(moves)
+
+    @staticmethod
+    def parse_journal(path: Path = const.JOURNAL_PATH) \
+            -> Tuple[Optional[GameRules], List[MoveRecord]]:
+        """Читает журнал ходов и возвращает параметры партии (None для
+        журнала первой версии) и её ходы с учётом отмен. Недописанная
+        последняя запись (программа завершилась во время записи)
+        отбрасывается.
+        """
+        data = path.read_bytes()
+        magic = data[:len(JOURNAL_MAGIC)]
+        start = len(magic)
+        rules = None
+        if magic == JOURNAL_MAGIC and \
+                len(data) >= start + JOURNAL_HEADER.size:
+            height, width, win_length, flags = \
+                JOURNAL_HEADER.unpack_from(data, start)
+            rules = ((height, width), win_length, bool(flags & RENJU_FLAG))
+            start += JOURNAL_HEADER.size
+        elif magic != OLD_JOURNAL_MAGIC:
+            raise ValueError("Файл {} не является журналом ходов."
+                             .format(path))
+        size = JOURNAL_RECORD.size
+        count = (len(data) - start) // size
+        data = data[start:start + count * size]
+        moves: List[MoveRecord] = list()
+        for kind, row, column, duration in JOURNAL_RECORD.iter_unpack(data):
+            if kind == MOVE_RECORD:
+                moves.append(((row, column), duration))
+            elif kind == UNDO_RECORD:
+                if moves:
+                    moves.pop()
+            else:
+                raise ValueError("Журнал ходов {} повреждён.".format(path))
+        return rules, moves
+
+    @staticmethod
+    def read_journal(path: Path = const.JOURNAL_PATH) -> List[MoveRecord]:
+        """Читает журнал ходов и возвращает ходы партии с учётом отмен."""
+        return Loader.parse_journal(path)[1]
+
+    @staticmethod
+    def load_journal(path: Path = const.JOURNAL_PATH) -> Game:
+        """Загружает игру из журнала ходов с размерами поля и правилами,
+        записанными в журнале.
+        """
+        rules, moves = Loader.parse_journal(path)
+        if rules is None:
+            return Loader.make_game(moves)
+        return Loader.make_game(moves, *rules)
+
+    @staticmethod
+    def make_game(moves: List[MoveRecord],
+                  size: Optional[Tuple[int, int]] = None,
+                  win_length: Optional[int] = None,
+                  renju: Optional[bool] = None) -> Game:
+        """Создаёт игру с заданными ходами и параметрами (по умолчанию -
+        из const). Фишки ставятся все сразу, а состояние доски
+        вычисляется один раз.
+        """
+        game = Game(size, win_length, renju)
+        game.board.load_moves([pos for pos, duration in moves])
+        for i, (pos, duration) in enumerate(moves):
+            game.players_times[i % 2] -= duration
+            game.moves_durations.append(duration)
         game.last_event_time = time.time()
         return game
@@ -0,0 +1,163 @@
+"""Модуль, создающий нагрузку на сервер партий (renju.server).
+
+Одновременно играются games партий: каждый клиент делает случайные ходы
+и после каждого хода запрашивает часы. Для каждой команды измеряется
+время от отправки до получения ответа, в конце печатаются перцентили.
+
+Запуск: python -m renju.loadgen --games 32 --moves 10 --spawn
+"""
+
+from . import const, server
+from typing import Dict, List, Optional, Set, Tuple
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+# Пауза перед повтором хода, если сервер ответил "error busy".
+_BUSY_DELAY = 0.05
+
+Latencies = Dict[str, List[float]]
+
+
+async def _request(reader: asyncio.StreamReader,
+                   writer: asyncio.StreamWriter, line: str,
+                   latencies: Latencies) -> str:
+    """Отправляет команду и возвращает ответ, запоминая задержку."""
+    start = time.monotonic()
+    writer.write(line.encode("utf-8") + b"\n")
+    await writer.drain()
+    response = (await reader.readline()).decode("utf-8").strip()
+    latencies.setdefault(line.split()[0], list()).append(
+        time.monotonic() - start)
+    return response
+
+
+async def play_client(host: str, port: int, moves: int, rnd: random.Random,
+                      latencies: Latencies) -> int:
+    """Играет одну партию из не более чем moves ходов. Возвращает число
+    ответов "error busy".
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    busy = 0
+    occupied: Set[Tuple[int, int]] = set()
+    cells = [(row, column) for row in range(const.BOARD_SIZE[0])
+             for column in range(const.BOARD_SIZE[1])]
+    try:
+        made = 0
+        while made < moves:
+            pos = rnd.choice([cell for cell in cells
+                              if cell not in occupied])
+            response = (await _request(reader, writer, "move %d %d" % pos,
+                                       latencies)).split()
+            if response == ["error", "busy"]:
+                busy += 1
+                await asyncio.sleep(_BUSY_DELAY)
+                continue
+            if response[0] != "ok":
+                raise RuntimeError("Ответ сервера: " + " ".join(response))
+            made += 1
+            occupied.add(pos)
+            if response[1] != "-":
+                occupied.add((int(response[1]), int(response[2])))
+            await _request(reader, writer, "clock", latencies)
+            if response[-1] != "gaming":
+                break
+        await _request(reader, writer, "state", latencies)
+        writer.write(b"quit\n")
+        await writer.drain()
+    finally:
+        writer.close()
+    return busy
+
+
+async def run_load(host: str, port: int, games: int, moves: int,
+                   seed: int = 0) -> Tuple[Latencies, int]:
+    """Одновременно играет games партий. Возвращает задержки по командам
+    и общее число ответов "error busy".
+    """
+    latencies: Latencies = dict()
+    busy = await asyncio.gather(*[
+        play_client(host, port, moves, random.Random(seed + i), latencies)
+        for i in range(games)])
+    return latencies, sum(busy)
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Возвращает перцентиль отсортированного списка values."""
+    index = min(int(share * len(values)), len(values) - 1)
+    return values[index]
+
+
+def format_report(latencies: Latencies, busy: int, elapsed: float) -> str:
+    """Возвращает текстовый отчёт о задержках."""
+    total = sum(len(values) for values in latencies.values())
+    lines = ["Команд: %d за %.2f с (%.1f в секунду), ответов busy: %d" % (
+        total, elapsed, total / max(elapsed, 1e-9), busy)]
+    for command, values in sorted(latencies.items()):
+        values = sorted(values)
+        lines.append(
+            "%-6s n=%-6d p50 %.1f мс, p90 %.1f мс, p99 %.1f мс, "
+            "max %.1f мс" % (command, len(values),
+                             1000 * percentile(values, 0.5),
+                             1000 * percentile(values, 0.9),
+                             1000 * percentile(values, 0.99),
+                             1000 * values[-1]))
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Парсинг аргументов запуска."""
+    parser = argparse.ArgumentParser(
+        description="Нагрузочное тестирование сервера партий.")
+    parser.add_argument("--host", default=const.SERVER_HOST,
+                        help="адрес сервера")
+    parser.add_argument("--port", type=int, default=const.SERVER_PORT,
+                        help="порт сервера")
+    parser.add_argument("--games", type=int, default=16,
+                        help="число одновременных партий")
+    parser.add_argument("--moves", type=int, default=10,
+                        help="число ходов клиента в каждой партии")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="начальное значение генератора ходов")
+    parser.add_argument("--spawn", action="store_true",
+                        help="запустить сервер в этом же процессе")
+    parser.add_argument("--workers", type=int, default=const.SERVER_WORKERS,
+                        help="число процессов компьютера (с --spawn)")
+    parser.add_argument("--move-time", type=float, default=0.1,
+                        help="время на ход компьютера (с --spawn)")
+    return parser.parse_args(argv)
+
+
+async def _main(args: argparse.Namespace) -> str:
+    """Запускает нагрузку и возвращает отчёт."""
+    port = args.port
+    game_server = None
+    if args.spawn:
+        game_server = server.GameServer(args.workers,
+                                        move_time=args.move_time)
+        await game_server.start(args.host, 0)
+        port = game_server.port
+    try:
+        start = time.monotonic()
+        latencies, busy = await run_load(args.host, port, args.games,
+                                         args.moves, args.seed)
+        return format_report(latencies, busy, time.monotonic() - start)
+    finally:
+        if game_server is not None:
+            await game_server.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Точка входа."""
+    args = parse_args(argv)
+    loop = asyncio.new_event_loop()
+    try:
+        print(loop.run_until_complete(_main(args)))
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,312 @@
+"""Модуль, реализующий поиск Монте-Карло по дереву (UCT).
+
+Каждая итерация спускается от корня по дереву, выбирая потомков по
+формуле UCT, добавляет в дерево потомков листа, доигрывает позицию
+случайными ходами рядом с фишками и прибавляет результат ко всем узлам
+пути. Выбирается ход корня, который посещался чаще всего.
+
+Узлы хранятся не отдельными объектами, а в параллельных массивах
+array: у узла есть номер, по которому берутся его ход, первый потомок и
+число потомков, число посещений и сумма результатов. Потомки одного
+узла лежат подряд.
+
+Дерево переживает ход: если следующая позиция получается из корня
+ходами, которые уже есть в дереве, поддерево этой позиции становится
+новым корнем, а остальные узлы выбрасываются.
+"""
+
+from .board import Board, BoardState, Player
+from .stats import IterationStats, SearchStats
+from . import const
+from array import array
+from typing import Callable, List, Optional, Tuple
+import math
+import random
+import threading
+import time
+
+# Результат доигрывания для чёрных
+_RESULTS = {BoardState.BLACK_WINS: 1.0, BoardState.WHITE_WINS: 0.0,
+            BoardState.DRAW: 0.5}
+
+
+class MonteCarloSearch:
+    """Поиск Монте-Карло по дереву с сохранением дерева между ходами.
+
+    Поиск ведётся на собственной доске, которая перед каждым запуском
+    догоняет переданную. Число узлов дерева ограничено max_nodes: когда
+    место кончается, листья перестают раскрываться, а итерации
+    продолжаются. Доигрывание длится не больше rollout_depth ходов, после
+    чего позиция оценивается функцией evaluate.
+    """
+
+    def __init__(self, evaluate: Callable[[Board], int], seed: int = 0,
+                 max_nodes: int = const.MCTS_MAX_NODES,
+                 exploration: float = const.MCTS_EXPLORATION,
+                 rollout_depth: int = const.MCTS_ROLLOUT_DEPTH) -> None:
+        self.evaluate = evaluate
+        self.max_nodes = max_nodes
+        self.exploration = exploration
+        self.rollout_depth = rollout_depth
+        self.random = random.Random(seed)
+        self.board: Optional[Board] = None
+        self.stopped = False
+        # Число посещений корня, доставшихся от предыдущего хода.
+        self.reused_visits = 0
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self) -> None:
+        """Оставляет в дереве только корень."""
+        self._move = array("h", [-1])
+        self._first_child = array("i", [0])
+        self._child_count = array("H", [0])
+        self._visits = array("I", [0])
+        self._wins = array("d", [0.0])
+
+    def __len__(self) -> int:
+        return len(self._visits)
+
+    def stop(self) -> None:
+        """Просит поиск завершиться как можно скорее."""
+        self.stopped = True
+
+    def _find_child(self, node: int, index: int) -> int:
+        """Возвращает потомка node с ходом в клетку index или -1."""
+        first = self._first_child[node]
+        for child in range(first, first + self._child_count[node]):
+            if self._move[child] == index:
+                return child
+        return -1
+
+    def _reroot(self, root: int) -> None:
+        """Делает узел root корнем, копируя его поддерево в новые массивы
+        в порядке обхода в ширину.
+        """
+        move = array("h", [-1])
+        first_child = array("i", [0])
+        child_count = array("H", [0])
+        visits = array("I", [self._visits[root]])
+        wins = array("d", [self._wins[root]])
+        queue = [root]
+        for new, old in enumerate(queue):
+            first = self._first_child[old]
+            count = self._child_count[old]
+            if not count:
+                continue
+            first_child[new] = len(visits)
+            child_count[new] = count
+            for child in range(first, first + count):
+                queue.append(child)
+                move.append(self._move[child])
+                first_child.append(0)
+                child_count.append(0)
+                visits.append(self._visits[child])
+                wins.append(self._wins[child])
+        self._move = move
+        self._first_child, self._child_count = first_child, child_count
+        self._visits, self._wins = visits, wins
+
+    def _sync(self, board: Board) -> None:
+        """Приводит собственную доску к позиции board. Если позиция
+        получается из корня ходами, которые есть в дереве, корнем
+        становится соответствующий узел, иначе дерево строится заново.
+        """
+        own = self.board
+        if own is None or own.size != board.size or \
+                own.win_length != board.win_length or \
+                own.renju != board.renju or \
+                board.moves[:len(own.moves)] != own.moves:
+            self.board = board.copy()
+            self._clear()
+            return
+        stride = own.geometry.stride
+        root = 0
+        for pos in board.moves[len(own.moves):]:
+            if root >= 0:
+                root = self._find_child(root, pos[0] * stride + pos[1])
+            own.do_move(pos)
+        if root < 0:
+            self._clear()
+        elif root:
+            self._reroot(root)
+
+    def _get_moves(self, board: Board) -> List[int]:
+        """Возвращает номера клеток ходов, которыми раскрывается узел:
+        выигрыш в один ход, если он есть, иначе защиты от выигрыша
+        соперника в один ход, иначе все кандидаты.
+        """
+        player = board.whose_move
+        stride = board.geometry.stride
+        wins = board.get_winning_cells(player)
+        if wins:
+            moves = [min(wins)]
+        else:
+            moves = sorted(move for move in
+                           board.get_winning_cells(1 - player)
+                           if not board.is_forbidden(move))
+            if not moves:
+                moves = board.get_candidates()
+            if not moves and not board.moves:
+                moves = [(board.size[0] // 2, board.size[1] // 2)]
+        return [row * stride + column for row, column in moves]
+
+    def _expand(self, node: int, board: Board) -> None:
+        """Добавляет в дерево потомков узла, если для них есть место."""
+        moves = self._get_moves(board)
+        if not moves or len(self._visits) + len(moves) > self.max_nodes:
+            return
+        self._first_child[node] = len(self._visits)
+        self._child_count[node] = len(moves)
+        for index in moves:
+            self._move.append(index)
+            self._first_child.append(0)
+            self._child_count.append(0)
+            self._visits.append(0)
+            self._wins.append(0.0)
+
+    def _select(self, node: int) -> int:
+        """Выбирает потомка по формуле UCT. Непосещённые потомки
+        выбираются первыми.
+        """
+        first = self._first_child[node]
+        visits = self._visits
+        wins = self._wins
+        scale = self.exploration * math.sqrt(math.log(visits[node] + 1))
+        best = first
+        best_value = -1.0
+        for child in range(first, first + self._child_count[node]):
+            child_visits = visits[child]
+            if not child_visits:
+                return child
+            value = wins[child] / child_visits + \
+                scale / math.sqrt(child_visits)
+            if value > best_value:
+                best = child
+                best_value = value
+        return best
+
+    def _rollout(self, board: Board) -> float:
+        """Доигрывает позицию случайными ходами среди кандидатов, всегда
+        выигрывая и защищаясь от выигрыша в один ход. Возвращает
+        результат для чёрных: 1 - победа, 0 - поражение. Недоигранная
+        позиция оценивается функцией evaluate.
+        """
+        rnd = self.random
+        played = 0
+        while board.state == BoardState.GAMING and \
+                played < self.rollout_depth:
+            player = board.whose_move
+            wins = board.get_winning_cells(player)
+            if wins:
+                board.do_move(min(wins))
+            else:
+                blocks = [move for move in board.get_winning_cells(1 - player)
+                          if not board.is_forbidden(move)]
+                if blocks:
+                    board.do_move(blocks[0])
+                else:
+                    candidates = board.get_candidates()
+                    if not candidates:
+                        break
+                    board.do_move(rnd.choice(candidates))
+            played += 1
+        if board.state in _RESULTS:
+            result = _RESULTS[board.state]
+        else:
+            score = self.evaluate(board) / const.MCTS_EVAL_SCALE
+            result = 1.0 / (1.0 + math.exp(-max(min(score, 50.0), -50.0)))
+            if board.whose_move != Player.BLACK:
+                result = 1.0 - result
+        for i in range(played):
+            board.undo_move()
+        return result
+
+    def _iterate(self, board: Board) -> int:
+        """Выполняет одну итерацию поиска. Возвращает глубину листа."""
+        node = 0
+        path = [0]
+        # Цвет игрока, сделавшего ход в узел пути.
+        movers = [1 - board.whose_move]
+        positions = board.geometry.positions
+        while board.state == BoardState.GAMING:
+            if not self._child_count[node]:
+                if node and not self._visits[node]:
+                    break
+                self._expand(node, board)
+                if not self._child_count[node]:
+                    break
+            movers.append(board.whose_move)
+            node = self._select(node)
+            board.do_move(positions[self._move[node]])
+            path.append(node)
+        result = self._rollout(board)
+        for node, mover in zip(path, movers):
+            self._visits[node] += 1
+            self._wins[node] += result if mover == Player.BLACK \
+                else 1.0 - result
+        for i in range(len(path) - 1):
+            board.undo_move()
+        return len(path) - 1
+
+    def get_principal_variation(self, max_length: int) \
+            -> List[Tuple[int, int]]:
+        """Возвращает последовательность самых посещаемых ходов."""
+        positions = self.board.geometry.positions
+        pv = list()
+        node = 0
+        while len(pv) < max_length and self._child_count[node]:
+            first = self._first_child[node]
+            node = max(range(first, first + self._child_count[node]),
+                       key=self._visits.__getitem__)
+            if not self._visits[node]:
+                break
+            pv.append(positions[self._move[node]])
+        return pv
+
+    def run(self, board: Board, deadline: Optional[float] = None,
+            iterations: int = const.MCTS_ITERATIONS,
+            stats: Optional[SearchStats] = None,
+            cancelled: Optional[Callable[[], bool]] = None) \
+            -> Tuple[int, Tuple[int, int]]:
+        """Ищет ход в позиции board, пока не наступит deadline или не
+        будет выполнено iterations итераций (0 - без ограничения, тогда
+        нужен deadline). Поиск прекращается и после stop, и когда
+        cancelled возвращает True: так его можно отменить ещё до
+        запуска. Возвращает оценку в тысячных (1000 - победа ходящего) и
+        ход.
+        """
+        with self._lock:
+            self.stopped = False
+            start = time.monotonic()
+            self._sync(board)
+            own = self.board
+            self.reused_visits = self._visits[0]
+            done = 0
+            depth = 0
+            if own.state == BoardState.GAMING:
+                while not self.stopped and (not iterations or
+                                            done < iterations):
+                    if cancelled is not None and cancelled():
+                        break
+                    if deadline is not None and done and \
+                            time.monotonic() >= deadline:
+                        break
+                    depth = max(depth, self._iterate(own))
+                    done += 1
+            move = (-1, -1)
+            score = 0
+            pv = self.get_principal_variation(depth + 1)
+            if pv:
+                move = pv[0]
+                child = self._find_child(
+                    0, move[0] * own.geometry.stride + move[1])
+                rate = self._wins[child] / self._visits[child]
+                score = round(1000 * (2 * rate - 1))
+            if stats is not None:
+                stats.nodes += done
+                stats.leaves += done
+                stats.time += time.monotonic() - start
+                stats.add_iteration(IterationStats(
+                    depth, score, move, stats.nodes, stats.time, pv))
+            return score, move
@@ -0,0 +1,144 @@
+"""Модуль, реализующий параллельный перебор в нескольких процессах.
+
+Поддерживаются два режима:
+"split" - ходы корня делятся между процессами, каждый перебирает свою
+часть с итеративным углублением, результаты сравниваются на наибольшей
+глубине, которую закончили все процессы;
+"smp" - каждый процесс перебирает все ходы корня (в духе Lazy SMP), но с
+собственным порядком ходов; выбирается результат процесса, закончившего
+самую большую глубину. Таблицы транспозиций у процессов свои.
+
+Доска передаётся в процессы в компактном виде - снимком позиции
+(см. модуль position), а не целым объектом Game.
+"""
+
+from .board import Board
+from .position import Position
+from .tt import TranspositionTable
+from .search import AlphaBetaSearch
+from .stats import IterationStats, SearchStats
+from . import const
+from typing import Callable, List, Optional, Tuple, TYPE_CHECKING
+import random
+import time
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+SearchResult = Tuple[int, Tuple[int, int]]
+Iterations = List[IterationStats]
+
+_pool: Optional["ProcessPoolExecutor"] = None
+_pool_workers = 0
+
+
+def get_pool(workers: int) -> "ProcessPoolExecutor":
+    """Возвращает пул из workers процессов. Пул создаётся один раз и
+    переиспользуется, пока не изменится число процессов.
+    """
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        # Модуль импортируется только здесь: он заметно замедляет запуск
+        # программ, которые не пользуются параллельным перебором.
+        from concurrent.futures import ProcessPoolExecutor
+        shutdown()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown() -> None:
+    """Останавливает пул процессов, если он был создан."""
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+        _pool_workers = 0
+
+
+def _search_worker(position: Position, evaluate: Callable[[Board], int],
+                   time_limit: Optional[float], max_depth: int,
+                   memory: int, root_moves: Optional[List[Tuple[int, int]]],
+                   seed: Optional[int]) -> SearchStats:
+    """Перебор в отдельном процессе. Возвращает статистику перебора с
+    результатами всех законченных глубин.
+    """
+    deadline = None
+    if time_limit is not None:
+        deadline = time.monotonic() + time_limit
+    board = Board.from_position(position)
+    searcher = AlphaBetaSearch(board, evaluate, deadline, max_depth,
+                               TranspositionTable(memory), root_moves,
+                               SearchStats())
+    if seed is not None:
+        # Случайные начальные значения эвристики истории дают каждому
+        # процессу свой порядок перебора равноценных ходов.
+        rnd = random.Random(seed)
+        for history in searcher.history:
+            for move in board.get_candidates():
+                history[move] = rnd.random()
+    searcher.run()
+    return searcher.stats
+
+
+def _merge_split(results: List[Iterations]) -> SearchResult:
+    """Выбирает лучший ход среди результатов режима "split"."""
+    results = [iterations for iterations in results
+               if iterations and iterations[-1].move != (-1, -1)]
+    if not results:
+        return -const.MINIMAX_INF - 1, (-1, -1)
+    depth = min(iterations[-1].depth for iterations in results)
+    best = (-const.MINIMAX_INF - 1, (-1, -1))
+    for iterations in results:
+        for iteration in iterations:
+            if iteration.depth == depth and \
+                    (iteration.score > best[0] or best[1] == (-1, -1)):
+                best = (iteration.score, iteration.move)
+    return best
+
+
+def _merge_smp(results: List[Iterations]) -> SearchResult:
+    """Выбирает результат процесса, закончившего самую большую глубину."""
+    best = (0, -const.MINIMAX_INF - 1, (-1, -1))
+    for iterations in results:
+        if iterations and iterations[-1][:2] > best[:2]:
+            best = iterations[-1][:3]
+    return best[1], best[2]
+
+
+def parallel_search(board: Board, evaluate: Callable[[Board], int],
+                    time_limit: Optional[float] = None,
+                    max_depth: int = const.MAX_SEARCH_DEPTH,
+                    workers: int = const.PARALLEL_WORKERS,
+                    mode: str = const.PARALLEL_MODE,
+                    stats: Optional[SearchStats] = None) -> SearchResult:
+    """Возвращает оценку ситуации на доске и клетку, в которую нужно
+    сделать ход, используя workers процессов. evaluate должна быть
+    функцией уровня модуля, чтобы её можно было передать в процесс.
+    В stats суммируются счётчики всех процессов.
+    """
+    position = board.snapshot()
+    memory = const.TT_MEMORY // workers
+    pool = get_pool(workers)
+    if mode not in ("split", "smp"):
+        raise ValueError("Неизвестный режим параллельного перебора: " + mode)
+    if mode == "split":
+        moves = AlphaBetaSearch(board, evaluate)._generate_root_moves()
+        # Ходы раздаются по кругу, чтобы у каждого процесса были как
+        # перспективные, так и слабые ходы.
+        parts = [moves[i::workers] for i in range(workers)]
+        futures = [pool.submit(_search_worker, position, evaluate,
+                               time_limit, max_depth, memory, part, None)
+                   for part in parts if part]
+    else:
+        futures = [pool.submit(_search_worker, position, evaluate,
+                               time_limit, max_depth, memory, None, i or None)
+                   for i in range(workers)]
+    results = [future.result() for future in futures]
+    if stats is not None:
+        for result in results:
+            stats.merge(result)
+    iterations = [result.iterations for result in results]
+    if mode == "split":
+        return _merge_split(iterations)
+    return _merge_smp(iterations)
@@ -0,0 +1,131 @@
+"""Модуль, описывающий позицию - неизменяемый снимок доски.
+
+Позиция хранит всё, что нужно, чтобы восстановить доску без потерь:
+размеры поля, длину выигрышного ряда, правила и ходы по порядку. Всё это
+лежит в одной строке байт, которая одновременно служит кодировкой
+позиции:
+    версия кодировки, высота и ширина поля, длина выигрышного ряда,
+    флаги (бит 0 - правила рэндзю) - по байту;
+    затем по два байта (строка, столбец) на каждый ход.
+Поэтому сравнение и хеширование позиций - это сравнение и хеширование
+строк байт, а кодирование ничего не стоит. Позиция занимает
+5 + 2 * число ходов байт и так же компактно передаётся в другие
+процессы.
+
+Две позиции равны, только если ходы в них сделаны в одном порядке.
+Ключ, не зависящий от порядка ходов, - Board.hash_key.
+"""
+
+from . import const
+from typing import List, Optional, Sequence, Tuple
+import struct
+
+VERSION = 1
+_HEADER = struct.Struct("<BBBBB")
+_RENJU_FLAG = 1
+
+
+class Position:
+    """Неизменяемый снимок доски. Создаётся из параметров поля и ходов,
+    методом Board.snapshot или из кодировки методом decode.
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, size: Optional[Tuple[int, int]] = None,
+                 win_length: Optional[int] = None,
+                 renju: Optional[bool] = None,
+                 moves: Sequence[Tuple[int, int]] = ()) -> None:
+        if size is None:
+            size = const.BOARD_SIZE
+        if win_length is None:
+            win_length = const.WIN_ROW_LENGTH
+        if renju is None:
+            renju = const.RENJU_RULES
+        data = bytearray(_HEADER.pack(VERSION, size[0], size[1], win_length,
+                                      _RENJU_FLAG if renju else 0))
+        for row, column in moves:
+            if not (0 <= row < size[0] and 0 <= column < size[1]):
+                raise IndexError(
+                    "Клетка {} вне игрового поля.".format((row, column)))
+            data += bytes((row, column))
+        self._data = bytes(data)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "Position":
+        """Восстанавливает позицию из результата encode. Бросает
+        ValueError, если данные повреждены или записаны другой версией.
+        """
+        if len(data) < _HEADER.size or (len(data) - _HEADER.size) % 2:
+            raise ValueError("Позиция повреждена")
+        version, height, width, win_length, flags = \
+            _HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ValueError("Неизвестная версия позиции: %d" % version)
+        for i in range(_HEADER.size, len(data), 2):
+            if data[i] >= height or data[i + 1] >= width:
+                raise ValueError("Позиция повреждена")
+        position = cls.__new__(cls)
+        position._data = bytes(data)
+        return position
+
+    def encode(self) -> bytes:
+        """Возвращает кодировку позиции."""
+        return self._data
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Размеры поля."""
+        return self._data[1], self._data[2]
+
+    @property
+    def win_length(self) -> int:
+        """Длина выигрышного ряда."""
+        return self._data[3]
+
+    @property
+    def renju(self) -> bool:
+        """Действуют ли правила рэндзю."""
+        return bool(self._data[4] & _RENJU_FLAG)
+
+    @property
+    def moves(self) -> List[Tuple[int, int]]:
+        """Ходы позиции по порядку."""
+        data = self._data
+        return [(data[i], data[i + 1])
+                for i in range(_HEADER.size, len(data), 2)]
+
+    def __len__(self) -> int:
+        """Число сделанных ходов."""
+        return (len(self._data) - _HEADER.size) // 2
+
+    def play(self, pos: Tuple[int, int]) -> "Position":
+        """Возвращает позицию после хода pos. Занятость клетки не
+        проверяется.
+        """
+        if not (0 <= pos[0] < self._data[1] and 0 <= pos[1] < self._data[2]):
+            raise IndexError("Клетка {} вне игрового поля.".format(pos))
+        position = Position.__new__(Position)
+        position._data = self._data + bytes(pos)
+        return position
+
+    def prefix(self, ply: int) -> "Position":
+        """Возвращает позицию после первых ply ходов."""
+        position = Position.__new__(Position)
+        position._data = self._data[:_HEADER.size + 2 * ply]
+        return position
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Position):
+            return NotImplemented
+        return self._data == other._data
+
+    def __hash__(self) -> int:
+        return hash(self._data)
+
+    def __reduce__(self):
+        return Position.decode, (self._data,)
+
+    def __repr__(self) -> str:
+        return "Position(%r, %d, %r, %r)" % (self.size, self.win_length,
+                                             self.renju, self.moves)
@@ -0,0 +1,158 @@
+"""Модуль, реализующий запрещённые ходы чёрных по правилам рэндзю.
+
+Чёрным запрещены ходы, после которых у них получается:
+двойная тройка - сразу две открытые тройки;
+двойная четвёрка - сразу две четвёрки;
+длинный ряд - больше win_length фишек подряд.
+Ход, дающий ровно win_length фишек подряд, разрешён всегда.
+
+Для каждой клетки и каждого направления доска хранит код линии:
+состояния win_length клеток по каждую сторону от клетки в троичной
+записи (0 - пусто, 1 - чёрная фишка, 2 - белая фишка или край поля).
+Таблица get_pattern_table по коду линии сразу даёт, что получится на
+этой линии, если поставить в клетку чёрную фишку.
+
+Открытая тройка определяется без рекурсии: не проверяется, разрешён ли
+ход, превращающий её в открытую четвёрку.
+
+Таблица строится долго (3 ** (2 * win_length) кодов), поэтому хранится
+в кэше таблиц на диске (см. модуль cache).
+"""
+
+from . import cache
+import functools
+from typing import Dict, List, Sequence, Tuple
+
+# Значения таблицы подобраны так, чтобы их можно было сложить по четырём
+# направлениям: число четвёрок (не больше двух на линию) занимает
+# младшие четыре бита, открытые тройки - следующие три.
+FOUR = 1
+THREE = 16
+OVERLINE = 128
+FIVE = 1024
+# Версия алгоритма построения таблицы; меняется вместе с ним, чтобы
+# таблицы в кэше построились заново.
+_TABLE_VERSION = 1
+
+
+def _get_run(line: str, center: int) -> Tuple[int, int]:
+    """Возвращает границы (начало, конец + 1) ряда чёрных фишек,
+    проходящего через клетку center.
+    """
+    start = max(line.rfind("0", 0, center), line.rfind("2", 0, center)) + 1
+    ends = [i for i in (line.find("0", center), line.find("2", center))
+            if i >= 0]
+    return start, min(ends) if ends else len(line)
+
+
+def _put(line: str, i: int) -> str:
+    """Ставит чёрную фишку в клетку i линии."""
+    return line[:i] + "1" + line[i + 1:]
+
+
+def _is_five(line: str, center: int, win_length: int) -> bool:
+    """Проверяет, что через center проходит ряд ровно из win_length
+    чёрных фишек.
+    """
+    start, end = _get_run(line, center)
+    return end - start == win_length
+
+
+def analyse_line(line: str, win_length: int) -> int:
+    """Возвращает значение таблицы для линии line длины
+    2 * win_length + 1, в центре которой стоит чёрная фишка.
+    """
+    center = win_length
+    start, end = _get_run(line, center)
+    if end - start == win_length:
+        return FIVE
+    if end - start > win_length:
+        return OVERLINE
+    # Четвёрки: пустые клетки, ход в которые даёт пятёрку через центр.
+    # Прямая четвёрка даёт две такие клетки, но считается одной, поэтому
+    # четвёрки различаются по набору своих фишек.
+    fours = set()
+    for i in range(max(end - win_length, 0),
+                   min(start + win_length, len(line))):
+        if line[i] != "0":
+            continue
+        changed = _put(line, i)
+        if _is_five(changed, center, win_length):
+            run = _get_run(changed, center)
+            fours.add(tuple(j for j in range(*run) if j != i))
+    if fours:
+        return FOUR * min(len(fours), 2)
+    # Открытая тройка: ход, после которого получается открытая четвёрка -
+    # win_length - 1 фишек с пустыми клетками по краям, каждая из которых
+    # даёт пятёрку.
+    for i in range(max(end - win_length + 1, 0),
+                   min(start + win_length - 1, len(line))):
+        if line[i] != "0":
+            continue
+        changed = _put(line, i)
+        run_start, run_end = _get_run(changed, center)
+        if run_end - run_start != win_length - 1 or run_start == 0 or \
+                run_end == len(changed) or changed[run_start - 1] != "0" or \
+                changed[run_end] != "0":
+            continue
+        if _is_five(_put(changed, run_start - 1), center, win_length) and \
+                _is_five(_put(changed, run_end), center, win_length):
+            return THREE
+    return 0
+
+
+def _get_sides(win_length: int) -> Tuple[List[str], List[str]]:
+    """Возвращает строки всех кодов половины линии слева и справа от
+    центра. Клетки за белой фишкой или краем поля ни на что не влияют,
+    поэтому заменяются на "2": так совпадающих строк становится больше.
+    """
+    left = list()
+    right = list()
+    for code in range(3 ** win_length):
+        digits = list()
+        for k in range(win_length):
+            digits.append("012"[code % 3])
+            code //= 3
+        side = "".join(digits)
+        blocked = side.rfind("2")
+        left.append("2" * blocked + side[blocked:] if blocked > 0 else side)
+        blocked = side.find("2")
+        right.append(side[:blocked] + "2" * (win_length - blocked)
+                     if blocked >= 0 else side)
+    return left, right
+
+
+def build_pattern_table(win_length: int) -> List[int]:
+    """Строит таблицу значений для всех кодов линий. В коде линии
+    клетки идут от дальней слева к дальней справа, младший троичный
+    разряд соответствует дальней клетке слева.
+    """
+    left, right = _get_sides(win_length)
+    cache: Dict[str, int] = dict()
+    table = list()
+    for right_side in right:
+        for left_side in left:
+            line = left_side + "1" + right_side
+            value = cache.get(line)
+            if value is None:
+                value = cache[line] = analyse_line(line, win_length)
+            table.append(value)
+    return table
+
+
+@functools.lru_cache(maxsize=None)
+def get_pattern_table(win_length: int) -> Sequence[int]:
+    """Возвращает таблицу build_pattern_table из кэша таблиц."""
+    return cache.load_table(
+        "patterns-%d-v%d" % (win_length, _TABLE_VERSION), "H",
+        lambda: build_pattern_table(win_length))
+
+
+def is_forbidden_value(value: int) -> bool:
+    """Проверяет по сумме значений таблицы для четырёх направлений,
+    запрещён ли ход чёрных.
+    """
+    if value >= FIVE:
+        return False
+    return value >= OVERLINE or value % THREE >= 2 or \
+        value // THREE % 8 >= 2
@@ -1,5 +1,27 @@
+from .board import Board
 from .game import Game
 from . import const
+from pathlib import Path
+from typing import Sequence, Tuple
+import os
+import struct
+import tempfile
+
+# Журнал ходов - двоичный файл из сигнатуры, заголовка с параметрами
+# партии и записей ходов одинаковой длины.
+JOURNAL_MAGIC = b"RNJ2"
+# Журнал первой версии не содержал заголовка, партия в нём идёт с
+# параметрами по умолчанию.
+OLD_JOURNAL_MAGIC = b"RNJ1"
+# Заголовок: высота и ширина поля, длина выигрышного ряда и флаги (бит 0 -
+# правила рэндзю).
+JOURNAL_HEADER = struct.Struct("<BBBB")
+RENJU_FLAG = 1
+# Запись: тип (MOVE_RECORD или UNDO_RECORD), клетка хода и его
+# длительность в секундах.
+JOURNAL_RECORD = struct.Struct("<cBBd")
+MOVE_RECORD = b"m"
+UNDO_RECORD = b"u"
 
 
 class Saver:
@@ -14,3 +36,63 @@ class Saver:
                 move_duration = game.moves_durations[i]
                 f.write("%d %d %.4f\n" % (move_pos[0], move_pos[1],
                                           move_duration))
+
+
+class Journal:
+    """Журнал ходов партии. Каждый ход и каждая отмена хода дописываются
+    в конец файла одной записью фиксированной длины и сразу сбрасываются
+    на диск, поэтому при аварийном завершении теряется не больше одного
+    хода. Файл не меняется, пока в журнал не записана партия методом
+    rewrite.
+    """
+
+    def __init__(self, path: Path = const.JOURNAL_PATH) -> None:
+        self.path = path
+        self._file = None
+
+    def _append(self, record: bytes) -> None:
+        """Дописывает запись в журнал."""
+        self._file.write(record)
+        self._file.flush()
+
+    def append_move(self, pos: Tuple[int, int], duration: float) -> None:
+        """Записывает ход."""
+        self._append(JOURNAL_RECORD.pack(MOVE_RECORD, pos[0], pos[1],
+                                         duration))
+
+    def append_undo(self) -> None:
+        """Записывает отмену последнего хода."""
+        self._append(JOURNAL_RECORD.pack(UNDO_RECORD, 0, 0, 0.0))
+
+    def rewrite(self, board: Board, durations: Sequence[float]) -> None:
+        """Заменяет содержимое журнала параметрами и ходами партии на
+        доске board. Новый журнал пишется во временный файл, который
+        затем переименовывается, поэтому при аварийном завершении на
+        диске остаётся старый или новый журнал целиком.
+        """
+        data = bytearray(JOURNAL_MAGIC)
+        data += JOURNAL_HEADER.pack(board.size[0], board.size[1],
+                                    board.win_length,
+                                    RENJU_FLAG if board.renju else 0)
+        for pos, duration in zip(board.moves, durations):
+            data += JOURNAL_RECORD.pack(MOVE_RECORD, pos[0], pos[1],
+                                        duration)
+        self.close()
+        fd, name = tempfile.mkstemp(dir=str(self.path.parent),
+                                    suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(name, str(self.path))
+        except BaseException:
+            os.unlink(name)
+            raise
+        self._file = self.path.open("ab")
+
+    def close(self) -> None:
+        """Закрывает файл журнала."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,369 @@
+"""Модуль, реализующий перебор с альфа-бета отсечениями."""
+
+from .board import Board, BoardState
+from .stats import IterationStats, SearchStats
+from .tt import Bound, TranspositionTable
+from . import const
+from typing import Callable, Dict, List, Optional, Tuple
+import time
+
+
+class SearchTimeout(Exception):
+    """Перебор прерван: закончилось время или поступил запрос остановки."""
+
+
+class AlphaBetaSearch:
+    """Перебор с альфа-бета отсечениями (principal variation search),
+    итеративным углублением и окнами стремления.
+
+    Поиск можно прервать в любой момент, дождавшись deadline или вызвав
+    stop(). Тогда результатом будет лучший ход последней полностью
+    просмотренной глубины. Если передана таблица транспозиций, оценки
+    и лучшие ходы позиций сохраняются в ней и переиспользуются.
+
+    Рассматриваются только кандидаты доски (клетки рядом с фишками).
+    Ходы упорядочиваются так: ход из таблицы транспозиций, ходы-убийцы
+    текущей глубины, остальные - по убыванию эвристики истории. Если у
+    ходящего есть выигрыш в один ход, рассматривается только он; если
+    выигрыш в один ход есть у соперника - только защиты от него.
+    Если задан список root_moves, в корне перебираются только эти ходы.
+
+    Счётчики перебора и итоги глубин записываются в stats. Если объект
+    не передан, создаётся новый только для счётчиков, а итоги глубин с
+    главной линией не собираются.
+
+    Итеративное углубление начинается с глубины start_depth. Ходы-убийцы
+    killers (по спискам на каждую глубину от корня) и таблицы истории
+    history можно передать от предыдущего перебора; тогда перебор
+    продолжает их заполнять. Если до запуска задан best_move, он
+    просматривается в корне первым, а окно стремления первой глубины
+    строится вокруг best_score.
+    """
+
+    def __init__(self, board: Board, evaluate: Callable[[Board], int],
+                 deadline: Optional[float] = None,
+                 max_depth: int = const.MAX_SEARCH_DEPTH,
+                 table: Optional[TranspositionTable] = None,
+                 root_moves: Optional[List[Tuple[int, int]]] = None,
+                 stats: Optional[SearchStats] = None, start_depth: int = 1,
+                 killers: Optional[List[List[Tuple[int, int]]]] = None,
+                 history: Optional[List[Dict[Tuple[int, int], int]]] = None) \
+            -> None:
+        self.board = board
+        self.evaluate = evaluate
+        self.table = table
+        self.root_moves = root_moves
+        self.deadline = deadline
+        self.max_depth = max_depth
+        self.start_depth = start_depth
+        self.stats = stats if stats is not None else SearchStats()
+        self._record_iterations = stats is not None
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = 0
+        self.table_hits = 0
+        self.stopped = False
+        self.completed_depth = 0
+        self.best_move = (-1, -1)
+        self.best_score = 0
+        # Результаты полностью просмотренных глубин: (глубина, оценка, ход).
+        self.iterations: List[Tuple[int, int, Tuple[int, int]]] = list()
+        self.killers: List[List[Tuple[int, int]]] = \
+            killers if killers is not None else list()
+        self.killers += [list() for i in range(max_depth + 1 -
+                                               len(self.killers))]
+        self.history: List[Dict[Tuple[int, int], int]] = \
+            history if history is not None else [dict(), dict()]
+
+    def stop(self) -> None:
+        """Просит поиск завершиться как можно скорее."""
+        self.stopped = True
+
+    def _check_time(self) -> None:
+        """Бросает SearchTimeout, если поиск пора прекращать."""
+        if self.stopped or (self.deadline is not None and
+                            time.monotonic() >= self.deadline):
+            self.stopped = True
+            raise SearchTimeout()
+
+    def _generate_moves(self, ply: int,
+                        first: Tuple[int, int] = (-1, -1)) \
+            -> List[Tuple[int, int]]:
+        """Возвращает упорядоченный список ходов для перебора."""
+        board = self.board
+        player = board.whose_move
+        wins = board.get_winning_cells(player)
+        if wins:
+            return [min(wins)]
+        blocks = [move for move in board.get_winning_cells(1 - player)
+                  if not board.is_forbidden(move)]
+        if blocks:
+            return sorted(blocks)
+        moves = board.get_candidates()
+        if not moves:
+            moves = _get_empty_cells(board)
+        history = self.history[player]
+        moves.sort(key=lambda move: history.get(move, 0), reverse=True)
+        front = [first] if first in moves else []
+        for killer in self.killers[ply]:
+            if killer != first and killer in moves:
+                front.append(killer)
+        if front:
+            moves = front + [move for move in moves if move not in front]
+        return moves
+
+    def _generate_root_moves(self) -> List[Tuple[int, int]]:
+        """Возвращает ходы корня: лучший ход предыдущей итерации первым,
+        только из root_moves, если этот список задан.
+        """
+        moves = self._generate_moves(0, self.best_move)
+        if self.root_moves is not None:
+            moves = [move for move in moves if move in self.root_moves]
+        return moves
+
+    def _update_heuristics(self, move: Tuple[int, int], depth: int,
+                           ply: int) -> None:
+        """Запоминает ход, вызвавший отсечение, как ход-убийцу и
+        увеличивает его значение эвристики истории.
+        """
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[const.KILLER_MOVES:]
+        history = self.history[self.board.whose_move]
+        history[move] = history.get(move, 0) + depth * depth
+
+    def _negamax(self, depth: int, ply: int, alpha: int, beta: int) -> int:
+        """Возвращает оценку позиции для того, кто сейчас будет ходить,
+        с точностью до окна (alpha, beta).
+        """
+        self.nodes += 1
+        if not self.nodes & const.SEARCH_CHECK_PERIOD:
+            self._check_time()
+        if depth == 0:
+            self.leaves += 1
+            return self.evaluate(self.board)
+        board = self.board
+        table = self.table
+        tt_move = (-1, -1)
+        if table is not None:
+            entry = table.probe(board.hash_key)
+            if entry is not None:
+                tt_move = entry.move
+                if entry.depth >= depth:
+                    score = _score_from_table(entry.score, ply)
+                    if entry.bound == Bound.EXACT or \
+                            entry.bound == Bound.LOWER and score >= beta or \
+                            entry.bound == Bound.UPPER and score <= alpha:
+                        self.table_hits += 1
+                        return score
+        original_alpha = alpha
+        best = -const.MINIMAX_INF - 1
+        best_move = (-1, -1)
+        first = True
+        for move in self._generate_moves(ply, tt_move):
+            board.do_move(move)
+            if board.state in (BoardState.WHITE_WINS, BoardState.BLACK_WINS):
+                board.undo_move()
+                if table is not None:
+                    table.store(board.hash_key, depth, Bound.LOWER,
+                                _score_to_table(const.MINIMAX_INF - ply, ply),
+                                move)
+                return const.MINIMAX_INF - ply
+            if board.state == BoardState.DRAW:
+                score = 0
+            elif first:
+                score = -self._negamax(depth - 1, ply + 1, -beta, -alpha)
+            else:
+                # Остальные ходы сначала проверяются нулевым окном.
+                score = -self._negamax(depth - 1, ply + 1,
+                                       -alpha - 1, -alpha)
+                if alpha < score < beta:
+                    score = -self._negamax(depth - 1, ply + 1,
+                                           -beta, -score)
+            board.undo_move()
+            first = False
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        self._update_heuristics(move, depth, ply)
+                        break
+        if table is not None:
+            if best >= beta:
+                bound = Bound.LOWER
+            elif best > original_alpha:
+                bound = Bound.EXACT
+            else:
+                bound = Bound.UPPER
+            table.store(board.hash_key, depth, bound,
+                        _score_to_table(best, ply), best_move)
+        return best
+
+    def _search_root(self, depth: int, alpha: int, beta: int) \
+            -> Tuple[int, Tuple[int, int]]:
+        """Перебирает ходы из корня на глубину depth."""
+        board = self.board
+        best_score = -const.MINIMAX_INF - 1
+        best_move = (-1, -1)
+        for move in self._generate_root_moves():
+            board.do_move(move)
+            if board.state in (BoardState.WHITE_WINS, BoardState.BLACK_WINS):
+                board.undo_move()
+                return const.MINIMAX_INF, move
+            if board.state == BoardState.DRAW:
+                score = 0
+            elif best_move == (-1, -1):
+                score = -self._negamax(depth - 1, 1, -beta, -alpha)
+            else:
+                score = -self._negamax(depth - 1, 1, -alpha - 1, -alpha)
+                if alpha < score < beta:
+                    score = -self._negamax(depth - 1, 1, -beta, -score)
+            board.undo_move()
+            if score > best_score or best_move == (-1, -1):
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        break
+        return best_score, best_move
+
+    def _search_depth(self, depth: int) -> Tuple[int, Tuple[int, int]]:
+        """Перебор на глубину depth с окном стремления вокруг оценки
+        предыдущей итерации. Если оценка вышла за окно, перебор
+        повторяется с полным окном.
+        """
+        full = (-const.MINIMAX_INF - 1, const.MINIMAX_INF + 1)
+        if self.best_move == (-1, -1) or \
+                abs(self.best_score) >= const.MINIMAX_INF // 2:
+            return self._search_root(depth, *full)
+        alpha = self.best_score - const.ASPIRATION_WINDOW
+        beta = self.best_score + const.ASPIRATION_WINDOW
+        score, move = self._search_root(depth, alpha, beta)
+        if alpha < score < beta:
+            return score, move
+        return self._search_root(depth, *full)
+
+    def get_principal_variation(self, move: Tuple[int, int],
+                                max_length: int) -> List[Tuple[int, int]]:
+        """Возвращает главную линию, начинающуюся ходом move: лучшие
+        ходы следующих позиций берутся из таблицы транспозиций.
+        """
+        board = self.board
+        pv = [move]
+        if self.table is None or move == (-1, -1):
+            return pv
+        board.do_move(move)
+        while len(pv) < max_length and board.state == BoardState.GAMING:
+            entry = self.table.probe(board.hash_key)
+            if entry is None or entry.move == (-1, -1) or \
+                    board[entry.move]:
+                break
+            pv.append(entry.move)
+            board.do_move(entry.move)
+        for i in range(len(pv)):
+            board.undo_move()
+        return pv
+
+    def _update_stats(self, start: float) -> None:
+        """Переносит счётчики перебора в stats."""
+        stats = self.stats
+        stats.nodes = self.nodes
+        stats.leaves = self.leaves
+        stats.cutoffs = self.cutoffs
+        stats.table_hits = self.table_hits
+        stats.time = time.monotonic() - start
+
+    def run(self) -> Tuple[int, Tuple[int, int]]:
+        """Итеративно углубляет перебор, пока не кончится время или не
+        будет достигнута глубина max_depth. Возвращает оценку и ход
+        последней полностью просмотренной глубины.
+        """
+        board = self.board
+        root_length = len(board.moves)
+        start = time.monotonic()
+        for depth in range(min(self.start_depth, self.max_depth),
+                           self.max_depth + 1):
+            try:
+                score, move = self._search_depth(depth)
+            except SearchTimeout:
+                while len(board.moves) > root_length:
+                    board.undo_move()
+                break
+            self.best_score, self.best_move = score, move
+            self.completed_depth = depth
+            self.iterations.append((depth, score, move))
+            self._update_stats(start)
+            if self._record_iterations:
+                self.stats.add_iteration(IterationStats(
+                    depth, score, move, self.nodes, self.stats.time,
+                    self.get_principal_variation(move, depth)))
+            if abs(score) >= const.MINIMAX_INF - self.max_depth:
+                break
+            # Следующая итерация обычно длится в несколько раз дольше
+            # текущей, и начинать её без шансов закончить бессмысленно.
+            if self.deadline is not None and \
+                    time.monotonic() - start > (self.deadline - start) / 2:
+                break
+        if self.best_move == (-1, -1):
+            moves = self._generate_root_moves()
+            if moves:
+                self.best_move = moves[0]
+        self._update_stats(start)
+        return self.best_score, self.best_move
+
+
+def _get_empty_cells(board: Board) -> List[Tuple[int, int]]:
+    """Возвращает ходы для доски без кандидатов: центр пустой доски или,
+    если фишки уже есть, все пустые клетки, ход в которые разрешён.
+    """
+    if not board.moves:
+        center = (board.size[0] // 2, board.size[1] // 2)
+        if not board[center]:
+            return [center]
+    return [(row, column) for row in range(board.size[0])
+            for column in range(board.size[1])
+            if not board[row, column] and
+            not board.is_forbidden((row, column))]
+
+
+def _score_to_table(score: int, ply: int) -> int:
+    """Переводит оценку выигрыша из расстояния от корня в расстояние от
+    текущей позиции, чтобы её можно было использовать на другой глубине.
+    """
+    if score >= const.MINIMAX_INF // 2:
+        return score + ply
+    if score <= -const.MINIMAX_INF // 2:
+        return score - ply
+    return score
+
+
+def _score_from_table(score: int, ply: int) -> int:
+    """Обратное к _score_to_table преобразование."""
+    if score >= const.MINIMAX_INF // 2:
+        return score - ply
+    if score <= -const.MINIMAX_INF // 2:
+        return score + ply
+    return score
+
+
+def iterative_deepening(board: Board, evaluate: Callable[[Board], int],
+                        time_limit: Optional[float] = None,
+                        max_depth: int = const.MAX_SEARCH_DEPTH,
+                        table: Optional[TranspositionTable] = None,
+                        stats: Optional[SearchStats] = None) \
+        -> Tuple[int, Tuple[int, int]]:
+    """Возвращает оценку ситуации на доске и клетку, в которую нужно
+    сделать ход, найденные за время time_limit секунд. Статистика
+    перебора записывается в stats.
+    """
+    deadline = None
+    if time_limit is not None:
+        deadline = time.monotonic() + time_limit
+    return AlphaBetaSearch(board, evaluate, deadline, max_depth,
+                           table, stats=stats).run()
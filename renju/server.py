@@ -0,0 +1,303 @@
+"""Модуль, реализующий сервер для игры без окна по сети.
+
+Сервер принимает TCP-соединения; каждое соединение - отдельная партия,
+в которой клиент играет чёрными, а компьютер - белыми. Команды и ответы
+передаются строками:
+    move R C  - сделать ход; ответ "ok R C СОСТОЯНИЕ" с ответным ходом
+                компьютера или "ok - СОСТОЯНИЕ", если партия закончилась;
+    undo      - отменить свой последний ход (и ответ компьютера);
+                ответ "ok ЧИСЛО_ХОДОВ";
+    state     - "state СОСТОЯНИЕ ЧИСЛО_ХОДОВ R,C R,C ...";
+    clock     - "clock ВРЕМЯ_ЧЁРНЫХ ВРЕМЯ_БЕЛЫХ" в секундах;
+    new       - начать новую партию;
+    quit      - закрыть соединение.
+СОСТОЯНИЕ - gaming, black, white или draw. При ошибке сервер отвечает
+"error ОПИСАНИЕ", а если очередь к компьютеру переполнена - "error busy".
+
+Ходы компьютера выбираются в workers процессах. Партия определяется
+номером, который меняется при команде new, и все её ходы выбираются в
+одном процессе (номер партии по модулю workers). Каждый процесс хранит
+состояние компьютера (engine.Engine) для const.SERVER_ENGINES последних
+своих партий, поэтому таблица транспозиций и главная линия переживают
+ход. Состояние давно не встречавшейся партии очищается и отдаётся
+новой.
+
+Каждый процесс выполняет один перебор за раз, ещё не больше max_queue
+запросов ко всем процессам ждут очереди. Команды одной партии
+выполняются по порядку: пока компьютер думает, следующие строки
+клиента не читаются.
+
+Запуск: python -m renju.server --port 7777 --workers 4
+"""
+
+from .board import Board, BoardState, Player
+from .game import Game
+from .position import Position
+from . import const, engine
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+import argparse
+import asyncio
+import itertools
+import sys
+
+STATES = {BoardState.GAMING: "gaming", BoardState.BLACK_WINS: "black",
+          BoardState.WHITE_WINS: "white", BoardState.DRAW: "draw"}
+
+
+class ServerBusy(Exception):
+    """Очередь запросов к компьютеру переполнена."""
+
+
+# Состояния компьютера в процессе пула по номерам партий, от давно не
+# встречавшихся к последним.
+_engines: "OrderedDict[int, engine.Engine]" = OrderedDict()
+# Номера партий сервера.
+_game_ids = itertools.count()
+
+
+def _init_worker(weights: List[int]) -> None:
+    """Настраивает процесс пула: передаёт ему веса оценочной функции,
+    загруженные сервером.
+    """
+    const.RATE_WEIGHTS = weights
+
+
+def _get_engine(game_id: int) -> engine.Engine:
+    """Возвращает состояние компьютера в партии game_id."""
+    if game_id in _engines:
+        _engines.move_to_end(game_id)
+        return _engines[game_id]
+    if len(_engines) >= const.SERVER_ENGINES:
+        state = _engines.popitem(last=False)[1]
+        state.reset()
+    else:
+        state = engine.Engine(const.ARENA_TT_MEMORY)
+    _engines[game_id] = state
+    return state
+
+
+def _engine_worker(game_id: int, position: Position,
+                   time_limit: float) -> Tuple[int, int]:
+    """Выбирает ход компьютера в партии game_id в процессе пула."""
+    return _get_engine(game_id).choose_move(
+        Board.from_position(position), time_limit)[1]
+
+
+class EnginePool:
+    """Процессы для выбора ходов компьютера с ограниченной очередью;
+    партия всегда попадает в один и тот же процесс. Создаётся в том же
+    цикле событий, в котором используется.
+    """
+
+    def __init__(self, workers: int = const.SERVER_WORKERS,
+                 max_queue: int = const.SERVER_MAX_QUEUE) -> None:
+        self._executors = [
+            ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                                initargs=(const.RATE_WEIGHTS,))
+            for i in range(workers)]
+        self._slots = [asyncio.Semaphore(1) for i in range(workers)]
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.running = 0
+
+    async def choose_move(self, game_id: int, board: Board,
+                          time_limit: float) -> Tuple[int, int]:
+        """Возвращает ход компьютера в партии game_id. Бросает
+        ServerBusy, если очередь ожидающих запросов заполнена.
+        """
+        worker = game_id % len(self._executors)
+        slot = self._slots[worker]
+        if self.waiting >= self.max_queue and slot.locked():
+            raise ServerBusy()
+        self.waiting += 1
+        try:
+            await slot.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executors[worker], _engine_worker, game_id,
+                board.snapshot(), time_limit)
+        finally:
+            self.running -= 1
+            slot.release()
+
+    def close(self) -> None:
+        """Завершает процессы."""
+        for executor in self._executors:
+            executor.shutdown()
+
+
+class Session:
+    """Партия одного клиента."""
+
+    def __init__(self, pool: EnginePool,
+                 move_time: Optional[float] = None) -> None:
+        self.pool = pool
+        self.move_time = move_time
+        self.game = Game()
+        self.game_id = next(_game_ids)
+
+    async def handle(self, line: str) -> str:
+        """Выполняет команду и возвращает ответ."""
+        words = line.split()
+        if not words:
+            return "error empty command"
+        command, args = words[0], words[1:]
+        game = self.game
+        game.check_time()
+        if command == "move" and len(args) == 2:
+            return await self._move(args)
+        if command == "undo" and not args:
+            game.undo_move()
+            if game.board.whose_move != Player.BLACK:
+                game.undo_move()
+            return "ok %d" % len(game.board.moves)
+        if command == "state" and not args:
+            return " ".join(["state", STATES[game.board.state],
+                             str(len(game.board.moves))] +
+                            ["%d,%d" % pos for pos in game.board.moves])
+        if command == "clock" and not args:
+            return "clock %.2f %.2f" % game.get_times()
+        if command == "new" and not args:
+            game.restart()
+            self.game_id = next(_game_ids)
+            return "ok"
+        return "error unknown command"
+
+    async def _move(self, args: List[str]) -> str:
+        """Ход клиента и ответ компьютера."""
+        game = self.game
+        board = game.board
+        try:
+            pos = (int(args[0]), int(args[1]))
+        except ValueError:
+            return "error bad move"
+        if board.state != BoardState.GAMING:
+            return "error game over"
+        if board.whose_move != Player.BLACK:
+            return "error not your move"
+        if not board.in_field(pos) or board[pos]:
+            return "error bad move"
+        if board.is_forbidden(pos):
+            return "error forbidden move"
+        game.do_move(pos)
+        if board.state != BoardState.GAMING:
+            return "ok - " + STATES[board.state]
+        time_limit = self.move_time
+        if time_limit is None:
+            time_limit = engine.get_time_budget(game)
+        try:
+            move = await self.pool.choose_move(self.game_id, board,
+                                               time_limit)
+        except ServerBusy:
+            game.undo_move()
+            return "error busy"
+        game.do_move(move)
+        game.check_time()
+        return "ok %d %d %s" % (move[0], move[1], STATES[board.state])
+
+
+class GameServer:
+    """Сервер партий: принимает соединения и создаёт для них партии."""
+
+    def __init__(self, workers: int = const.SERVER_WORKERS,
+                 max_queue: int = const.SERVER_MAX_QUEUE,
+                 move_time: Optional[float] = None) -> None:
+        self.pool = EnginePool(workers, max_queue)
+        self.move_time = move_time
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[asyncio.Future] = set()
+
+    async def start(self, host: str = const.SERVER_HOST,
+                    port: int = const.SERVER_PORT) -> None:
+        """Начинает принимать соединения."""
+        self._server = await asyncio.start_server(self._connect, host, port)
+
+    @property
+    def port(self) -> int:
+        """Порт, на котором работает сервер."""
+        return self._server.sockets[0].getsockname()[1]
+
+    def _connect(self, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter) -> None:
+        """Запускает обработку нового соединения."""
+        client = asyncio.ensure_future(self._serve_client(reader, writer))
+        self._clients.add(client)
+        client.add_done_callback(self._clients.discard)
+
+    async def _serve_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> None:
+        """Выполняет команды клиента, пока он не закроет соединение."""
+        session = Session(self.pool, self.move_time)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line or line.strip() == b"quit":
+                    break
+                response = await session.handle(
+                    line.decode("utf-8", "replace"))
+                writer.write(response.encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def close(self) -> None:
+        """Останавливает сервер, закрывает соединения и пул процессов."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for client in self._clients:
+            client.cancel()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+        self.pool.close()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Парсинг аргументов запуска."""
+    parser = argparse.ArgumentParser(
+        description="Сервер партий против компьютера.")
+    parser.add_argument("--host", default=const.SERVER_HOST,
+                        help="адрес сервера")
+    parser.add_argument("--port", type=int, default=const.SERVER_PORT,
+                        help="порт сервера")
+    parser.add_argument("--workers", type=int, default=const.SERVER_WORKERS,
+                        help="число процессов компьютера")
+    parser.add_argument("--max-queue", type=int,
+                        default=const.SERVER_MAX_QUEUE,
+                        help="число запросов, ожидающих свободный процесс")
+    parser.add_argument("--move-time", type=float,
+                        help="время на ход компьютера в секундах "
+                             "(по умолчанию - по часам партии)")
+    parser.add_argument("--weights", default=str(const.WEIGHTS_PATH),
+                        help="файл весов оценочной функции")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Точка входа."""
+    args = parse_args(argv)
+    # Веса передаются процессам пула при их запуске.
+    engine.load_weights(Path(args.weights))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = GameServer(args.workers, args.max_queue, args.move_time)
+    loop.run_until_complete(server.start(args.host, args.port))
+    print("Сервер запущен: %s:%d" % (args.host, server.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.close())
+        loop.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,96 @@
+"""Модуль, реализующий сбор статистики перебора."""
+
+from typing import Callable, Dict, List, NamedTuple, Optional, TextIO, \
+    Tuple
+import sys
+
+
+class IterationStats(NamedTuple):
+    """Итог одной глубины итеративного углубления."""
+    depth: int
+    score: int
+    move: Tuple[int, int]
+    # Счётчики накоплены с начала перебора.
+    nodes: int
+    time: float
+    pv: List[Tuple[int, int]]
+
+
+# Функция, которая вызывается после каждой законченной глубины.
+Hook = Callable[["SearchStats", IterationStats], None]
+
+
+class SearchStats:
+    """Статистика перебора: посещённые узлы, оценённые листья,
+    отсечения, попадания в таблицу транспозиций и итоги каждой глубины.
+
+    Счётчики заполняет перебор, которому объект передан. Если задан
+    hook, он вызывается после каждой законченной глубины; без него
+    статистика ничего не стоит, кроме увеличения счётчиков.
+    """
+
+    def __init__(self, hook: Optional[Hook] = None) -> None:
+        self.hook = hook
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = 0
+        self.table_hits = 0
+        self.time = 0.0
+        self.iterations: List[IterationStats] = list()
+
+    def add_iteration(self, iteration: IterationStats) -> None:
+        """Запоминает итог глубины и передаёт его в hook."""
+        self.iterations.append(iteration)
+        if self.hook is not None:
+            self.hook(self, iteration)
+
+    def merge(self, other: "SearchStats") -> None:
+        """Прибавляет счётчики другого перебора (например, другого
+        процесса). Итоги глубин не объединяются.
+        """
+        self.nodes += other.nodes
+        self.leaves += other.leaves
+        self.cutoffs += other.cutoffs
+        self.table_hits += other.table_hits
+        self.time = max(self.time, other.time)
+
+    def get_nodes_per_second(self) -> float:
+        """Возвращает скорость перебора в узлах в секунду."""
+        return self.nodes / self.time if self.time > 0 else 0.0
+
+    def to_dict(self) -> Dict:
+        """Возвращает статистику в виде, пригодном для JSON."""
+        return {
+            "nodes": self.nodes,
+            "leaves": self.leaves,
+            "cutoffs": self.cutoffs,
+            "table_hits": self.table_hits,
+            "time": self.time,
+            "iterations": [iteration._asdict()
+                           for iteration in self.iterations],
+        }
+
+    def __getstate__(self) -> Dict:
+        # hook может быть непередаваемым между процессами.
+        state = self.__dict__.copy()
+        state["hook"] = None
+        return state
+
+    def __str__(self) -> str:
+        return "узлов %d, листьев %d, отсечений %d, попаданий %d, " \
+               "%.3f с" % (self.nodes, self.leaves, self.cutoffs,
+                           self.table_hits, self.time)
+
+
+def format_iteration(iteration: IterationStats) -> str:
+    """Возвращает строку с итогом глубины."""
+    return "глубина %d: оценка %d, ход %s, узлов %d, %.3f с, pv %s" % (
+        iteration.depth, iteration.score, iteration.move, iteration.nodes,
+        iteration.time, " ".join("%d,%d" % move for move in iteration.pv))
+
+
+def make_log_hook(stream: TextIO = sys.stderr) -> Hook:
+    """Возвращает hook, печатающий итоги глубин в stream."""
+    def hook(stats: SearchStats, iteration: IterationStats) -> None:
+        print(format_iteration(iteration), file=stream, flush=True)
+    return hook
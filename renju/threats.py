@@ -0,0 +1,200 @@
+"""Модуль, реализующий поиск форсированного выигрыша угрозами.
+
+Угрозы определяются через окна из WIN_ROW_LENGTH клеток, в которых есть
+фишки только одного игрока:
+четвёрка - ход, после которого у игрока есть клетка, дающая пятёрку;
+тройка - ход, после которого игрок следующим ходом может получить сразу
+две такие клетки.
+Поиск VCF (victory by continuous fours) использует только четвёрки,
+поиск VCT (victory by continuous threats) - четвёрки и тройки.
+"""
+
+from .board import Board, CellState
+from . import const
+from typing import Dict, List, Optional, Set, Tuple
+import time
+
+
+_STONES = (CellState.BLACK, CellState.WHITE)
+
+
+class ThreatSearchAbort(Exception):
+    """Поиск угроз прерван: исчерпан лимит узлов или времени."""
+
+
+class ThreatSearch:
+    """Поиск форсированного выигрыша для игрока, который сейчас ходит.
+
+    Атакующий делает только угрожающие ходы, а защищающийся - только
+    ответы, которые могут отразить угрозу: закрытие клетки пятёрки для
+    четвёрки, клетки окон атакующего и собственные четвёрки для тройки.
+    Позиции, в которых выигрыш не найден, запоминаются по ключу Зобриста.
+    """
+
+    def __init__(self, board: Board, max_nodes: int = const.THREAT_MAX_NODES,
+                 deadline: Optional[float] = None) -> None:
+        self.board = board
+        self.max_nodes = max_nodes
+        self.deadline = deadline
+        self.nodes = 0
+        self.stopped = False
+        self._use_threes = False
+        self._failed: Dict[Tuple[int, bool], int] = dict()
+
+    def stop(self) -> None:
+        """Просит поиск завершиться как можно скорее."""
+        self.stopped = True
+
+    def _count_node(self) -> None:
+        """Учитывает узел и бросает ThreatSearchAbort при превышении
+        лимитов или запросе остановки.
+        """
+        self.nodes += 1
+        if self.nodes > self.max_nodes or self.stopped:
+            raise ThreatSearchAbort()
+        if self.deadline is not None and \
+                not self.nodes & const.SEARCH_CHECK_PERIOD and \
+                time.monotonic() >= self.deadline:
+            raise ThreatSearchAbort()
+
+    def _has_double_threat(self, player: int) -> bool:
+        """Проверяет, может ли игрок одним ходом получить две клетки,
+        дающие пятёрку.
+        """
+        board = self.board
+        for move in board.get_window_gaps(player, board.win_length - 2):
+            board[move] = _STONES[player]
+            count = len(board.get_winning_cells(player))
+            board[move] = CellState.EMPTY
+            if count >= 2:
+                return True
+        return False
+
+    def _attack(self, depth: int) -> Optional[List[Tuple[int, int]]]:
+        """Ищет выигрыш за ходящего не более чем за depth угроз.
+        Возвращает последовательность ходов обеих сторон или None.
+        """
+        self._count_node()
+        board = self.board
+        attacker = board.whose_move
+        wins = board.get_winning_cells(attacker)
+        if wins:
+            return [min(wins)]
+        blocks = board.get_winning_cells(1 - attacker)
+        if len(blocks) > 1 or depth == 0:
+            return None
+        key = (board.hash_key, self._use_threes)
+        if self._failed.get(key, -1) >= depth:
+            return None
+        moves = self._get_threat_moves(attacker)
+        if blocks:
+            moves = [move for move in moves if move in blocks]
+        for move in moves:
+            board.do_move(move)
+            line = self._defend(depth - 1)
+            board.undo_move()
+            if line is not None:
+                return [move] + line
+        self._failed[key] = depth
+        return None
+
+    def _get_threat_moves(self, player: int) -> List[Tuple[int, int]]:
+        """Возвращает возможные угрожающие ходы игрока: сначала четвёрки,
+        затем, если разрешены, тройки.
+        """
+        board = self.board
+        fours = sorted(board.get_window_gaps(player,
+                                             board.win_length - 2))
+        if not self._use_threes or board.win_length < 4:
+            return fours
+        threes = board.get_window_gaps(player, board.win_length - 3)
+        return fours + sorted(threes.difference(fours))
+
+    def _defend(self, depth: int) -> Optional[List[Tuple[int, int]]]:
+        """Перебирает ответы защищающегося. Возвращает выигрышную
+        последовательность атакующего против лучшей защиты или None.
+        """
+        self._count_node()
+        board = self.board
+        defender = board.whose_move
+        attacker = 1 - defender
+        if board.get_winning_cells(defender):
+            return None
+        fives = board.get_winning_cells(attacker)
+        if len(fives) >= 2:
+            block = min(fives)
+            return [block, min(fives - {block})]
+        if fives:
+            replies: Set[Tuple[int, int]] = fives
+        elif self._use_threes and self._has_double_threat(attacker):
+            replies = board.get_window_gaps(attacker,
+                                            board.win_length - 2)
+            replies |= board.get_window_gaps(defender,
+                                             board.win_length - 2)
+        else:
+            return None
+        longest: List[Tuple[int, int]] = list()
+        for reply in sorted(replies):
+            if board.is_forbidden(reply):
+                continue
+            board.do_move(reply)
+            line = self._attack(depth)
+            board.undo_move()
+            if line is None:
+                return None
+            if len(line) + 1 > len(longest):
+                longest = [reply] + line
+        return longest
+
+    def find_vcf(self, max_depth: int = const.VCF_MAX_DEPTH) \
+            -> Optional[List[Tuple[int, int]]]:
+        """Ищет выигрыш непрерывными четвёрками."""
+        self._use_threes = False
+        return self._attack(max_depth)
+
+    def find_vct(self, max_depth: int = const.VCT_MAX_DEPTH) \
+            -> Optional[List[Tuple[int, int]]]:
+        """Ищет выигрыш непрерывными угрозами (четвёрками и тройками)."""
+        self._use_threes = True
+        return self._attack(max_depth)
+
+    def run(self, use_threes: bool = True) \
+            -> Optional[List[Tuple[int, int]]]:
+        """Ищет выигрыш сначала непрерывными четвёрками, затем, если
+        use_threes, непрерывными угрозами. При прерывании поиска
+        восстанавливает доску и возвращает None.
+        """
+        board = self.board
+        root_length = len(board.moves)
+        try:
+            line = self.find_vcf()
+            if line is None and use_threes:
+                line = self.find_vct()
+        except ThreatSearchAbort:
+            line = None
+        while len(board.moves) > root_length:
+            board.undo_move()
+        return line
+
+
+def find_forced_win(board: Board, time_limit: Optional[float] = None,
+                    max_nodes: int = const.THREAT_MAX_NODES,
+                    use_threes: bool = True) \
+        -> Optional[List[Tuple[int, int]]]:
+    """Ищет форсированный выигрыш для того, кто сейчас ходит: сначала
+    непрерывными четвёрками, затем, если use_threes, непрерывными
+    угрозами. Возвращает последовательность ходов или None, если
+    выигрыш не найден за отведённые узлы и время.
+    """
+    deadline = None
+    if time_limit is not None:
+        deadline = time.monotonic() + time_limit
+    return ThreatSearch(board, max_nodes, deadline).run(use_threes)
+
+
+def is_forced_win(board: Board, time_limit: Optional[float] = None,
+                  max_nodes: int = const.THREAT_MAX_NODES) -> bool:
+    """Проверяет, есть ли у того, кто сейчас ходит, форсированный
+    выигрыш угрозами.
+    """
+    return find_forced_win(board, time_limit, max_nodes) is not None
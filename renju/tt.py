@@ -0,0 +1,123 @@
+"""Модуль, реализующий таблицу транспозиций для перебора."""
+
+from . import const
+from array import array
+from typing import Dict, NamedTuple, Optional, Tuple
+import enum
+
+
+class Bound(enum.IntEnum):
+    """Описывает, чем является сохранённая оценка:
+    EXACT - точная оценка,
+    LOWER - оценка снизу (произошло отсечение),
+    UPPER - оценка сверху (ни один ход не улучшил alpha).
+    """
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+
+class Entry(NamedTuple):
+    """Запись таблицы транспозиций."""
+    depth: int
+    bound: Bound
+    score: int
+    move: Tuple[int, int]
+
+
+_BOUNDS = (Bound.EXACT, Bound.LOWER, Bound.UPPER)
+
+
+class TranspositionTable:
+    """Таблица транспозиций фиксированного размера.
+
+    Таблица состоит из корзин по две записи. Первая запись корзины
+    заменяется, только если новая запись просчитана не менее глубоко, вторая
+    заменяется всегда. Каждая запись занимает ENTRY_SIZE байт: ключ
+    Зобриста и упакованные в одно 64-битное число глубина, тип оценки,
+    ход и оценка.
+    """
+
+    ENTRY_SIZE = 16
+
+    def __init__(self, memory: int = const.TT_MEMORY) -> None:
+        buckets = 1
+        while buckets * 4 * self.ENTRY_SIZE <= memory:
+            buckets *= 2
+        self._mask = buckets - 1
+        self._keys = array('Q', [0]) * (2 * buckets)
+        self._data = array('q', [0]) * (2 * buckets)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def __len__(self) -> int:
+        """Возвращает число записей, которые помещаются в таблицу."""
+        return len(self._keys)
+
+    @staticmethod
+    def _pack(depth: int, bound: Bound, score: int,
+              move: Tuple[int, int]) -> int:
+        """Упаковывает запись в одно число. Младшие два бита записи
+        никогда не равны нулю, поэтому нулевое число означает пустую
+        запись.
+        """
+        return (score << 24) | (((move[0] & 0xFF) << 8 | move[1] & 0xFF)
+                                << 8) | (min(depth, 63) << 2) | (bound + 1)
+
+    @staticmethod
+    def _unpack(data: int) -> Entry:
+        """Распаковывает запись из числа."""
+        move = ((data >> 16) & 0xFF, (data >> 8) & 0xFF)
+        if move == (0xFF, 0xFF):
+            move = (-1, -1)
+        return Entry((data >> 2) & 63, _BOUNDS[(data & 3) - 1], data >> 24,
+                     move)
+
+    def probe(self, key: int) -> Optional[Entry]:
+        """Возвращает запись для позиции с ключом key или None."""
+        slot = (key & self._mask) << 1
+        keys = self._keys
+        if keys[slot] == key and self._data[slot]:
+            self.hits += 1
+            return self._unpack(self._data[slot])
+        if keys[slot + 1] == key and self._data[slot + 1]:
+            self.hits += 1
+            return self._unpack(self._data[slot + 1])
+        self.misses += 1
+        return None
+
+    def store(self, key: int, depth: int, bound: Bound, score: int,
+              move: Tuple[int, int]) -> None:
+        """Сохраняет запись для позиции с ключом key."""
+        slot = (key & self._mask) << 1
+        data = self._data
+        if self._keys[slot] != key and data[slot] and \
+                (data[slot] >> 2) & 63 > depth:
+            slot += 1
+        if data[slot] and self._keys[slot] != key:
+            self.overwrites += 1
+        self.stores += 1
+        self._keys[slot] = key
+        data[slot] = self._pack(depth, bound, score, move)
+
+    def clear(self) -> None:
+        """Очищает таблицу и статистику."""
+        self._keys = array('Q', [0]) * len(self._keys)
+        self._data = array('q', [0]) * len(self._data)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        """Возвращает статистику использования таблицы."""
+        return {
+            "entries": len(self),
+            "memory": len(self) * self.ENTRY_SIZE,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+        }
@@ -0,0 +1,317 @@
+"""Модуль для настройки весов оценочной функции по результатам партий.
+
+Оценка позиции (engine.rate_function) линейна по весам const.RATE_WEIGHTS:
+она равна сумме по k от 1 до win_length - 1 произведений k-го веса на
+k-й признак - разность числа окон, в которых у ходящего ровно k фишек
+и нет фишек соперника, и таких же окон соперника. Веса подбираются
+логистической регрессией в духе метода Texel: вероятность победы
+ходящего считается равной 1 / (1 + exp(-оценка / const.MCTS_EVAL_SCALE))
+(в том же масштабе оценки переводит в вероятности поиск Монте-Карло), и
+по результатам партий (ничья - половина победы) минимизируется
+логарифмическая функция потерь.
+
+Настройка делается в два шага:
+extract - партии читаются потоком, позиции пачками по
+const.TUNING_BATCH переводятся в признаки с помощью numpy и
+дописываются в файл признаков;
+fit - файл признаков отображается в память, и веса находятся методом
+Ньютона: каждый шаг проходит файл кусками по const.TUNING_CHUNK строк,
+накапливая градиент и матрицу вторых производных.
+Память в обоих шагах ограничена размером пачки и не зависит от числа
+позиций.
+
+Веса записываются в файл JSON, который engine.load_weights читает при
+запуске программы.
+
+Запуск:
+    python -m renju.tuning extract features.bin arena.jsonl save.txt
+    python -m renju.tuning fit features.bin --output weights.json
+"""
+
+from .board import Board, BoardState, CellState, Player
+from .gamestore import read_games
+from . import const, vector_eval
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import argparse
+import json
+import math
+import struct
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_MAGIC = b"RNJT"
+_VERSION = 1
+# Заголовок файла признаков: сигнатура, версия, длина выигрышного ряда.
+# Дальше идут строки из win_length чисел float32: признаки позиции и
+# результат партии для того, кто ходит.
+_HEADER = struct.Struct("<4sHBx")
+
+# Результат партии для чёрных и для белых.
+_SCORES = {BoardState.BLACK_WINS: (1.0, 0.0),
+           BoardState.WHITE_WINS: (0.0, 1.0),
+           BoardState.DRAW: (0.5, 0.5)}
+
+
+def _require_numpy() -> None:
+    """Бросает ImportError, если numpy не установлен."""
+    if np is None:
+        raise ImportError("Для настройки весов нужен модуль numpy")
+
+
+def get_features(cells: "np.ndarray", to_move: "np.ndarray",
+                 win_length: int = const.WIN_ROW_LENGTH) -> "np.ndarray":
+    """Для стопки полей (N, высота, ширина) со значениями CellState и
+    массива (N,) того, кто ходит, возвращает признаки (N, win_length - 1).
+    Оценка позиции равна произведению признаков на веса
+    RATE_WEIGHTS[1:win_length].
+    """
+    _require_numpy()
+    black = np.concatenate(vector_eval.window_counts(
+        (cells == CellState.BLACK).astype(np.int8), win_length), axis=1)
+    white = np.concatenate(vector_eval.window_counts(
+        (cells == CellState.WHITE).astype(np.int8), win_length), axis=1)
+    features = np.empty((len(cells), win_length - 1), dtype=np.int32)
+    for count in range(1, win_length):
+        features[:, count - 1] = \
+            ((black == count) & (white == 0)).sum(axis=1) - \
+            ((white == count) & (black == 0)).sum(axis=1)
+    black_to_move = np.asarray(to_move) == Player.BLACK
+    return np.where(black_to_move[:, np.newaxis], features, -features)
+
+
+def _get_result(moves: Optional[List[Tuple[int, int]]],
+                result: Optional[BoardState]) -> Optional[BoardState]:
+    """Проверяет ходы партии и возвращает её результат. Если он
+    неизвестен, партия разыгрывается на доске. Для повреждённых записей,
+    партий с недопустимыми ходами и незаконченных партий возвращает None.
+    """
+    height, width = const.BOARD_SIZE
+    if moves is None or len(set(moves)) != len(moves) or not all(
+            0 <= row < height and 0 <= column < width
+            for row, column in moves):
+        return None
+    if result is None:
+        board = Board()
+        board.load_moves(moves)
+        result = board.state
+    return result if result in _SCORES else None
+
+
+def _open_features(path: Path, win_length: int):
+    """Открывает файл признаков для дописывания, создавая заголовок
+    нового файла. Бросает ValueError, если файл записан для другой
+    длины выигрышного ряда.
+    """
+    if path.exists() and path.stat().st_size:
+        read_features(path, win_length)
+        return path.open("ab")
+    f = path.open("wb")
+    f.write(_HEADER.pack(_MAGIC, _VERSION, win_length))
+    return f
+
+
+def extract_features(paths: Iterable[Path], output: Path,
+                     batch: int = const.TUNING_BATCH) -> Tuple[int, int]:
+    """Дописывает в файл output признаки всех позиций законченных партий
+    из файлов paths (кроме пустой доски и позиции после последнего
+    хода). Возвращает число партий и позиций.
+    """
+    _require_numpy()
+    height, width = const.BOARD_SIZE
+    win_length = const.WIN_ROW_LENGTH
+    cells = np.zeros((batch, height, width), dtype=np.uint8)
+    to_move = np.zeros(batch, dtype=np.int8)
+    scores = np.zeros(batch, dtype=np.float32)
+    games = 0
+    positions = 0
+    filled = 0
+    with _open_features(output, win_length) as f:
+
+        def flush() -> None:
+            rows = np.empty((filled, win_length), dtype="<f4")
+            rows[:, :-1] = get_features(cells[:filled], to_move[:filled],
+                                        win_length)
+            rows[:, -1] = scores[:filled]
+            f.write(rows.tobytes())
+
+        for path in paths:
+            for moves, result in read_games(path):
+                result = _get_result(moves, result)
+                if result is None:
+                    continue
+                games += 1
+                field = np.zeros((height, width), dtype=np.uint8)
+                for ply, (row, column) in enumerate(moves):
+                    if ply:
+                        cells[filled] = field
+                        to_move[filled] = ply % 2
+                        scores[filled] = _SCORES[result][ply % 2]
+                        filled += 1
+                        positions += 1
+                        if filled == batch:
+                            flush()
+                            filled = 0
+                    field[row, column] = CellState.BLACK + ply % 2
+        if filled:
+            flush()
+    return games, positions
+
+
+def read_features(path: Path, win_length: Optional[int] = None) \
+        -> "np.ndarray":
+    """Отображает файл признаков в память и возвращает массив строк
+    (N, длина выигрышного ряда). Бросает ValueError, если файл повреждён
+    или записан для другой длины выигрышного ряда.
+    """
+    _require_numpy()
+    with path.open("rb") as f:
+        header = f.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        raise ValueError("Файл признаков повреждён")
+    magic, version, length = _HEADER.unpack(header)
+    if magic != _MAGIC or version != _VERSION or \
+            (path.stat().st_size - _HEADER.size) % (4 * length):
+        raise ValueError("Файл признаков повреждён")
+    if win_length is not None and length != win_length:
+        raise ValueError("Файл признаков записан для ряда из %d фишек" %
+                         length)
+    rows = (path.stat().st_size - _HEADER.size) // (4 * length)
+    if not rows:
+        return np.zeros((0, length), dtype="<f4")
+    return np.memmap(str(path), dtype="<f4", mode="r",
+                     offset=_HEADER.size, shape=(rows, length))
+
+
+def _accumulate(data: "np.ndarray", theta: "np.ndarray",
+                chunk: int) -> Tuple[float, float, "np.ndarray",
+                                     "np.ndarray"]:
+    """Проходит строки data кусками по chunk и возвращает средние
+    логарифмическую потерю, квадратичную ошибку, градиент и матрицу
+    вторых производных потери по theta.
+    """
+    size = len(theta)
+    loss = 0.0
+    error = 0.0
+    gradient = np.zeros(size)
+    hessian = np.zeros((size, size))
+    for start in range(0, len(data), chunk):
+        block = np.asarray(data[start:start + chunk], dtype=np.float64)
+        x = block[:, :-1]
+        y = block[:, -1]
+        p = 1.0 / (1.0 + np.exp(-np.clip(x @ theta, -50.0, 50.0)))
+        q = np.clip(p, 1e-12, 1.0 - 1e-12)
+        loss -= (y * np.log(q) + (1.0 - y) * np.log(1.0 - q)).sum()
+        error += ((p - y) ** 2).sum()
+        gradient += x.T @ (p - y)
+        hessian += (x * (p * (1.0 - p))[:, np.newaxis]).T @ x
+    count = max(len(data), 1)
+    return loss / count, error / count, gradient / count, hessian / count
+
+
+def evaluate_weights(data: "np.ndarray", weights: List[int],
+                     chunk: int = const.TUNING_CHUNK) -> Tuple[float, float]:
+    """Возвращает среднюю логарифмическую потерю и квадратичную ошибку
+    (ошибку метода Texel) весов weights на строках data.
+    """
+    weights = list(weights)
+    weights += [weights[-1]] * (data.shape[1] - len(weights))
+    theta = np.array(weights[1:data.shape[1]], dtype=np.float64) / \
+        const.MCTS_EVAL_SCALE
+    return _accumulate(data, theta, chunk)[:2]
+
+
+def fit_weights(data: "np.ndarray",
+                iterations: int = const.TUNING_ITERATIONS,
+                regularization: float = const.TUNING_REGULARIZATION,
+                chunk: int = const.TUNING_CHUNK) -> List[int]:
+    """Подбирает веса по строкам data методом Ньютона. regularization -
+    штраф за квадрат весов (в единицах const.MCTS_EVAL_SCALE), который
+    не даёт весам уходить в бесконечность, когда признак однозначно
+    предсказывает результат. Возвращает веса в формате
+    const.RATE_WEIGHTS.
+    """
+    _require_numpy()
+    size = data.shape[1] - 1
+    theta = np.zeros(size)
+    step = np.zeros(size)
+    previous = math.inf
+    identity = np.eye(size)
+    for i in range(iterations):
+        loss, error, gradient, hessian = _accumulate(data, theta, chunk)
+        loss += regularization * (theta @ theta) / 2
+        if loss > previous:
+            # Шаг Ньютона перелетел минимум: уменьшаем его вдвое.
+            step /= 2
+            theta += step
+            continue
+        previous = loss
+        step = np.linalg.solve(hessian + regularization * identity,
+                               gradient + regularization * theta)
+        theta -= step
+        if np.abs(step).max() * const.MCTS_EVAL_SCALE < 0.5:
+            break
+    return [0] + [int(round(value * const.MCTS_EVAL_SCALE))
+                  for value in theta]
+
+
+def save_weights(path: Path, weights: List[int], positions: int,
+                 loss: float) -> None:
+    """Записывает веса в файл, который читает engine.load_weights."""
+    data: Dict = {"win_length": len(weights), "weights": weights,
+                  "positions": positions, "loss": loss}
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.write("\n")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Парсинг аргументов запуска."""
+    parser = argparse.ArgumentParser(
+        description="Настройка весов оценочной функции по партиям.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    extract = commands.add_parser(
+        "extract", help="дописать признаки позиций партий в файл")
+    extract.add_argument("features", help="файл признаков")
+    extract.add_argument("files", nargs="+",
+                         help="результаты партий без окна (.jsonl), "
+                              "журналы ходов (.bin) или файлы сохранения")
+    extract.add_argument("--batch", type=int, default=const.TUNING_BATCH,
+                         help="число позиций в пачке")
+    fit = commands.add_parser("fit", help="подобрать веса")
+    fit.add_argument("features", help="файл признаков")
+    fit.add_argument("--output", default=str(const.WEIGHTS_PATH),
+                     help="файл весов")
+    fit.add_argument("--iterations", type=int,
+                     default=const.TUNING_ITERATIONS,
+                     help="максимальное число шагов метода Ньютона")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Точка входа."""
+    args = parse_args(argv)
+    if args.command == "extract":
+        games, positions = extract_features(
+            [Path(name) for name in args.files], Path(args.features),
+            args.batch)
+        print("Партий: %d, позиций: %d" % (games, positions))
+        return
+    data = read_features(Path(args.features), const.WIN_ROW_LENGTH)
+    before = evaluate_weights(data, const.RATE_WEIGHTS)
+    weights = fit_weights(data, args.iterations)
+    after = evaluate_weights(data, weights)
+    save_weights(Path(args.output), weights, len(data), after[0])
+    print("Позиций: %d" % len(data))
+    print("Веса: %s -> %s" % (list(const.RATE_WEIGHTS), weights))
+    print("Потеря: %.4f -> %.4f, ошибка Texel: %.4f -> %.4f" % (
+        before[0], after[0], before[1], after[1]))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,124 @@
+"""Модуль, реализующий векторизованную оценку позиций с помощью numpy.
+
+Оценка совпадает с engine.rate_function, но окна считаются операциями над
+массивами: для каждого направления число фишек в окнах получается суммой
+WIN_ROW_LENGTH сдвинутых срезов массива поля. Функции принимают сразу
+стопку из N полей, что позволяет оценивать позиции пачками.
+"""
+
+from .board import Board, BoardState, CellState
+from .geometry import DIRECTIONS
+from . import const
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _require_numpy() -> None:
+    """Бросает ImportError, если numpy не установлен."""
+    if np is None:
+        raise ImportError("Для векторизованной оценки нужен модуль numpy")
+
+
+def board_to_array(board: Board) -> "np.ndarray":
+    """Возвращает поле в виде массива (высота, ширина) из значений
+    CellState.
+    """
+    _require_numpy()
+    height, width = board.size
+    cells = np.frombuffer(board.get_raw_cells(), dtype=np.uint8)
+    return cells.reshape(-1, width + 1)[:height, :width]
+
+
+def boards_to_arrays(boards: Sequence[Board]) \
+        -> Tuple["np.ndarray", "np.ndarray"]:
+    """Возвращает стопку полей (N, высота, ширина) и массив (N,) того,
+    кто ходит в каждой позиции.
+    """
+    _require_numpy()
+    cells = np.stack([board_to_array(board) for board in boards])
+    to_move = np.array([board.whose_move for board in boards],
+                       dtype=np.int8)
+    return cells, to_move
+
+
+def boards_finished(boards: Sequence[Board]) -> "np.ndarray":
+    """Возвращает массив (N,) флагов: выиграна ли уже позиция, то есть
+    board.state - победа одной из сторон.
+    """
+    _require_numpy()
+    return np.array([board.state in (BoardState.WHITE_WINS,
+                                     BoardState.BLACK_WINS)
+                     for board in boards], dtype=bool)
+
+
+def window_counts(stones: "np.ndarray",
+                  length: int = const.WIN_ROW_LENGTH) -> List["np.ndarray"]:
+    """Для стопки (N, высота, ширина) из 0 и 1 возвращает по массиву на
+    каждое направление: число единиц в каждом окне из length клеток,
+    целиком лежащем на поле. Окна нумеруются клеткой начала.
+    """
+    height, width = stones.shape[1:]
+    counts = list()
+    for d_row, d_column in DIRECTIONS:
+        # Диапазон клеток начала окон, при которых окно лежит на поле.
+        row_low = max(0, -(length - 1) * d_row)
+        row_high = height - max(0, (length - 1) * d_row)
+        column_low = max(0, -(length - 1) * d_column)
+        column_high = width - max(0, (length - 1) * d_column)
+        if row_high <= row_low or column_high <= column_low:
+            counts.append(np.zeros((stones.shape[0], 0), dtype=np.int8))
+            continue
+        total = np.zeros((stones.shape[0], row_high - row_low,
+                          column_high - column_low), dtype=np.int8)
+        for i in range(length):
+            total += stones[:, row_low + i * d_row:row_high + i * d_row,
+                            column_low + i * d_column:
+                            column_high + i * d_column]
+        counts.append(total.reshape(stones.shape[0], -1))
+    return counts
+
+
+def evaluate_batch(cells: "np.ndarray", to_move: "np.ndarray",
+                   win_length: int = const.WIN_ROW_LENGTH,
+                   finished: Optional["np.ndarray"] = None) -> "np.ndarray":
+    """Оценивает стопку полей (N, высота, ширина) со значениями CellState.
+    to_move - массив (N,) из значений Player. Возвращает массив (N,)
+    оценок для того, кто ходит, как engine.rate_function. Как и там,
+    конец партии определяется не по полю, а по состоянию доски:
+    finished - массив (N,) флагов из boards_finished, такие позиции
+    получают MINIMAX_INF. Без finished все позиции считаются
+    продолжающимися.
+    """
+    _require_numpy()
+    cells = np.asarray(cells)
+    if cells.ndim == 2:
+        cells = cells[np.newaxis]
+    black = window_counts((cells == CellState.BLACK).astype(np.int8),
+                          win_length)
+    white = window_counts((cells == CellState.WHITE).astype(np.int8),
+                          win_length)
+    black = np.concatenate(black, axis=1)
+    white = np.concatenate(white, axis=1)
+    weights = list(const.RATE_WEIGHTS)
+    weights += [weights[-1]] * (win_length + 1 - len(weights))
+    weights = np.array(weights, dtype=np.int64)
+    score = (weights[black] * (white == 0)).sum(axis=1) - \
+        (weights[white] * (black == 0)).sum(axis=1)
+    score = np.where(np.asarray(to_move) == 0, score, -score)
+    if finished is not None:
+        score = np.where(finished, const.MINIMAX_INF, score)
+    return score.astype(np.int64)
+
+
+def vector_rate_function(board: Board) -> int:
+    """Возвращает ту же оценку, что и engine.rate_function, вычисленную
+    векторизованно.
+    """
+    if board.state in (BoardState.WHITE_WINS, BoardState.BLACK_WINS):
+        return const.MINIMAX_INF
+    return int(evaluate_batch(board_to_array(board), [board.whose_move],
+                              board.win_length)[0])
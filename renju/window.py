@@ -1,72 +1,127 @@
 """Модуль, отвечающий за игровое окно."""
 
 import pygame
-from . import const, engine
-from .board import BoardState, CellState, Player
+from . import background, const
+from .board import Board, BoardState, CellState, Player
 from .game import Game
 from .saver import Saver
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
+import functools
 import time
 
 screen: type(pygame.display)
+# Фоновые задачи компьютера
+controller = background.EngineController()
+# Пустое поле с разметкой: из него восстанавливаются клетки и меню
+_background: Optional[pygame.Surface] = None
+# Размер поля, для которого нарисована разметка _background
+_background_size: Optional[Tuple[int, int]] = None
+# Изображения фишек по состоянию клетки
+_stone_sprites: Dict[CellState, pygame.Surface] = dict()
+_menu_font: pygame.font.Font
+# Состояния клеток, уже нарисованные на экране (как Board.get_raw_cells)
+_drawn_cells = b""
+# Изменённые области экрана; None - обновить весь экран
+_dirty_rects: Optional[List[pygame.Rect]] = None
 
 
 def init() -> None:
-    """Инициализирует pygame. Создаёт игровое окно."""
+    """Инициализирует pygame. Создаёт игровое окно. Поле рисуется
+    draw_background, когда известна доска партии.
+    """
     pygame.init()
-    global screen
+    global screen, _menu_font
     screen = pygame.display.set_mode(
         (const.WINDOW_WEIGHT, const.WINDOW_HEIGHT))
     pygame.display.set_caption('Рендзю')
-    draw_background()
-    update()
-
-
-def draw_background() -> None:
-    """Рисует разметку игрового поля."""
-    screen.fill(const.Color.WHITE)
-    for i in range(const.BOARD_SIZE[0]):
-        pos1 = get_cell_center((i, 0))
-        pos2 = get_cell_center((i, const.BOARD_SIZE[1] - 1))
-        pygame.draw.line(screen, const.Color.BLACK, pos1, pos2,
-                         const.LINE_WIDTH)
-    for i in range(const.BOARD_SIZE[1]):
-        pos1 = get_cell_center((0, i))
-        pos2 = get_cell_center((const.BOARD_SIZE[0] - 1, i))
-        pygame.draw.line(screen, const.Color.BLACK, pos1, pos2,
-                         const.LINE_WIDTH)
-    update()
+    _menu_font = pygame.font.Font(pygame.font.get_default_font(),
+                                  const.MENU_HEIGHT)
+    radius = const.CELL_SIZE // 2
+    center = (radius, radius)
+    for state in (CellState.BLACK, CellState.WHITE):
+        sprite = pygame.Surface((const.CELL_SIZE, const.CELL_SIZE),
+                                pygame.SRCALPHA)
+        if state == CellState.BLACK:
+            pygame.draw.circle(sprite, const.Color.BLACK, center, radius)
+        else:
+            pygame.draw.circle(sprite, const.Color.WHITE, center, radius)
+            pygame.draw.circle(sprite, const.Color.BLACK, center, radius, 1)
+        _stone_sprites[state] = sprite.convert_alpha()
+
+
+def draw_background(board: Board) -> None:
+    """Рисует разметку поля доски board. Фишки стираются, следующий вызов
+    draw_board рисует их заново, а update обновляет весь экран.
+    """
+    global _background, _background_size, _drawn_cells, _dirty_rects
+    height, width = board.size
+    if _background is None or _background_size != board.size:
+        _background = pygame.Surface(screen.get_size()).convert()
+        _background.fill(const.Color.WHITE)
+        for i in range(height):
+            pos1 = get_cell_center((i, 0))
+            pos2 = get_cell_center((i, width - 1))
+            pygame.draw.line(_background, const.Color.BLACK, pos1, pos2,
+                             const.LINE_WIDTH)
+        for i in range(width):
+            pos1 = get_cell_center((0, i))
+            pos2 = get_cell_center((height - 1, i))
+            pygame.draw.line(_background, const.Color.BLACK, pos1, pos2,
+                             const.LINE_WIDTH)
+        _background_size = board.size
+    screen.blit(_background, (0, 0))
+    _drawn_cells = bytes((width + 1) * height)
+    _dirty_rects = None
+
+
+def _mark_dirty(rect: pygame.Rect) -> None:
+    """Запоминает область экрана, которую нужно обновить."""
+    if _dirty_rects is not None:
+        _dirty_rects.append(rect)
 
 
 def draw_board(game: Game) -> None:
-    """Рисует фишки нужного цвета."""
+    """Рисует фишки, изменившиеся с прошлого вызова."""
+    global _drawn_cells
     board = game.board
-    for row in range(const.BOARD_SIZE[0]):
-        for column in range(const.BOARD_SIZE[1]):
-            pos = get_cell_center((row, column))
-            radius = const.CELL_SIZE // 2
-            if board.cells[row][column] == CellState.BLACK:
-                pygame.draw.circle(screen, const.Color.BLACK, pos, radius)
-            elif board.cells[row][column] == CellState.WHITE:
-                pygame.draw.circle(screen, const.Color.WHITE, pos, radius)
-                pygame.draw.circle(screen, const.Color.BLACK, pos, radius, 1)
+    cells = board.get_raw_cells()
+    stride = board.geometry.stride
+    for index, (old, new) in enumerate(zip(_drawn_cells, cells)):
+        if old == new:
+            continue
+        row, column = divmod(index, stride)
+        rect = pygame.Rect(column * const.CELL_SIZE, row * const.CELL_SIZE,
+                           const.CELL_SIZE, const.CELL_SIZE)
+        screen.blit(_background, rect, rect)
+        if new:
+            screen.blit(_stone_sprites[CellState(new)], rect)
+        _mark_dirty(rect)
+    _drawn_cells = cells
     if board.state in (BoardState.WHITE_WINS, BoardState.BLACK_WINS):
         pos1, pos2 = board.find_wins_line()
         pos1 = get_cell_center(pos1)
         pos2 = get_cell_center(pos2)
-        pygame.draw.line(screen, const.Color.RED, pos1, pos2,
-                         2 * const.LINE_WIDTH)
+        _mark_dirty(pygame.draw.line(screen, const.Color.RED, pos1, pos2,
+                                     2 * const.LINE_WIDTH))
     update()
 
 
+@functools.lru_cache(maxsize=256)
+def _render_text(text: str) -> pygame.Surface:
+    """Возвращает изображение текста меню."""
+    return _menu_font.render(text, True, const.Color.BLACK)
+
+
 def draw_text_in_menu(text: str) -> None:
     """Рисует заданный текст в меню."""
-    menu_font = pygame.font.Font(pygame.font.get_default_font(),
-                                 const.MENU_HEIGHT)
-    rendered_text = menu_font.render(text, True, const.Color.BLACK)
+    menu_rect = pygame.Rect(0, const.WINDOW_HEIGHT - const.MENU_HEIGHT,
+                            const.WINDOW_WEIGHT, const.MENU_HEIGHT)
+    screen.blit(_background, menu_rect, menu_rect)
+    rendered_text = _render_text(text)
     text_rect = rendered_text.get_rect()
     text_rect.center = const.MENU_CENTER
     screen.blit(rendered_text, text_rect)
+    _mark_dirty(menu_rect)
     update()
 
 
@@ -93,9 +148,6 @@ def draw_game_result(game: Game) -> None:
 
 def draw_menu(game: Game) -> None:
     """Рисует меню."""
-    menu_rect = pygame.Rect(0, const.WINDOW_HEIGHT - const.MENU_HEIGHT,
-                            const.WINDOW_WEIGHT, const.MENU_HEIGHT)
-    pygame.draw.rect(screen, const.Color.WHITE, menu_rect)
     if game.board.state == BoardState.GAMING:
         draw_time(game)
     else:
@@ -117,8 +169,13 @@ def mouse_pos_to_cell(pos: Tuple[int, int]) -> Tuple[int, int]:
 
 
 def update() -> None:
-    """Обновляет игровое поле."""
-    pygame.display.update()
+    """Выводит на экран изменённые области игрового окна."""
+    global _dirty_rects
+    if _dirty_rects is None:
+        pygame.display.update()
+    elif _dirty_rects:
+        pygame.display.update(_dirty_rects)
+    _dirty_rects = list()
 
 
 def try_draw_menu(game: Game) -> None:
@@ -137,35 +194,43 @@ def process_lmb_event(game: Game):
     """Обработка события нажатия ЛКМ."""
     board = game.board
     if board.state != BoardState.GAMING:
+        controller.cancel()
         game.restart()
-        draw_background()
+        draw_background(game.board)
         draw_menu(game)
         return
+    if controller.is_thinking():
+        return
     mouse_pos = pygame.mouse.get_pos()
     pos = mouse_pos_to_cell(mouse_pos)
     if not game.try_do_move(pos):
         return
     draw_board(game)
     if board.state == BoardState.GAMING:
-        engine.do_computers_move(game)
-        draw_board(game)
+        controller.start_move(game)
 
 
 def process_rmb_event(game: Game):
     """Обработка события нажатия ПКМ."""
+    controller.cancel()
     game.undo_move()
     if game.board.whose_move != Player.BLACK:
         game.undo_move()
-    draw_background()
+    draw_background(game.board)
     draw_board(game)
     draw_menu(game)
 
 
-def process_quit_event(board: Game):
-    """Прекращает работу pygame. Закрывает игровое окно. Сохраняет игру."""
+def process_quit_event(game: Game):
+    """Прекращает работу pygame. Закрывает игровое окно. Сохраняет игру и
+    закрывает журнал ходов.
+    """
+    controller.cancel()
     pygame.display.quit()
     pygame.quit()
-    Saver.save_game(board)
+    Saver.save_game(game)
+    if game.journal is not None:
+        game.journal.close()
 
 
 def process_events(game: Game) -> bool:
@@ -174,6 +239,13 @@ def process_events(game: Game) -> bool:
     """
     pygame.time.Clock().tick(10)
     game.check_time()
+    if game.board.state != BoardState.GAMING:
+        controller.cancel()
+    elif controller.poll(game):
+        draw_board(game)
+    elif game.board.whose_move != Player.BLACK and \
+            not controller.is_thinking():
+        controller.start_move(game)
     try_draw_menu(game)
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
@@ -2,8 +2,37 @@ import unittest
 from renju import const
 from renju.board import Board, CellState, BoardState, Player
 from renju.game import Game
-from renju import engine
+from renju.loader import Loader
+from renju.position import Position
+from renju.saver import JOURNAL_RECORD, Journal
+from renju import background, engine, mcts, parallel, search, stats, threats
+from renju import tt
+from renju import analysis, arena, book, cache, gamestore, loadgen, \
+    rules, server, tuning, vector_eval
+import asyncio
+import benchmarks
 import copy
+import json
+import os
+import pathlib
+import pickle
+import random
+import tempfile
+import time
+
+_cache_dir = None
+
+
+def setUpModule():
+    # Таблицы движка кэшируются во временном каталоге, а не в кэше
+    # пользователя.
+    global _cache_dir
+    _cache_dir = tempfile.TemporaryDirectory()
+    const.CACHE_DIR = pathlib.Path(_cache_dir.name)
+
+
+def tearDownModule():
+    _cache_dir.cleanup()
 
 
 class TestBoard(unittest.TestCase):
@@ -89,14 +118,11 @@ class TestBoard(unittest.TestCase):
             board.do_move((10, i + 5))
         self.assertEqual(board.state, BoardState.WHITE_WINS)
         # Тест ситуации, когда ничья
-        memorized_board_size = const.BOARD_SIZE
-        const.BOARD_SIZE = (3, 3)
-        board = Board()
-        for row in range(const.BOARD_SIZE[0]):
-            for column in range(const.BOARD_SIZE[1]):
+        board = Board((3, 3))
+        for row in range(3):
+            for column in range(3):
                 board.do_move((row, column))
         self.assertEqual(board.state, BoardState.DRAW)
-        const.BOARD_SIZE = memorized_board_size
 
     def test_find_wins_line(self):
         board = Board()
@@ -112,6 +138,1113 @@ class TestBoard(unittest.TestCase):
                 ans_3 = (ans_2[1], ans_2[0])
                 self.assertTrue(ans_1 == ans_2 or ans_1 == ans_3)
 
+    def test_find_max_line_edges(self):
+        board = Board()
+        last_column = const.BOARD_SIZE[1] - 1
+        # Линия у правого края не должна продолжаться на следующей строке.
+        board[0, last_column - 1] = CellState.BLACK
+        board[0, last_column] = CellState.BLACK
+        board[1, 0] = CellState.BLACK
+        board[1, 1] = CellState.BLACK
+        self.assertEqual(board.find_max_line((0, last_column)),
+                         (2, ((0, last_column), (0, last_column - 1))))
+        self.assertEqual(board.find_max_line((1, 0))[0], 2)
+        # Антидиагональ от левого края не должна уходить в конец строки.
+        board = Board()
+        board[2, 0] = CellState.WHITE
+        board[1, 1] = CellState.WHITE
+        board[0, 2] = CellState.WHITE
+        board[3, last_column] = CellState.WHITE
+        self.assertEqual(board.find_max_line((1, 1)),
+                         (3, ((2, 0), (0, 2))))
+
+    def test_has_line(self):
+        board = Board()
+        for i in range(const.WIN_ROW_LENGTH - 1):
+            board[i, const.BOARD_SIZE[1] - 1] = CellState.WHITE
+            board[i + 1, const.BOARD_SIZE[1] - 2 - i] = CellState.BLACK
+        board[const.WIN_ROW_LENGTH, 0] = CellState.WHITE
+        self.assertTrue(board.has_line(Player.WHITE,
+                                       const.WIN_ROW_LENGTH - 1))
+        self.assertFalse(board.has_line(Player.WHITE, const.WIN_ROW_LENGTH))
+        self.assertTrue(board.has_line(Player.BLACK,
+                                       const.WIN_ROW_LENGTH - 1))
+        self.assertFalse(board.has_line(Player.BLACK, const.WIN_ROW_LENGTH))
+        board[const.WIN_ROW_LENGTH,
+              const.BOARD_SIZE[1] - 1 - const.WIN_ROW_LENGTH] = CellState.BLACK
+        self.assertTrue(board.has_line(Player.BLACK, const.WIN_ROW_LENGTH))
+
+    def test_cells(self):
+        board = Board()
+        board.do_move((3, 5))
+        board.do_move((5, 3))
+        cells = board.cells
+        self.assertEqual(len(cells), const.BOARD_SIZE[0])
+        self.assertEqual(cells[3][5], CellState.BLACK)
+        self.assertEqual(cells[5][3], CellState.WHITE)
+        self.assertEqual(sum(cell != CellState.EMPTY for row in cells
+                             for cell in row), 2)
+
+    def test_hash_key(self):
+        board_1 = Board()
+        for pos in ((3, 3), (4, 4), (5, 5), (6, 6)):
+            board_1.do_move(pos)
+        board_2 = Board()
+        for pos in ((5, 5), (6, 6), (3, 3), (4, 4)):
+            board_2.do_move(pos)
+        self.assertEqual(board_1.hash_key, board_2.hash_key)
+        board_2.undo_move()
+        self.assertNotEqual(board_1.hash_key, board_2.hash_key)
+        board_2.do_move((4, 4))
+        self.assertEqual(board_1.hash_key, board_2.hash_key)
+        board_3 = Board()
+        board_3[3, 3] = CellState.BLACK
+        board_3[5, 5] = CellState.BLACK
+        board_3[4, 4] = CellState.WHITE
+        board_3[6, 6] = CellState.WHITE
+        self.assertEqual(board_1.hash_key, board_3.hash_key)
+        board_1.undo_move()
+        board_1.undo_move()
+        board_1.undo_move()
+        board_1.undo_move()
+        self.assertEqual(board_1.hash_key, Board().hash_key)
+
+    def test_candidates(self):
+        rnd = random.Random(5)
+        board = Board()
+        self.assertEqual(board.get_candidates(), [])
+        for step in range(80):
+            pos = (rnd.randrange(const.BOARD_SIZE[0]),
+                   rnd.randrange(const.BOARD_SIZE[1]))
+            if board[pos] or board.state != BoardState.GAMING:
+                board.undo_move()
+            else:
+                board.do_move(pos)
+            expected = set()
+            for row in range(const.BOARD_SIZE[0]):
+                for column in range(const.BOARD_SIZE[1]):
+                    if board[row, column]:
+                        continue
+                    for stone in board.moves:
+                        if abs(stone[0] - row) <= const.CANDIDATE_DISTANCE \
+                                and abs(stone[1] - column) <= \
+                                const.CANDIDATE_DISTANCE:
+                            expected.add((row, column))
+            self.assertEqual(set(board.get_candidates()), expected)
+
+    def test_winning_cells(self):
+        board = Board()
+        for i in range(const.WIN_ROW_LENGTH - 2):
+            board.do_move((5, i + 3))
+            board.do_move((i + 7, 10))
+        self.assertEqual(board.get_winning_cells(Player.BLACK), set())
+        self.assertEqual(board.get_window_gaps(Player.BLACK,
+                                               const.WIN_ROW_LENGTH - 2),
+                         {(5, 1), (5, 2), (5, const.WIN_ROW_LENGTH + 1),
+                          (5, const.WIN_ROW_LENGTH + 2)})
+        board.do_move((5, const.WIN_ROW_LENGTH + 1))
+        self.assertEqual(board.get_winning_cells(Player.BLACK),
+                         {(5, 2), (5, const.WIN_ROW_LENGTH + 2)})
+        board.do_move((5, 2))
+        self.assertEqual(board.get_winning_cells(Player.BLACK),
+                         {(5, const.WIN_ROW_LENGTH + 2)})
+        board.undo_move()
+        board.undo_move()
+        self.assertEqual(board.get_winning_cells(Player.BLACK), set())
+
+    def test_geometry(self):
+        self.assertIs(Board((15, 15)).geometry, Board((15, 15)).geometry)
+        self.assertIsNot(Board((15, 15)).geometry, Board((16, 16)).geometry)
+        board = Board((16, 16))
+        board.do_move((15, 15))
+        self.assertFalse(board.in_field((16, 0)))
+        self.assertEqual(engine.fast_rate_function(board),
+                         engine.rate_function(board))
+        # Поле 6 x 7 с рядом из четырёх фишек.
+        board = Board((6, 7), 4)
+        self.assertEqual(board.win_length, 4)
+        for i in range(3):
+            board.do_move((i, 6))
+            board.do_move((i, 0))
+            self.assertEqual(engine.fast_rate_function(board),
+                             engine.rate_function(board))
+        self.assertEqual(board.get_winning_cells(Player.BLACK), {(3, 6)})
+        board.do_move((3, 6))
+        self.assertEqual(board.state, BoardState.BLACK_WINS)
+
+    def test_position(self):
+        board = Board()
+        for pos in ((7, 7), (0, 14), (14, 0), (8, 8)):
+            board.do_move(pos)
+        position = board.snapshot()
+        self.assertEqual(position.moves, board.moves)
+        self.assertEqual(len(position), 4)
+        self.assertEqual(position, Position(moves=board.moves))
+        self.assertEqual(hash(position), hash(Position(moves=board.moves)))
+        self.assertNotEqual(position, position.prefix(3))
+        self.assertEqual(position.prefix(3).play((8, 8)), position)
+        data = position.encode()
+        self.assertEqual(len(data), 5 + 2 * 4)
+        self.assertEqual(Position.decode(data), position)
+        self.assertEqual(pickle.loads(pickle.dumps(position)), position)
+        with self.assertRaises(ValueError):
+            Position.decode(data[:-1])
+        with self.assertRaises(ValueError):
+            Position.decode(b"\x02" + data[1:])
+        restored = Board.from_position(position)
+        self.assertEqual(restored.hash_key, board.hash_key)
+        self.assertEqual(restored.get_raw_cells(), board.get_raw_cells())
+        # Копия не зависит от оригинала.
+        clone = board.copy()
+        clone.do_move((7, 8))
+        self.assertEqual(len(board.moves), 4)
+        self.assertEqual(engine.fast_rate_function(board),
+                         engine.fast_rate_function(restored))
+        clone.restore(position)
+        self.assertEqual(clone.moves, board.moves)
+        self.assertEqual(clone.hash_key, board.hash_key)
+        self.assertEqual(sorted(clone.get_candidates()),
+                         sorted(board.get_candidates()))
+        # Восстановление позиции с другим продолжением партии.
+        clone.restore(Position(moves=[(7, 7), (6, 6), (5, 5)]))
+        self.assertEqual(clone.moves, [(7, 7), (6, 6), (5, 5)])
+        self.assertEqual(clone.whose_move, Player.WHITE)
+        self.assertEqual(clone[0, 14], CellState.EMPTY)
+        with self.assertRaises(ValueError):
+            clone.restore(Board((9, 9)).snapshot())
+        # Размеры поля и правила сохраняются.
+        board = Board((9, 11), 4, True)
+        board.do_move((8, 10))
+        restored = Board.from_position(
+            Position.decode(board.snapshot().encode()))
+        self.assertEqual(restored.size, (9, 11))
+        self.assertEqual(restored.win_length, 4)
+        self.assertTrue(restored.renju)
+        self.assertEqual(restored.moves, [(8, 10)])
+
+
+class TestRenjuRules(unittest.TestCase):
+    @staticmethod
+    def make_board(black, white=(), renju=True):
+        board = Board(renju=renju)
+        for pos in black:
+            board[pos] = CellState.BLACK
+        for pos in white:
+            board[pos] = CellState.WHITE
+        return board
+
+    def test_forbidden_moves(self):
+        # Двойная тройка, в том числе с разрывом.
+        board = self.make_board([(7, 8), (7, 9), (8, 7), (9, 7)])
+        self.assertTrue(board.is_forbidden((7, 7)))
+        self.assertFalse(board.is_forbidden((7, 10)))
+        board = self.make_board([(7, 8), (7, 10), (8, 7), (9, 7)])
+        self.assertTrue(board.is_forbidden((7, 7)))
+        # Закрытая тройка открытой не считается.
+        board = self.make_board([(7, 8), (7, 9), (8, 7), (9, 7)], [(7, 10)])
+        self.assertFalse(board.is_forbidden((7, 7)))
+        # Двойная четвёрка, в том числе на одной линии.
+        board = self.make_board([(7, 8), (7, 9), (7, 10), (8, 7), (9, 7),
+                                 (10, 7)], [(7, 11), (11, 7)])
+        self.assertTrue(board.is_forbidden((7, 7)))
+        board = self.make_board([(7, 3), (7, 5), (7, 7), (7, 9)])
+        self.assertTrue(board.is_forbidden((7, 6)))
+        # Длинный ряд запрещён, а пятёрка разрешена всегда.
+        board = self.make_board([(7, 1), (7, 2), (7, 3), (7, 5), (7, 6)])
+        self.assertTrue(board.is_forbidden((7, 4)))
+        board = self.make_board([(7, 1), (7, 2), (7, 3), (7, 4), (5, 5),
+                                 (6, 5), (8, 5), (9, 5), (10, 5)])
+        self.assertFalse(board.is_forbidden((7, 5)))
+        # Белым и в гомоку ничего не запрещено.
+        board = self.make_board([(7, 8), (7, 9), (8, 7), (9, 7)],
+                                renju=False)
+        self.assertFalse(board.is_forbidden((7, 7)))
+        board = self.make_board([(7, 8), (7, 9), (8, 7), (9, 7)])
+        board.whose_move = Player.WHITE
+        self.assertFalse(board.is_forbidden((7, 7)))
+
+    def test_incremental_codes(self):
+        rnd = random.Random(19)
+        board = Board(renju=True)
+        for i in range(300):
+            if board.moves and (rnd.random() < 0.3 or
+                                board.state != BoardState.GAMING):
+                board.undo_move()
+                continue
+            pos = (rnd.randrange(const.BOARD_SIZE[0]),
+                   rnd.randrange(const.BOARD_SIZE[1]))
+            if not board[pos]:
+                board.do_move(pos)
+        fresh = Board(renju=True)
+        fresh.load_moves(board.moves)
+        for row in range(const.BOARD_SIZE[0]):
+            for column in range(const.BOARD_SIZE[1]):
+                if not board[row, column]:
+                    self.assertEqual(board.is_forbidden((row, column)),
+                                     fresh.is_forbidden((row, column)))
+
+    def test_moves_are_not_generated(self):
+        game = Game(renju=True)
+        for pos in ((7, 8), (0, 0), (7, 9), (0, 2), (8, 7), (0, 4),
+                    (9, 7), (0, 6)):
+            game.do_move(pos)
+        board = game.board
+        self.assertFalse(game.try_do_move((7, 7)))
+        self.assertNotIn((7, 7), board.get_candidates())
+        self.assertNotIn((7, 7), board.get_window_gaps(Player.BLACK, 2))
+        move = search.AlphaBetaSearch(board, engine.fast_rate_function,
+                                      max_depth=2).run()[1]
+        self.assertFalse(board.is_forbidden(move))
+        restored = Board.from_position(board.snapshot())
+        self.assertTrue(restored.is_forbidden((7, 7)))
+        self.assertTrue(game.try_do_move((7, 10)))
+        self.assertEqual(game.board.whose_move, Player.WHITE)
+
+
+class TestJournal(unittest.TestCase):
+    def test_load_moves(self):
+        moves = [(3, 3), (4, 4), (3, 4), (5, 5), (3, 5), (6, 6), (3, 6),
+                 (7, 7), (3, 7)]
+        board = Board()
+        for pos in moves:
+            board.do_move(pos)
+        loaded = Board()
+        loaded.load_moves(moves)
+        self.assertEqual(loaded.state, BoardState.BLACK_WINS)
+        self.assertEqual(loaded.state, board.state)
+        self.assertEqual(loaded.hash_key, board.hash_key)
+        self.assertEqual(loaded.whose_move, board.whose_move)
+        self.assertEqual(loaded.get_raw_cells(), board.get_raw_cells())
+        self.assertEqual(loaded.get_candidates(), board.get_candidates())
+        with self.assertRaises(ValueError):
+            loaded.load_moves([(3, 3)])
+
+    def test_journal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory, "journal.bin")
+            game = Game()
+            game.do_move((7, 7))
+            game.set_journal(Journal(path))
+            for pos in [(7, 8), (8, 8), (9, 9)]:
+                game.do_move(pos)
+            game.undo_move()
+            game.do_move((6, 6))
+            self.assertEqual([pos for pos, duration in
+                              Loader.read_journal(path)], game.board.moves)
+            # Программа завершилась, не дописав запись.
+            with open(str(path), "ab") as f:
+                f.write(b"m\x01")
+            loaded = Loader.load_journal(path)
+            self.assertEqual(loaded.board.moves, game.board.moves)
+            self.assertEqual(loaded.moves_durations, game.moves_durations)
+            self.assertEqual(loaded.players_times, game.players_times)
+            game.restart()
+            self.assertEqual(Loader.read_journal(path), [])
+            game.do_move((1, 1))
+            self.assertEqual(Loader.load_journal(path).board.moves,
+                             [(1, 1)])
+            game.journal.close()
+            # Журнал хранит правила партии, а новый журнал не трогает
+            # файл, пока в него не записана партия.
+            game = Game((9, 11), 4, True)
+            game.do_move((4, 4))
+            game.set_journal(Journal(path))
+            Journal(path).close()
+            loaded = Loader.load_journal(path)
+            self.assertEqual((loaded.board.size, loaded.board.win_length,
+                              loaded.board.renju), ((9, 11), 4, True))
+            self.assertEqual(loaded.board.moves, [(4, 4)])
+            game.journal.close()
+            self.assertEqual(os.listdir(directory), ["journal.bin"])
+            # Журнал первой версии без заголовка.
+            path.write_bytes(b"RNJ1" + JOURNAL_RECORD.pack(b"m", 7, 7, 1.0))
+            loaded = Loader.load_journal(path)
+            self.assertEqual(loaded.board.size, const.BOARD_SIZE)
+            self.assertEqual(loaded.board.moves, [(7, 7)])
+            path.write_bytes(b"save")
+            with self.assertRaises(ValueError):
+                Loader.read_journal(path)
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def test_store_probe(self):
+        table = tt.TranspositionTable(1024)
+        self.assertEqual(len(table), 1024 // table.ENTRY_SIZE)
+        self.assertIsNone(table.probe(12345))
+        table.store(12345, 3, tt.Bound.LOWER, -const.MINIMAX_INF, (4, 7))
+        self.assertEqual(table.probe(12345),
+                         (3, tt.Bound.LOWER, -const.MINIMAX_INF, (4, 7)))
+        table.store(12345, 2, tt.Bound.EXACT, 150, (-1, -1))
+        self.assertEqual(table.probe(12345),
+                         (2, tt.Bound.EXACT, 150, (-1, -1)))
+        stats = table.get_stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["overwrites"], 0)
+
+    def test_replacement(self):
+        table = tt.TranspositionTable(64)
+        buckets = len(table) // 2
+        keys = [1 + i * buckets for i in range(3)]
+        table.store(keys[0], 5, tt.Bound.EXACT, 1, (0, 0))
+        table.store(keys[1], 2, tt.Bound.EXACT, 2, (0, 1))
+        table.store(keys[2], 1, tt.Bound.EXACT, 3, (0, 2))
+        # Глубокая запись остаётся, вторая запись корзины заменяется.
+        self.assertEqual(table.probe(keys[0]).score, 1)
+        self.assertIsNone(table.probe(keys[1]))
+        self.assertEqual(table.probe(keys[2]).score, 3)
+        self.assertEqual(table.overwrites, 1)
+        table.store(keys[1], 6, tt.Bound.EXACT, 4, (0, 3))
+        self.assertEqual(table.probe(keys[1]).score, 4)
+        self.assertIsNone(table.probe(keys[0]))
+        table.clear()
+        self.assertIsNone(table.probe(keys[1]))
+        self.assertEqual(table.get_stats()["misses"], 1)
+
+    def test_search_with_table(self):
+        board = Board()
+        for pos in ((7, 7), (7, 8), (8, 8), (6, 6)):
+            board.do_move(pos)
+        key = board.hash_key
+        expected = search.AlphaBetaSearch(
+            board, engine.fast_rate_function, max_depth=2).run()
+        table = tt.TranspositionTable(2 ** 16)
+        result = search.AlphaBetaSearch(
+            board, engine.fast_rate_function, max_depth=2, table=table).run()
+        self.assertEqual(result[0], expected[0])
+        self.assertGreater(table.stores, 0)
+        self.assertEqual(board.hash_key, key)
+
+
+class TestThreats(unittest.TestCase):
+    @staticmethod
+    def make_board(moves):
+        board = Board()
+        for pos in moves:
+            board.do_move(pos)
+        return board
+
+    def assertWinningLine(self, board, line):
+        player = board.whose_move
+        for pos in line:
+            board.do_move(pos)
+        self.assertEqual(board.state, BoardState.BLACK_WINS
+                         if player == Player.BLACK else
+                         BoardState.WHITE_WINS)
+        for pos in line:
+            board.undo_move()
+
+    def test_vcf(self):
+        moves = [(7, 7), (0, 0), (7, 8), (0, 2), (7, 9), (0, 4), (8, 10),
+                 (0, 6), (9, 10), (0, 8), (10, 10), (0, 10)]
+        board = self.make_board(moves)
+        line = threats.ThreatSearch(board).find_vcf()
+        self.assertIsNotNone(line)
+        self.assertEqual(board.moves, moves)
+        self.assertWinningLine(board, line)
+
+    def test_vct(self):
+        moves = [(7, 7), (0, 0), (7, 8), (0, 3), (8, 9), (0, 6), (9, 9),
+                 (0, 9)]
+        board = self.make_board(moves)
+        self.assertIsNone(threats.ThreatSearch(board).find_vcf())
+        line = threats.find_forced_win(board)
+        self.assertIsNotNone(line)
+        self.assertEqual(board.moves, moves)
+        self.assertWinningLine(board, line)
+        self.assertIsNone(threats.find_forced_win(board, max_nodes=10))
+        self.assertEqual(board.moves, moves)
+        board.undo_move()
+        self.assertFalse(threats.is_forced_win(board))
+
+    def test_do_computers_move_follows_forced_win(self):
+        # Почти всё время партии отдаётся на ход, чтобы поиск угроз
+        # успевал найти выигрыш и на загруженной машине.
+        self.addCleanup(setattr, const, "MOVES_TO_GO", const.MOVES_TO_GO)
+        const.MOVES_TO_GO = 1
+        game = Game()
+        for pos in ((7, 7), (0, 0), (7, 8), (0, 3), (8, 9), (0, 6), (9, 9),
+                    (0, 9)):
+            game.do_move(pos)
+        line = threats.find_forced_win(game.board)
+        engine.do_computers_move(game)
+        self.assertEqual(game.board.moves[-1], line[0])
+
+
+class TestParallel(unittest.TestCase):
+    def tearDown(self):
+        parallel.shutdown()
+
+    def test_parallel_search(self):
+        board = Board()
+        for pos in ((7, 7), (7, 8), (8, 8), (6, 6)):
+            board.do_move(pos)
+        expected = search.AlphaBetaSearch(
+            board, engine.fast_rate_function, max_depth=2).run()
+        result = parallel.parallel_search(
+            board, engine.fast_rate_function, max_depth=2, workers=2,
+            mode="split")
+        self.assertEqual(result[0], expected[0])
+        score, move = parallel.parallel_search(
+            board, engine.fast_rate_function, max_depth=2, workers=2,
+            mode="smp")
+        self.assertEqual(score, expected[0])
+        self.assertIn(move, board.get_candidates())
+        with self.assertRaises(ValueError):
+            parallel.parallel_search(board, engine.fast_rate_function,
+                                     workers=2, mode="unknown")
+
+
+class TestBackground(unittest.TestCase):
+    def test_job(self):
+        board = Board()
+        for pos in ((7, 7), (7, 8), (8, 8)):
+            board.do_move(pos)
+        job = background.EngineJob(board, 0.3)
+        self.assertTrue(job.wait(5))
+        score, move = job.result()
+        self.assertFalse(board[move])
+        self.assertEqual(len(board.moves), 3)
+
+    def test_cancel(self):
+        board = Board()
+        board.do_move((7, 7))
+        state = engine.Engine(2 ** 16)
+        job = background.EngineJob(board, None, state)
+        time.sleep(0.1)
+        job.cancel()
+        # Поток отменённой задачи больше не пишет в таблицу, и её можно
+        # отдать следующей задаче.
+        self.assertTrue(job.done())
+        self.assertTrue(job.cancelled())
+        self.assertIsNone(job.result())
+        stores = state.table.stores
+        time.sleep(0.05)
+        self.assertEqual(state.table.stores, stores)
+
+    def test_cancel_mcts(self):
+        self.addCleanup(setattr, const, "SEARCH_MODE", const.SEARCH_MODE)
+        const.SEARCH_MODE = "mcts"
+        board = Board()
+        board.do_move((7, 7))
+        for delay in (0, 0.05):
+            # Отмена до запуска поиска и во время него.
+            job = background.EngineJob(board, None)
+            time.sleep(delay)
+            start = time.monotonic()
+            job.cancel()
+            self.assertLess(time.monotonic() - start, 0.5)
+            self.assertIsNone(job.result())
+
+    def test_controller(self):
+        game = Game()
+        game.do_move((7, 7))
+        controller = background.EngineController()
+        controller.start_move(game)
+        self.assertTrue(controller.is_thinking())
+        self.assertTrue(controller.job.wait(10))
+        self.assertTrue(controller.poll(game))
+        self.assertEqual(len(game.board.moves), 2)
+        self.assertFalse(controller.is_thinking())
+        ponder_job = controller.ponder_job
+        self.assertIsNotNone(ponder_job)
+        game.do_move(controller.ponder_move)
+        controller.start_move(game)
+        self.assertIs(controller.job, ponder_job)
+        self.assertEqual(controller.ponder_hits, 1)
+        self.assertTrue(controller.job.wait(10))
+        self.assertTrue(controller.poll(game))
+        self.assertEqual(len(game.board.moves), 4)
+        controller.cancel()
+        self.assertFalse(controller.is_thinking())
+        self.assertIsNone(controller.ponder_job)
+
+
+@unittest.skipIf(vector_eval.np is None, "numpy не установлен")
+class TestVectorEval(unittest.TestCase):
+    def test_matches_rate_function(self):
+        rnd = random.Random(3)
+        boards = list()
+        for game in range(20):
+            board = Board()
+            length = rnd.randrange(60)
+            while len(board.moves) < length and \
+                    board.state == BoardState.GAMING:
+                pos = (rnd.randrange(const.BOARD_SIZE[0]),
+                       rnd.randrange(const.BOARD_SIZE[1]))
+                if not board[pos]:
+                    board.do_move(pos)
+            boards.append(board)
+            self.assertEqual(vector_eval.vector_rate_function(board),
+                             engine.rate_function(board))
+        cells, to_move = vector_eval.boards_to_arrays(boards)
+        scores = vector_eval.evaluate_batch(
+            cells, to_move, finished=vector_eval.boards_finished(boards))
+        self.assertEqual([int(score) for score in scores],
+                         [engine.rate_function(board) for board in boards])
+
+    def test_finished_position(self):
+        # Пять в ряд у чёрных: партия окончена, оценка - MINIMAX_INF.
+        board = Board()
+        for column in range(4):
+            board.do_move((7, column))
+            board.do_move((9, column))
+        board.do_move((7, 4))
+        self.assertEqual(board.state, BoardState.BLACK_WINS)
+        self.assertEqual(vector_eval.vector_rate_function(board),
+                         engine.rate_function(board))
+        # В пачке с продолжающейся позицией конец партии берётся из
+        # состояния доски, а не из поля.
+        playing = Board()
+        playing.do_move((7, 7))
+        boards = [board, playing]
+        cells, to_move = vector_eval.boards_to_arrays(boards)
+        finished = vector_eval.boards_finished(boards)
+        self.assertEqual(list(finished), [True, False])
+        scores = vector_eval.evaluate_batch(cells, to_move,
+                                            finished=finished)
+        self.assertEqual([int(score) for score in scores],
+                         [engine.rate_function(item) for item in boards])
+        scores = vector_eval.evaluate_batch(cells[1:], to_move[1:],
+                                            finished=[True])
+        self.assertEqual(int(scores[0]), const.MINIMAX_INF)
+
+    def test_board_to_array(self):
+        board = Board()
+        board.do_move((0, const.BOARD_SIZE[1] - 1))
+        board.do_move((const.BOARD_SIZE[0] - 1, 0))
+        cells = vector_eval.board_to_array(board)
+        self.assertEqual(cells.shape, const.BOARD_SIZE)
+        self.assertEqual(cells[0, const.BOARD_SIZE[1] - 1], CellState.BLACK)
+        self.assertEqual(cells[const.BOARD_SIZE[0] - 1, 0], CellState.WHITE)
+        self.assertEqual(int(cells.sum()), 3)
+
+
+class TestArena(unittest.TestCase):
+    def test_parse_settings(self):
+        settings = arena.parse_settings("depth=3,time=0.5,eval=reference")
+        self.assertEqual(settings.depth, 3)
+        self.assertEqual(settings.time, 0.5)
+        self.assertEqual(settings.evaluation, "reference")
+        self.assertEqual(arena.parse_settings(str(settings)), settings)
+        self.assertFalse(arena.parse_settings("threats=0").threats)
+        self.assertEqual(arena.parse_settings("mode=minimax").depth,
+                         const.MAX_MINIMAX_DEPTH)
+        self.assertEqual(arena.parse_settings("mode=minimax,depth=2").depth,
+                         2)
+        with self.assertRaises(ValueError):
+            arena.parse_settings("speed=3")
+        with self.assertRaises(ValueError):
+            arena.parse_settings("mode=random")
+
+    def test_run_arena(self):
+        settings = arena.parse_settings("depth=1,time=0.05")
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "arena.jsonl")
+            summary = arena.run_arena(2, settings, settings, output,
+                                      workers=1, seed=7)
+            with open(output, encoding="utf-8") as f:
+                results = [json.loads(line) for line in f]
+        self.assertEqual(summary.games, 2)
+        self.assertEqual(sorted(result["game"] for result in results),
+                         [0, 1])
+        for result in results:
+            board = Board()
+            for pos in result["moves"]:
+                board.do_move(tuple(pos))
+            self.assertEqual(arena._RESULTS[board.state], result["winner"])
+            self.assertEqual(len(result["times"]),
+                             result["length"] - result["opening"])
+
+    def test_mcts_game(self):
+        black = arena.parse_settings("mode=mcts,time=0.5,iterations=30")
+        white = arena.parse_settings("depth=1,time=0.02")
+        result = arena.play_game(0, black, white, 3, 4)
+        self.assertIn("iterations=30", result["black"])
+        board = Board()
+        board.load_moves([tuple(pos) for pos in result["moves"]])
+        self.assertEqual(arena._RESULTS[board.state], result["winner"])
+        # Под нагрузкой время на ход может кончиться раньше итераций.
+        self.assertGreater(result["nodes"][0], 0)
+        self.assertLessEqual(result["nodes"][0], 30)
+
+
+class TestMonteCarlo(unittest.TestCase):
+    def test_tactics(self):
+        searcher = mcts.MonteCarloSearch(engine.fast_rate_function)
+        board = Board()
+        for pos in ((7, 3), (0, 0), (7, 4), (0, 2), (7, 5), (0, 4), (7, 6),
+                    (0, 6)):
+            board.do_move(pos)
+        self.assertIn(searcher.run(board, iterations=20)[1],
+                      ((7, 2), (7, 7)))
+        board.undo_move()
+        self.assertIn(searcher.run(board, iterations=20)[1],
+                      ((7, 2), (7, 7)))
+        self.assertEqual(searcher.run(Board(), iterations=5)[1], (8, 8))
+
+    def test_tree_reuse(self):
+        searcher = mcts.MonteCarloSearch(engine.fast_rate_function, seed=1)
+        board = Board()
+        for pos in ((7, 7), (7, 8), (8, 8)):
+            board.do_move(pos)
+        result = searcher.run(board, iterations=300)
+        pv = searcher.get_principal_variation(2)
+        self.assertEqual(pv[0], result[1])
+        size = len(searcher)
+        for pos in pv:
+            board.do_move(pos)
+        collected = stats.SearchStats()
+        searcher.run(board, iterations=100, stats=collected)
+        self.assertGreater(searcher.reused_visits, 0)
+        self.assertLess(searcher.reused_visits, 300)
+        self.assertEqual(collected.nodes, 100)
+        self.assertEqual(len(collected.iterations), 1)
+        self.assertLess(len(searcher), size + 100 * 60)
+        # Позиция не из дерева: поиск начинается заново.
+        searcher.run(Board(), iterations=1)
+        self.assertEqual(searcher.reused_visits, 0)
+
+    def test_renju_rules(self):
+        board = Board(renju=True)
+        for pos in ((7, 8), (0, 0), (7, 9), (0, 2), (8, 7), (0, 4),
+                    (9, 7), (0, 6)):
+            board.do_move(pos)
+        searcher = mcts.MonteCarloSearch(engine.fast_rate_function)
+        searcher.run(board, iterations=200)
+        self.assertEqual(searcher.board.moves, board.moves)
+        self.assertNotIn((7, 7), searcher.get_principal_variation(1))
+        const.SEARCH_MODE, memorized_mode = "mcts", const.SEARCH_MODE
+        try:
+            move = engine.choose_move(board, 0.05)[1]
+        finally:
+            const.SEARCH_MODE = memorized_mode
+        self.assertFalse(board.is_forbidden(move))
+
+
+class TestBook(unittest.TestCase):
+    def setUp(self):
+        self.memorized_path = const.BOOK_PATH
+
+    def tearDown(self):
+        const.BOOK_PATH = self.memorized_path
+
+    def test_canonical_key(self):
+        moves = [(7, 7), (6, 8), (8, 9)]
+        key = book.get_canonical_key(moves)[0]
+        for symmetry in range(8):
+            transformed = [book.transform(pos, symmetry, const.BOARD_SIZE)
+                           for pos in moves]
+            self.assertEqual(book.get_canonical_key(transformed)[0], key)
+        self.assertNotEqual(
+            book.get_canonical_key([(6, 8), (7, 7), (8, 9)])[0], key)
+
+    def test_build_and_probe(self):
+        results = [{"moves": [(7, 7), (6, 8), (5, 9)], "winner": "black"},
+                   {"moves": [(7, 7), (6, 8), (5, 9)], "winner": "draw"},
+                   {"moves": [(7, 7), (6, 8), (8, 6)], "winner": "white"},
+                   {"moves": [(7, 7), (6, 8), (8, 6)], "winner": "white"},
+                   {"moves": [(7, 7), (6, 6)], "winner": "white"}]
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory, "book.bin")
+            self.assertEqual(book.build_book(results, path, 3, 2), 3)
+            opening_book = book.OpeningBook(path)
+            self.assertEqual(len(opening_book), 3)
+            for symmetry in range(8):
+                board = Board()
+                for pos in [(7, 7), (6, 8)]:
+                    board.do_move(book.transform(pos, symmetry,
+                                                 const.BOARD_SIZE))
+                self.assertEqual(
+                    opening_book.probe(board),
+                    book.transform((5, 9), symmetry, const.BOARD_SIZE))
+            board = Board()
+            board.do_move((0, 0))
+            self.assertIsNone(opening_book.probe(board))
+            self.assertEqual((opening_book.hits, opening_book.misses),
+                             (8, 1))
+            opening_book.close()
+
+            const.BOOK_PATH = path
+            game = Game()
+            game.do_move((7, 7))
+            game.do_move((6, 8))
+            engine.do_computers_move(game)
+            self.assertEqual(game.board.moves[-1], (5, 9))
+            self.assertEqual(book.get_book().hits, 1)
+
+            with open(str(path), "r+b") as f:
+                f.truncate(20)
+            with self.assertRaises(ValueError):
+                book.OpeningBook(path)
+
+
+class TestGameStore(unittest.TestCase):
+    def test_import_and_query(self):
+        games = [([(7, 7), (7, 8), (8, 8), (6, 6)], "black"),
+                 ([(7, 7), (7, 8), (8, 8), (9, 9)], "white"),
+                 ([(7, 7), (7, 8), (6, 6)], "draw"),
+                 ([(7, 7), (7, 7)], "black")]
+        with tempfile.TemporaryDirectory() as directory:
+            directory = pathlib.Path(directory)
+            results = directory / "arena.jsonl"
+            with results.open("w", encoding="utf-8") as f:
+                for moves, winner in games:
+                    f.write(json.dumps({"moves": moves, "winner": winner})
+                            + "\n")
+                    # Повреждённые записи пропускаются.
+                    f.write('{"moves": [[7, 7], [8]]}\n{"mov\n')
+            save = directory / "save.txt"
+            save.write_text("7 7 1.0\n8 8 2.0\n")
+            broken = directory / "broken.txt"
+            broken.write_text("7 7 1.0\n8 x\n")
+            path = directory / "store"
+            self.assertEqual(gamestore.import_games(path, [results], 4), 3)
+            meta = (path / "store.json").read_bytes()
+            self.assertEqual(
+                gamestore.import_games(path, [broken, save], 4), 1)
+            store = gamestore.GameStore(path)
+            self.assertEqual(len(store), 4)
+            self.assertEqual(store.meta["positions"], 5 + 5 + 4 + 3)
+            self.assertEqual(store.get_game(3),
+                             gamestore.GameRecord([(7, 7), (8, 8)],
+                                                  BoardState.GAMING))
+            board = Board()
+            board.load_moves([(7, 7), (7, 8)])
+            self.assertEqual(store.find_position(board.hash_key),
+                             [(0, 2), (1, 2), (2, 2)])
+            continuations = store.get_continuations(board.hash_key)
+            self.assertEqual(continuations, [
+                gamestore.Continuation((8, 8), 2, 1, 0, 1),
+                gamestore.Continuation((6, 6), 1, 0, 1, 0)])
+            self.assertEqual(continuations[0].get_win_rate(), 0.5)
+            board.do_move((9, 9))
+            self.assertEqual(store.find_position(board.hash_key), [])
+            store.close()
+            # Импорт прервался после замены индекса позиций, но до записи
+            # описания базы: записи потерянной партии в индексе не
+            # относятся к партии, получившей её номер.
+            (path / "store.json").write_bytes(meta)
+            board = Board()
+            board.load_moves([(7, 7), (8, 8)])
+            store = gamestore.GameStore(path)
+            self.assertEqual(store.find_position(board.hash_key), [])
+            store.close()
+            save.write_text("6 6 1.0\n")
+            self.assertEqual(gamestore.import_games(path, [save], 4), 1)
+            store = gamestore.GameStore(path)
+            self.assertEqual(store.get_game(3).moves, [(6, 6)])
+            self.assertEqual(store.find_position(board.hash_key), [])
+            self.assertEqual(len(store.find_position(0)), 4)
+            self.assertEqual(os.path.getsize(str(path / "positions.idx")),
+                             (5 + 5 + 4 + 2) * 14)
+            store.close()
+
+
+class TestAnalysis(unittest.TestCase):
+    def test_analyse_games(self):
+        # Чёрные упускают выигрыш на 7-м и 9-м ходах, белые на 8-м не
+        # закрывают четвёрку.
+        moves = [(7, 3), (7, 7), (7, 4), (0, 0), (7, 5), (0, 2), (7, 6),
+                 (0, 4), (12, 12), (7, 2)]
+        with tempfile.TemporaryDirectory() as directory:
+            directory = pathlib.Path(directory)
+            save = directory / "save.txt"
+            save.write_text("".join("%d %d 1.0\n" % pos for pos in moves))
+            bad = directory / "bad.txt"
+            bad.write_text("7 7 1.0\n7 7 1.0\n")
+            output = directory / "analysis.jsonl"
+            summary = analysis.analyse_games([save, bad], output, workers=1,
+                                             depth=2, limit=4)
+            self.assertEqual(summary.positions, 4)
+            # Недописанная строка прерванного разбора отбрасывается.
+            with output.open("a", encoding="utf-8") as f:
+                f.write('{"file": ')
+            summary = analysis.analyse_games([save, bad], output, workers=1,
+                                             depth=2)
+            self.assertEqual(summary.skipped, 4)
+            self.assertEqual(summary.positions, 6)
+            self.assertEqual(summary.errors, 1)
+            self.assertEqual(summary.missed_wins, 2)
+            summary = analysis.analyse_games([save, bad], output, workers=1,
+                                             depth=2)
+            self.assertEqual(summary.skipped, 11)
+            self.assertEqual(summary.positions, 0)
+            with output.open(encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 11)
+        records = {record["ply"]: record for record in records
+                   if record["file"] == str(save)}
+        self.assertEqual(sorted(records), list(range(len(moves))))
+        for ply in (6, 8):
+            self.assertTrue(records[ply]["missed_win"])
+            self.assertEqual(records[ply]["best"], [7, 2])
+        self.assertGreater(records[7]["loss"], 0)
+        # Последним ходом белые закрывают четвёрку.
+        self.assertFalse(records[9]["forced_win"])
+        self.assertEqual(records[9]["best"], [7, 2])
+        self.assertEqual(records[9]["loss"], 0)
+
+    def test_other_winning_move(self):
+        position = Position(moves=[
+            (8, 8), (6, 10), (8, 9), (4, 8), (7, 7), (7, 9), (7, 11),
+            (5, 6), (6, 6), (9, 13), (2, 10), (4, 11), (8, 5), (4, 13)])
+        # Четвёрка (8, 7) тоже ведёт к выигрышу, хотя лучший ход другой.
+        record = analysis.analyse_position(position, (8, 7), 2)
+        self.assertTrue(record["forced_win"])
+        self.assertNotEqual(record["best"], (8, 7))
+        self.assertEqual(record["loss"], 0)
+        self.assertFalse(record["missed_win"])
+        record = analysis.analyse_position(position, (0, 0), 2)
+        self.assertTrue(record["missed_win"])
+
+
+class TestTuning(unittest.TestCase):
+    def play_random_game(self, rnd):
+        board = Board()
+        board.do_move((8, 8))
+        while board.state == BoardState.GAMING:
+            player = board.whose_move
+            wins = board.get_winning_cells(player) or \
+                board.get_winning_cells(1 - player)
+            if wins and rnd.random() < 0.8:
+                board.do_move(min(wins))
+            else:
+                board.do_move(rnd.choice(board.get_candidates()))
+        return board
+
+    def test_features_match_evaluation(self):
+        rnd = random.Random(5)
+        boards = list()
+        for i in range(4):
+            board = self.play_random_game(rnd)
+            board.undo_move()
+            boards.append(board)
+        cells, to_move = vector_eval.boards_to_arrays(boards)
+        features = tuning.get_features(cells, to_move)
+        weights = const.RATE_WEIGHTS[1:const.WIN_ROW_LENGTH]
+        self.assertEqual(list(features @ weights),
+                         list(vector_eval.evaluate_batch(cells, to_move)))
+
+    def test_extract_and_fit(self):
+        rnd = random.Random(3)
+        winners = {BoardState.BLACK_WINS: "black",
+                   BoardState.WHITE_WINS: "white", BoardState.DRAW: "draw"}
+        weights = const.RATE_WEIGHTS
+        self.addCleanup(setattr, const, "RATE_WEIGHTS", weights)
+        with tempfile.TemporaryDirectory() as directory:
+            directory = pathlib.Path(directory)
+            results = directory / "arena.jsonl"
+            length = 0
+            with results.open("w", encoding="utf-8") as f:
+                for i in range(30):
+                    board = self.play_random_game(rnd)
+                    length += len(board.moves) - 1
+                    f.write(json.dumps({"moves": board.moves,
+                                        "winner": winners[board.state]})
+                            + "\n")
+            # Незаконченная партия не учитывается.
+            save = directory / "save.txt"
+            save.write_text("7 7 1.0\n8 8 2.0\n")
+            features = directory / "features.bin"
+            self.assertEqual(tuning.extract_features([results, save],
+                                                     features, batch=64),
+                             (30, length))
+            tuning.extract_features([results], features)
+            data = tuning.read_features(features, const.WIN_ROW_LENGTH)
+            self.assertEqual(data.shape, (2 * length, const.WIN_ROW_LENGTH))
+            self.assertEqual(set(data[:, -1]), {0.0, 1.0})
+            fitted = tuning.fit_weights(data)
+            self.assertEqual(len(fitted), const.WIN_ROW_LENGTH)
+            self.assertLess(tuning.evaluate_weights(data, fitted)[0],
+                            tuning.evaluate_weights(data, weights)[0])
+            path = directory / "weights.json"
+            tuning.save_weights(path, fitted, len(data), 0.0)
+            self.assertTrue(engine.load_weights(path))
+            self.assertEqual(const.RATE_WEIGHTS, fitted)
+            self.assertFalse(engine.load_weights(directory / "none.json"))
+            with self.assertRaises(ValueError):
+                tuning.read_features(features, 4)
+        board = Board()
+        board.load_moves([(7, 7), (7, 8), (8, 8)])
+        self.assertEqual(engine.fast_rate_function(board),
+                         engine.rate_function(board))
+
+
+class TestTableCache(unittest.TestCase):
+    def test_load_table(self):
+        self.addCleanup(setattr, const, "CACHE_DIR", const.CACHE_DIR)
+        self.addCleanup(setattr, const, "USE_TABLE_CACHE",
+                        const.USE_TABLE_CACHE)
+        const.USE_TABLE_CACHE = True
+        built = list()
+
+        def build():
+            built.append(1)
+            return range(1000)
+
+        with tempfile.TemporaryDirectory() as directory:
+            const.CACHE_DIR = pathlib.Path(directory) / "renju"
+            table = cache.load_table("test", "H", build)
+            self.assertEqual(list(table), list(range(1000)))
+            self.assertEqual(len(built), 1)
+            table = cache.load_table("test", "H", build)
+            self.assertIsInstance(table, memoryview)
+            self.assertEqual(list(table), list(range(1000)))
+            self.assertEqual(len(built), 1)
+            table.release()
+            # Файл с другим типом элементов или испорченным заголовком
+            # строится заново.
+            self.assertEqual(list(cache.load_table("test", "i", build)),
+                             list(range(1000)))
+            self.assertEqual(len(built), 2)
+            path = const.CACHE_DIR / "test.bin"
+            path.write_bytes(b"RNJC" + path.read_bytes()[4:-1])
+            self.assertEqual(list(cache.load_table("test", "i", build)),
+                             list(range(1000)))
+            self.assertEqual(len(built), 3)
+            const.USE_TABLE_CACHE = False
+            self.assertEqual(len(cache.load_table("test", "i", build)), 1000)
+            self.assertEqual(len(built), 4)
+            const.USE_TABLE_CACHE = True
+            self.assertEqual(
+                list(cache.load_table("patterns", "H",
+                                      lambda: rules.build_pattern_table(5))),
+                list(rules.get_pattern_table(5)))
+
+def _get_engine_ids():
+    """Номера партий, состояния которых хранит процесс сервера."""
+    return sorted(server._engines)
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_with_server(self, client, max_queue=const.SERVER_MAX_QUEUE):
+        async def run():
+            game_server = server.GameServer(1, max_queue, move_time=0.05)
+            await game_server.start("127.0.0.1", 0)
+            try:
+                return await client(game_server.port)
+            finally:
+                await game_server.close()
+        return self.loop.run_until_complete(run())
+
+    def test_protocol(self):
+        async def client(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            responses = list()
+            for line in ["move 7 7", "move 7 7", "state", "clock", "undo",
+                         "state", "move 99 0", "jump", "new", "state"]:
+                writer.write(line.encode() + b"\n")
+                responses.append((await reader.readline()).decode().split())
+            writer.write(b"quit\n")
+            writer.close()
+            return responses
+        responses = self.run_with_server(client)
+        self.assertEqual(responses[0][0], "ok")
+        self.assertEqual(responses[0][3], "gaming")
+        engine_move = (int(responses[0][1]), int(responses[0][2]))
+        self.assertNotEqual(engine_move, (7, 7))
+        self.assertEqual(responses[1], ["error", "bad", "move"])
+        self.assertEqual(responses[2], ["state", "gaming", "2", "7,7",
+                                        "%d,%d" % engine_move])
+        self.assertEqual(responses[3][0], "clock")
+        self.assertEqual(responses[4], ["ok", "0"])
+        self.assertEqual(responses[5], ["state", "gaming", "0"])
+        self.assertEqual(responses[6], ["error", "bad", "move"])
+        self.assertEqual(responses[7], ["error", "unknown", "command"])
+        self.assertEqual(responses[9], ["state", "gaming", "0"])
+
+    def test_busy(self):
+        async def move(port, delay):
+            await asyncio.sleep(delay)
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"move 7 7\nstate\n")
+            response = (await reader.readline()).decode().split()
+            state = (await reader.readline()).decode().split()
+            writer.close()
+            return response[:2], state[2]
+
+        async def client(port):
+            return await asyncio.gather(move(port, 0), move(port, 0.02))
+        first, second = self.run_with_server(client, max_queue=0)
+        self.assertEqual(first[0][0], "ok")
+        self.assertEqual(first[1], "2")
+        self.assertEqual(second, (["error", "busy"], "0"))
+
+    def test_engine_per_game(self):
+        self.addCleanup(server._engines.clear)
+        server._engines.clear()
+        position = Position(moves=[(7, 7), (7, 8), (8, 8)])
+        server._engine_worker(1, position, 0.05)
+        state = server._engines[1]
+        self.assertEqual(len(state.table), len(tt.TranspositionTable(
+            const.ARENA_TT_MEMORY)))
+        self.assertEqual(state.pv_root, position.moves)
+        self.assertIs(server._get_engine(1), state)
+        for game_id in range(2, const.SERVER_ENGINES + 1):
+            server._get_engine(game_id)
+        self.assertIs(server._get_engine(1), state)
+        server._engines[2].pv = [(0, 0)]
+        # Новой партии отдаётся очищенное состояние давно не
+        # встречавшейся.
+        evicted = server._engines[2]
+        self.assertIs(server._get_engine(100), evicted)
+        self.assertNotIn(2, server._engines)
+        self.assertEqual(len(server._engines), const.SERVER_ENGINES)
+        self.assertEqual(evicted.pv, [])
+
+    def test_games_pinned_to_workers(self):
+        async def run():
+            pool = server.EnginePool(2)
+            board = Board()
+            board.do_move((7, 7))
+            try:
+                for game_id in (3, 4, 3):
+                    await pool.choose_move(game_id, board, 0.05)
+                return [await asyncio.get_running_loop().run_in_executor(
+                    executor, _get_engine_ids)
+                    for executor in pool._executors]
+            finally:
+                pool.close()
+        self.assertEqual(self.loop.run_until_complete(run()), [[4], [3]])
+
+    def test_load(self):
+        async def client(port):
+            return await loadgen.run_load("127.0.0.1", port, 2, 2)
+        latencies, busy = self.run_with_server(client)
+        self.assertEqual(busy, 0)
+        self.assertEqual(len(latencies["state"]), 2)
+        self.assertIn("p99", loadgen.format_report(latencies, busy, 1.0))
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_positions(self):
+        for moves in benchmarks.POSITIONS:
+            board = benchmarks.make_board(moves)
+            self.assertEqual(board.state, BoardState.GAMING)
+
+    def test_compare(self):
+        report = benchmarks.run_benchmarks(["board.do_undo"], 0, 0, 1)
+        result = report["results"]["board.do_undo"]
+        self.assertGreater(result["ops_per_sec"], 0)
+        faster = copy.deepcopy(report)
+        faster["results"]["board.do_undo"]["ops_per_sec"] *= 2
+        self.assertEqual(benchmarks.compare(report, report, 0.1), [])
+        self.assertEqual(len(benchmarks.compare(report, faster, 0.1)), 1)
+        self.assertEqual(benchmarks.compare(faster, report, 0.1), [])
+
+    def test_search_counters(self):
+        result = benchmarks.measure(benchmarks.bench_alpha_beta(0), 0, 1)
+        self.assertGreater(result["leaves_per_sec"], 0)
+        self.assertGreaterEqual(result["ops_per_sec"],
+                                result["leaves_per_sec"])
+
 
 class TestEngine(unittest.TestCase):
     def test_rate_function(self):
@@ -125,6 +1258,31 @@ class TestEngine(unittest.TestCase):
         board[2, 3] = CellState.BLACK
         self.assertGreater(engine.rate_function(board), 0)
 
+    def test_fast_rate_function(self):
+        rnd = random.Random(2)
+        for game in range(5):
+            board = Board()
+            while board.state == BoardState.GAMING and len(board.moves) < 60:
+                pos = (rnd.randrange(const.BOARD_SIZE[0]),
+                       rnd.randrange(const.BOARD_SIZE[1]))
+                if board[pos]:
+                    continue
+                board.do_move(pos)
+                self.assertEqual(engine.fast_rate_function(board),
+                                 engine.rate_function(board))
+                if rnd.random() < 0.2:
+                    board.undo_move()
+                    self.assertEqual(engine.fast_rate_function(board),
+                                     engine.rate_function(board))
+        board = Board()
+        board[1, 2] = CellState.BLACK
+        board[2, 3] = CellState.WHITE
+        board[2, 3] = CellState.BLACK
+        board[7, 7] = CellState.WHITE
+        board[7, 7] = CellState.EMPTY
+        self.assertEqual(engine.fast_rate_function(board),
+                         engine.rate_function(board))
+
     def test_minimax(self):
         board = Board()
         self.assertEqual(engine.minimax(board, const.MAX_MINIMAX_DEPTH)[0],
@@ -134,17 +1292,149 @@ class TestEngine(unittest.TestCase):
         ans_1 = engine.minimax(board)
         ans_2 = (const.MINIMAX_INF, (const.WIN_ROW_LENGTH - 1, 0))
         self.assertEqual(ans_1, ans_2)
-        board = Board()
-        memorized_board_size = const.BOARD_SIZE
-        const.BOARD_SIZE = (3, 3)
-        for row in range(const.BOARD_SIZE[0]):
-            for column in range(const.BOARD_SIZE[1]):
+        board = Board((3, 3))
+        for row in range(3):
+            for column in range(3):
                 board.do_move((row, column))
         board.undo_move()
         ans_1 = engine.minimax(board)
-        ans_2 = (0, (const.BOARD_SIZE[0] - 1, const.BOARD_SIZE[1] - 1))
+        ans_2 = (0, (2, 2))
         self.assertEqual(ans_1, ans_2)
-        const.BOARD_SIZE = memorized_board_size
+
+    def test_alpha_beta_matches_minimax(self):
+        # Кандидатами становятся все пустые клетки, как в minimax.
+        memorized_distance = const.CANDIDATE_DISTANCE
+        const.CANDIDATE_DISTANCE = max(const.BOARD_SIZE)
+        board = Board()
+        const.CANDIDATE_DISTANCE = memorized_distance
+        for pos in ((7, 7), (7, 8), (8, 8), (6, 6)):
+            board.do_move(pos)
+        memorized_depth = const.MAX_MINIMAX_DEPTH
+        for depth in (1, 2):
+            const.MAX_MINIMAX_DEPTH = depth
+            expected = engine.minimax(board)
+            result = search.AlphaBetaSearch(
+                board, engine.fast_rate_function, max_depth=depth).run()
+            self.assertEqual(result[0], expected[0])
+            self.assertEqual(len(board.moves), 4)
+        const.MAX_MINIMAX_DEPTH = memorized_depth
+
+    def test_alpha_beta_finds_win(self):
+        board = Board()
+        for i in range(const.WIN_ROW_LENGTH - 1):
+            board.do_move((i + 3, 5))
+            board.do_move((i + 3, 9))
+        score, move = search.iterative_deepening(
+            board, engine.fast_rate_function, time_limit=5)
+        self.assertEqual(score, const.MINIMAX_INF)
+        self.assertIn(move, ((2, 5), (const.WIN_ROW_LENGTH + 2, 5)))
+
+    def test_iterative_deepening_time_limit(self):
+        board = Board()
+        board.do_move((7, 7))
+        start = time.monotonic()
+        move = search.iterative_deepening(board, engine.fast_rate_function,
+                                          time_limit=0.2)[1]
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(board[move])
+        self.assertEqual(board.moves, [(7, 7)])
+
+    def test_move_ordering(self):
+        board = Board()
+        for i in range(const.WIN_ROW_LENGTH - 1):
+            board.do_move((i + 3, 5))
+            if i + 1 < const.WIN_ROW_LENGTH - 1:
+                board.do_move((i + 3, 9))
+        searcher = search.AlphaBetaSearch(board, engine.fast_rate_function)
+        # Белые обязаны закрыть четвёрку чёрных.
+        self.assertEqual(searcher._generate_moves(0),
+                         [(2, 5), (const.WIN_ROW_LENGTH + 2, 5)])
+        board.undo_move()
+        searcher._update_heuristics((4, 7), 3, 1)
+        searcher._update_heuristics((6, 7), 2, 1)
+        moves = searcher._generate_moves(1, (5, 7))
+        self.assertEqual(moves[:3], [(5, 7), (6, 7), (4, 7)])
+        self.assertEqual(sorted(moves), sorted(board.get_candidates()))
+
+    def test_engine_state(self):
+        game = Game()
+        for pos in ((7, 7), (7, 8), (8, 8), (6, 6)):
+            game.do_move(pos)
+        state = engine.get_engine(game)
+        self.assertIs(engine.get_engine(game), state)
+        searcher = state.create_search(game.board)
+        searcher.max_depth = 3
+        searcher.run()
+        state.finish_search(searcher)
+        pv = state.pv
+        self.assertEqual(len(pv), 3)
+        self.assertEqual(state.pv_root, game.board.moves)
+        # Соперник ответил ожидаемым ходом.
+        game.do_move(pv[0])
+        game.do_move(pv[1])
+        warm = state.create_search(game.board)
+        self.assertEqual(state.predicted_hits, 1)
+        self.assertEqual(warm.best_move, pv[2])
+        warm.max_depth = 3
+        warm.run()
+        cold = search.AlphaBetaSearch(game.board, engine.fast_rate_function,
+                                      max_depth=3,
+                                      table=tt.TranspositionTable())
+        cold.run()
+        self.assertLessEqual(warm.nodes, cold.nodes)
+        state.finish_search(warm)
+        self.assertEqual(state.pv_root, game.board.moves)
+        game.undo_move()
+        self.assertEqual(state.pv, [])
+        state.create_search(game.board)
+        self.assertEqual(state.predicted_misses, 0)
+        game.restart()
+        self.assertIs(game.engine, state)
+        self.assertEqual(state.table.get_stats()["stores"], 0)
+        self.assertEqual(state.history, [dict(), dict()])
+        # Фоновая задача сохраняет результаты в состояние партии.
+        game.do_move((7, 7))
+        job = background.EngineJob(game.board, 0.2, state)
+        self.assertTrue(job.wait(5))
+        self.assertEqual(state.pv_root, game.board.moves)
+        self.assertEqual(state.pv[0], job.result()[1])
+
+    def test_search_stats(self):
+        board = Board()
+        for pos in [(7, 7), (7, 8), (8, 8), (6, 6)]:
+            board.do_move(pos)
+        calls = list()
+        search_stats = stats.SearchStats(
+            lambda st, iteration: calls.append(iteration))
+        score, move = search.iterative_deepening(
+            board, engine.fast_rate_function, max_depth=3,
+            table=tt.TranspositionTable(2 ** 16), stats=search_stats)
+        self.assertEqual([it.depth for it in search_stats.iterations],
+                         [1, 2, 3])
+        self.assertEqual(calls, search_stats.iterations)
+        last = search_stats.iterations[-1]
+        self.assertEqual((last.score, last.move), (score, move))
+        self.assertEqual(last.pv[0], move)
+        self.assertLessEqual(len(last.pv), 3)
+        self.assertGreater(search_stats.leaves, 0)
+        self.assertGreater(search_stats.cutoffs, 0)
+        self.assertGreaterEqual(search_stats.nodes, search_stats.leaves)
+        self.assertEqual(len(board.moves), 4)
+        json.dumps(search_stats.to_dict())
+        # Без stats итоги глубин и главные линии не собираются.
+        searcher = search.AlphaBetaSearch(board, engine.fast_rate_function,
+                                          max_depth=3)
+        self.assertEqual(searcher.run(), (score, move))
+        self.assertEqual(searcher.completed_depth, 3)
+        self.assertEqual(searcher.stats.iterations, [])
+        self.assertGreater(searcher.stats.nodes, 0)
+
+        minimax_stats = stats.SearchStats()
+        self.assertEqual(engine.minimax(board, stats=minimax_stats),
+                         engine.minimax(board))
+        empty = const.BOARD_SIZE[0] * const.BOARD_SIZE[1] - 4
+        self.assertEqual(minimax_stats.nodes, empty + 1)
+        self.assertEqual(minimax_stats.leaves, empty)
 
     def test_do_computers_move(self):
         game = Game()